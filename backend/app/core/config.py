@@ -1,7 +1,6 @@
-import logging
 import os
-from dotenv import load_dotenv
-from pydantic_settings import BaseSettings
+from typing import Dict
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 # Get the directory of the current file (config.py)
 # This will be something like /home/zizo/projects/python_projects/IScore_DDA_project/backend/app/core
@@ -13,34 +12,121 @@ current_file_dir = os.path.dirname(__file__)
 project_root_dir = os.path.abspath(os.path.join(current_file_dir, "..", "..", ".."))
 dotenv_path = os.path.join(project_root_dir, ".env")
 
-print(f"Attempting to load .env from: {dotenv_path}") # Debug print to verify the path
-load_dotenv(dotenv_path=dotenv_path)
+class Settings(BaseSettings):
+    # Values come from the environment, then the project's .env file, then the defaults below.
+    # Read once when Settings() is created; nothing is printed or exported to os.environ.
+    model_config = SettingsConfigDict(env_file=dotenv_path, extra="ignore")
 
-# You can add another print here to see if specific variables are loaded
-# print(f"MONGO_URI_1 after load_dotenv: {os.getenv('MONGO_URI_1')}")
+    # Where users and credit data live: "remote" (Neon, two Supabase projects, two MongoDB deployments)
+    # or "sqlite" (everything in one local file at SQLITE_PATH, ":memory:" for a throwaway database)
+    STORAGE_BACKEND: str = "remote"
+    SQLITE_PATH: str = "iscore.sqlite3"
 
-class Settings(BaseSettings):
+    NEON_DB_URI: str = "" # User DB
+    NEON_POOL_MIN_SIZE: int = 1
+    NEON_POOL_MAX_SIZE: int = 10
+    NEON_POOL_TIMEOUT_SECONDS: float = 5 # Max wait for a free connection
     
-    NEON_DB_URI: str = os.getenv("NEON_DB_URI", "") # User DB
-    
-    SUPABASE_URL_1: str = os.getenv("SUPABASE_URL_1", "")
-    SUPABASE_KEY_1: str = os.getenv("SUPABASE_KEY_1", "")
+    SUPABASE_URL_1: str = ""
+    SUPABASE_KEY_1: str = ""
+
+    SUPABASE_URL_2: str = ""
+    SUPABASE_KEY_2: str = ""
+
+    # Direct Postgres connection strings of the two Supabase projects, only for schema_bootstrap (migrations
+    # and query-plan checks); the API itself goes through PostgREST
+    PAYMENTS_DB_DSN: str = ""
+    HISTORY_DB_DSN: str = ""
+
+    MONGO_URI_1: str = ""
+    MONGO_DB_NAME_1: str = "debt_db"
+
+    MONGO_URI_2: str = ""
+    MONGO_DB_NAME_2: str = "mix_db"
+
+    MAX_POSSIBLE_AGE_YEARS: int = 10
+    TOTAL_SYSTEM_CREDIT_TYPES: int = 4 # Based on example calculation (page 3/4)
+    SCORE_MIN: int = 300
+    SCORE_MAX: int = 850
+
+    # Scoring models (app.services.score_models): "v1" is the formulas above; other versions are JSON files in SCORE_MODELS_DIR
+    SCORE_MODEL_VERSION: str = "v1" # Active model unless SCORE_MODELS_DIR/active names another
+    SCORE_MODELS_DIR: str = "score_models"
+    SCORE_MODELS_RELOAD_SECONDS: float = 5 # How often the directory is checked for changed configs
+
+    # POST /iscore/{user_id}/what-if: most scenarios (grid combinations) scored per request
+    WHAT_IF_MAX_SCENARIOS: int = 100000
+
+    # How /iscore reads its five data sources: "concurrent" (all at once) or "sequential" (one after another)
+    SCORE_FETCH_MODE: str = "concurrent"
+
+    # POST /iscore/batch: users fetched and scored per chunk (also the size of each IN/$in list), and max users per request
+    ISCORE_BATCH_CHUNK_SIZE: int = 200
+    ISCORE_BATCH_MAX_USERS: int = 100000
+    SCORE_EXPORT_PAGE_SIZE: int = 500 # Users per keyset page in the NDJSON export
+
+    # credit_profiles read model (app.services.credit_profiles): "serve" (kept current by crud writes and read
+    # first by /iscore, one keyed read per score), "maintain" (kept current, /iscore reads the source stores) or "off"
+    CREDIT_PROFILE_MODE: str = "serve"
+
+    # Every computed score is appended to fixed-width binary files, one per UTC day (app.services.score_history).
+    # Read back by /iscore/{user_id}/history and /scores/percentiles
+    SCORE_HISTORY_ENABLED: bool = True
+    SCORE_HISTORY_DIR: str = "score_history"
+    SCORE_HISTORY_MAX_RANGE_DAYS: int = 366 # Longest range one history or percentiles query may scan
+
+    # /iscore result cache: "memory" (per worker), "redis" (shared between workers) or "none"
+    SCORE_CACHE_BACKEND: str = "memory"
+    SCORE_CACHE_TTL_SECONDS: float = 300
+    SCORE_CACHE_MAX_SIZE: int = 10000 # memory backend only
+    SCORE_CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    # Concurrent /iscore cache misses for the same user share one fetch and calculation
+    SCORE_COALESCING_ENABLED: bool = True
+
+    # Background jobs (POST /jobs/...): "memory" (lost on restart) or "sqlite" (JOB_QUEUE_SQLITE_PATH, survives
+    # restarts and can be shared by the workers of one host). At most JOB_WORKERS jobs run at once per process
+    JOB_QUEUE_BACKEND: str = "memory"
+    JOB_QUEUE_SQLITE_PATH: str = "jobs.sqlite3"
+    JOB_WORKERS: int = 2
+    JOB_QUEUE_MAX_PENDING: int = 1000 # Further submissions get 429 until the queue drains
+    JOB_HEARTBEAT_SECONDS: float = 5
+    JOB_STALE_SECONDS: float = 60 # A running job with no heartbeat for this long is requeued (its worker died)
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_HISTORY_LIMIT: int = 1000 # Finished jobs kept for GET /jobs/{job_id}
 
-    SUPABASE_URL_2: str = os.getenv("SUPABASE_URL_2", "")
-    SUPABASE_KEY_2: str = os.getenv("SUPABASE_KEY_2", "")
+    # Bulk payment imports (app.services.payment_import, POST /imports/payments)
+    IMPORT_DIR: str = "imports" # Uploaded files and their rejects CSVs
+    IMPORT_MAX_UPLOAD_BYTES: int = 2 * 1024 ** 3
+    IMPORT_CHUNK_ROWS: int = 50000 # Rows read and validated at a time (approximate for CSV)
+    IMPORT_BATCH_ROWS: int = 5000 # Rows per insert
+    IMPORT_CONCURRENCY: int = 4 # Inserts in flight
 
-    MONGO_URI_1: str = os.getenv("MONGO_URI_1", "")
-    MONGO_DB_NAME_1: str = os.getenv("MONGO_DB_NAME_1", "debt_db")
+    # Per-store latency histograms (/metrics), the Server-Timing header and slow-request logs
+    METRICS_ENABLED: bool = True
+    METRICS_SERVER_TIMING: bool = True
+    SLOW_REQUEST_LOG_MS: float = 1000 # 0 logs every request
+    LOG_FORMAT: str = "json" # "json" or "text"
+    LOG_LEVEL: str = "INFO"
 
-    MONGO_URI_2: str = os.getenv("MONGO_URI_2", "")
-    MONGO_DB_NAME_2: str = os.getenv("MONGO_DB_NAME_2", "mix_db")
+    # Startup and health checks. With DATASTORE_WARMUP the lifespan connects to every store before the worker starts serving
+    DATASTORE_WARMUP: bool = False
+    DATASTORE_WARMUP_TIMEOUT_SECONDS: float = 10
+    HEALTH_CHECK_TIMEOUT_SECONDS: float = 2 # Per /health/ready call, for all stores together
 
-    MAX_POSSIBLE_AGE_YEARS: int = int(os.getenv("MAX_POSSIBLE_AGE_YEARS", 10))
-    TOTAL_SYSTEM_CREDIT_TYPES: int = int(os.getenv("TOTAL_SYSTEM_CREDIT_TYPES", 4)) # Based on example calculation (page 3/4)
-    SCORE_MIN: int = int(os.getenv("SCORE_MIN", 300))
-    SCORE_MAX: int = int(os.getenv("SCORE_MAX", 850))
+    # Per-store deadlines, circuit breakers and hedged reads (app.core.resilience). DATASTORE_TIMEOUTS overrides
+    # the deadline per store, e.g. DATASTORE_TIMEOUTS='{"debt_db": 1.5}'; it's also the clients' socket/statement timeout
+    DATASTORE_TIMEOUT_SECONDS: float = 3
+    DATASTORE_TIMEOUTS: Dict[str, float] = {}
+    CIRCUIT_BREAKER_ENABLED: bool = True
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5 # Consecutive failed calls that open a store's breaker
+    CIRCUIT_BREAKER_RESET_SECONDS: float = 30 # How long it stays open before a trial call
+    DATASTORE_HEDGE_AFTER_MS: float = 0 # Resend a read that hasn't answered after this long; 0 disables hedging
+    DATASTORE_HEDGE_WORKERS: int = 32
+    # When a factor store is unavailable, score from the user's last-known values in their credit profile
+    # and flag the response as provisional instead of failing with 503
+    DEGRADED_SCORING: bool = True
 
-    FASTAPI_HOST: str = os.getenv("FASTAPI_HOST", "0.0.0.0")
-    FASTAPI_PORT: int = int(os.getenv("FASTAPI_PORT", 8000))
+    FASTAPI_HOST: str = "0.0.0.0"
+    FASTAPI_PORT: int = 8000
 
 settings = Settings()
@@ -0,0 +1,174 @@
+"""
+Lazily created clients for the four remote stores crud talks to besides Neon
+(which has its own pool in neon_pool).
+
+Nothing is imported or connected when this module loads: each provider builds its
+client on first use, so importing the app is fast and doesn't fail when a store is
+down. The lifespan can warm them up before the worker reports ready, and
+/health/ready pings each one.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional
+
+from app.core import resilience
+from app.core.config import settings
+from app.core.neon_pool import neon_connection
+
+logger = logging.getLogger(__name__)
+
+
+class LazyClient:
+    """
+    Thread-safe, build-once holder for a datastore client.
+    `factory()` creates the client; `ping(client)` does the cheapest round trip that
+    proves the store is reachable.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], ping: Callable[[Any], Any], close: Optional[Callable[[Any], Any]] = None):
+        self.name = name
+        self._factory = factory
+        self._ping = ping
+        self._close = close
+        self._client: Any = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> Any:
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    started = time.perf_counter()
+                    self._client = self._factory()
+                    logger.info(f"Created {self.name} client", extra={"store": self.name, "duration_ms": round((time.perf_counter() - started) * 1000, 2)})
+                client = self._client
+        return client
+
+    @property
+    def initialized(self) -> bool:
+        return self._client is not None
+
+    def override(self, client: Any):
+        """Uses `client` instead of building one (benchmarks and scripts with their own clients)."""
+        with self._lock:
+            self._client = client
+
+    def ping(self):
+        self._ping(self.client)
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None and self._close:
+            try:
+                self._close(client)
+            except Exception as e:
+                logger.warning(f"Error closing {self.name} client: {e}", extra={"store": self.name})
+
+
+def _supabase_client(name: str, url: str, key: str):
+    from supabase import create_client # Heavy import, only paid when the client is first needed
+    from supabase.lib.client_options import ClientOptions
+    return create_client(url, key, options=ClientOptions(postgrest_client_timeout=resilience.timeout_for(name)))
+
+
+def _mongo_collection(name: str, uri: str, db_name: str, collection: str):
+    from pymongo import MongoClient
+    timeout_ms = int(resilience.timeout_for(name) * 1000)
+    client = MongoClient(uri, serverSelectionTimeoutMS=timeout_ms, connectTimeoutMS=timeout_ms, socketTimeoutMS=timeout_ms)
+    return client[db_name][collection]
+
+
+def _supabase_ping(table: str):
+    return lambda client: client.table(table).select("user_id").limit(1).execute()
+
+
+def _mongo_ping(collection):
+    collection.database.client.admin.command("ping")
+
+
+def _mongo_close(collection):
+    collection.database.client.close()
+
+
+payments_db = LazyClient( # Supabase 1
+    "payments_db",
+    lambda: _supabase_client("payments_db", settings.SUPABASE_URL_1, settings.SUPABASE_KEY_1),
+    _supabase_ping("payment_transactions"),
+)
+history_db = LazyClient( # Supabase 2
+    "history_db",
+    lambda: _supabase_client("history_db", settings.SUPABASE_URL_2, settings.SUPABASE_KEY_2),
+    _supabase_ping("history_data"),
+)
+debt_db = LazyClient( # MongoDB 1, the debt_records collection
+    "debt_db",
+    lambda: _mongo_collection("debt_db", settings.MONGO_URI_1, settings.MONGO_DB_NAME_1, "debt_records"),
+    _mongo_ping,
+    _mongo_close,
+)
+mix_db = LazyClient( # MongoDB 2, the mix_records collection
+    "mix_db",
+    lambda: _mongo_collection("mix_db", settings.MONGO_URI_2, settings.MONGO_DB_NAME_2, "mix_records"),
+    _mongo_ping,
+    _mongo_close,
+)
+
+PROVIDERS = (payments_db, history_db, debt_db, mix_db)
+
+
+def _ping_neon():
+    with neon_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+            cur.fetchone()
+
+
+def _check(ping: Callable[[], Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        ping()
+        return {"status": "ok", "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+    except Exception as e:
+        return {"status": "error", "latency_ms": round((time.perf_counter() - started) * 1000, 2), "error": f"{type(e).__name__}: {e}"}
+
+
+def check_all(timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Pings Neon and every provider at once (creating clients that don't exist yet).
+    A store that doesn't answer within `timeout` seconds is reported as timed out; never raises.
+    """
+    timeout = settings.HEALTH_CHECK_TIMEOUT_SECONDS if timeout is None else timeout
+    pings = {"neon": _ping_neon, **{provider.name: provider.ping for provider in PROVIDERS}}
+    executor = ThreadPoolExecutor(max_workers=len(pings))
+    try:
+        futures = {name: executor.submit(_check, ping) for name, ping in pings.items()}
+        deadline = time.monotonic() + timeout
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                results[name] = {"status": "timeout", "error": f"No answer within {timeout}s"}
+        return results
+    finally:
+        executor.shutdown(wait=False) # Don't hold the caller up for a ping that's still hanging
+
+
+def warm_up() -> Dict[str, Dict[str, Any]]:
+    """Builds every client and does one round trip to each store, so the first requests don't pay for it."""
+    started = time.perf_counter()
+    results = check_all(settings.DATASTORE_WARMUP_TIMEOUT_SECONDS)
+    for name, result in results.items():
+        if result["status"] != "ok":
+            logger.warning(f"Warm-up of {name} failed: {result.get('error')}", extra={"store": name})
+    logger.info("Datastore warm-up finished", extra={"duration_ms": round((time.perf_counter() - started) * 1000, 2), "stores": {n: r["status"] for n, r in results.items()}})
+    return results
+
+
+def close_all():
+    for provider in PROVIDERS:
+        provider.close()
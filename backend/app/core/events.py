@@ -0,0 +1,23 @@
+import logging
+import uuid
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+# Callbacks run after any crud write that changes a user's scoring inputs
+# (payments, debt, history, mix). Used to keep caches and derived data fresh.
+_user_data_listeners: List[Callable[[uuid.UUID], None]] = []
+
+
+def on_user_data_changed(listener: Callable[[uuid.UUID], None]) -> Callable[[uuid.UUID], None]:
+    """Registers a listener; usable as a decorator."""
+    _user_data_listeners.append(listener)
+    return listener
+
+
+def notify_user_data_changed(user_id: uuid.UUID):
+    for listener in list(_user_data_listeners):
+        try:
+            listener(user_id)
+        except Exception as e: # A failing listener must not fail the write that triggered it
+            logger.error(f"Error in user data listener {getattr(listener, '__name__', listener)} for user {user_id}: {e}")
@@ -0,0 +1,40 @@
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+
+from app.core.config import settings
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is logged as a field
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message plus any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """Sends the app's loggers to stderr as JSON (LOG_FORMAT=json) or plain text."""
+    handler = logging.StreamHandler(sys.stderr)
+    if settings.LOG_FORMAT.lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    app_logger = logging.getLogger("app")
+    app_logger.handlers = [handler]
+    app_logger.setLevel(settings.LOG_LEVEL.upper())
+    app_logger.propagate = False # uvicorn configures the root logger with its own format
@@ -0,0 +1,310 @@
+"""
+Latency and error metrics for datastore calls and HTTP requests.
+
+Every crud call is wrapped in `instrument(store, operation)` (or the `timed` context
+manager). Each timing goes into a histogram keyed by store and operation, which
+`/metrics` exposes in Prometheus text format. The same timing is also added to the
+current request's stages, which `RequestMetricsMiddleware` sends back in a
+`Server-Timing` header and writes to the slow-request log.
+
+An observation costs two perf_counter() calls, a bisect and a locked increment. Set
+METRICS_ENABLED=false to turn all of it off.
+"""
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from a fast primary-key lookup to a stalled remote call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Thread-safe Prometheus-style histogram with one series per label tuple."""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], list] = {} # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, labels: Tuple[str, ...], seconds: float):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def snapshot(self) -> Dict[Tuple[str, ...], dict]:
+        """Per-series count, sum and cumulative bucket counts."""
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        result = {}
+        for labels, values in series.items():
+            cumulative, running = [], 0
+            for count in values[:-1]:
+                running += count
+                cumulative.append(running)
+            result[labels] = {"count": running, "sum": values[-1], "buckets": cumulative}
+        return result
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, data in sorted(self.snapshot().items()):
+            base = _format_labels(zip(self.label_names, labels))
+            for bound, count in zip(self.buckets + (float("inf"),), data["buckets"]):
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(list(zip(self.label_names, labels)) + [('le', le)])} {count}")
+            lines.append(f"{self.name}_sum{base} {data['sum']!r}")
+            lines.append(f"{self.name}_count{base} {data['count']}")
+        return lines
+
+
+class Counter:
+    """Thread-safe Prometheus-style counter with one series per label tuple."""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], int] = {}
+
+    def inc(self, labels: Tuple[str, ...], amount: int = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> Dict[Tuple[str, ...], int]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{_format_labels(zip(self.label_names, labels))} {value}")
+        return lines
+
+
+class Gauge:
+    """Thread-safe Prometheus-style gauge with one series per label tuple."""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, labels: Tuple[str, ...], value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{_format_labels(zip(self.label_names, labels))} {value}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    inner = ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs)
+    return "{" + inner + "}" if inner else ""
+
+
+operation_duration = Histogram(
+    "iscore_datastore_operation_duration_seconds",
+    "Time spent in a datastore or scoring operation.",
+    ("store", "operation"),
+)
+operation_errors = Counter(
+    "iscore_datastore_errors_total",
+    "Datastore operations that failed, per store and operation.",
+    ("store", "operation"),
+)
+request_duration = Histogram(
+    "iscore_http_request_duration_seconds",
+    "HTTP request latency up to the last byte of the response.",
+    ("method", "route", "status"),
+)
+circuit_state = Gauge(
+    "iscore_circuit_breaker_state",
+    "Datastore circuit breaker state: 0 closed, 1 half-open, 2 open.",
+    ("store",),
+)
+circuit_transitions = Counter(
+    "iscore_circuit_breaker_transitions_total",
+    "Circuit breaker state changes, per store and the state entered.",
+    ("store", "state"),
+)
+circuit_rejections = Counter(
+    "iscore_circuit_breaker_rejections_total",
+    "Datastore calls refused without being attempted because the store's breaker was open.",
+    ("store",),
+)
+hedged_reads = Counter(
+    "iscore_datastore_hedged_reads_total",
+    "Reads that were sent a second time after DATASTORE_HEDGE_AFTER_MS without an answer.",
+    ("store",),
+)
+
+# (stage name, seconds) for every operation timed during the current request; None outside requests.
+# The list is shared by reference, so threadpool workers and gathered tasks append to the same one.
+_request_stages: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_stages", default=None)
+
+
+def _record(store: str, operation: str, seconds: float):
+    operation_duration.observe((store, operation), seconds)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((f"{store}.{operation}", seconds))
+
+
+def record_error(store: str, operation: str):
+    if settings.METRICS_ENABLED:
+        operation_errors.inc((store, operation))
+
+
+@contextmanager
+def timed(store: str, operation: str):
+    if not settings.METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(store, operation, time.perf_counter() - started)
+
+
+def instrument(store: str, operation: str):
+    """
+    Decorator that times every call and counts calls that raise. Functions that catch
+    their own errors should call record_error() themselves.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not settings.METRICS_ENABLED:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                operation_errors.inc((store, operation))
+                raise
+            finally:
+                _record(store, operation, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def stage_totals(stages: List[Tuple[str, float]]) -> Dict[str, Tuple[int, float]]:
+    """Collapses repeated stages (e.g. paged reads) into name -> (calls, total seconds)."""
+    totals: Dict[str, Tuple[int, float]] = {}
+    for name, seconds in list(stages):
+        calls, total = totals.get(name, (0, 0.0))
+        totals[name] = (calls + 1, total + seconds)
+    return totals
+
+
+def server_timing_header(stages: List[Tuple[str, float]], total_seconds: float) -> str:
+    # Stages from concurrent reads overlap, so they can add up to more than `total`
+    parts = [
+        f'{name};dur={seconds * 1000:.2f}' + (f';desc="{calls} calls"' if calls > 1 else "")
+        for name, (calls, seconds) in stage_totals(stages).items()
+    ]
+    parts.append(f"total;dur={total_seconds * 1000:.2f}")
+    return ", ".join(parts)
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware: times each request, adds the Server-Timing header and logs requests
+    slower than SLOW_REQUEST_LOG_MS with their per-stage breakdown. For streaming
+    responses the header only covers work done before the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stages: List[Tuple[str, float]] = []
+        token = _request_stages.set(stages)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if settings.METRICS_SERVER_TIMING:
+                    header = server_timing_header(stages, time.perf_counter() - started)
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stages.reset(token)
+            # The router stores the matched route in the scope; use its template so ids don't explode the label set
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_duration.observe((scope["method"], route, str(status)), elapsed)
+            if elapsed * 1000 >= settings.SLOW_REQUEST_LOG_MS:
+                logger.warning("Slow request", extra={
+                    "method": scope["method"],
+                    "route": route,
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 2),
+                    "stages": {name: {"calls": calls, "ms": round(seconds * 1000, 2)} for name, (calls, seconds) in stage_totals(stages).items()},
+                })
+
+
+def render_prometheus(gauges: Optional[Dict[str, Dict[str, float]]] = None, counters: Optional[Dict[str, Iterable[str]]] = None) -> str:
+    """
+    Prometheus text exposition of all metrics. `gauges` adds the values of stats dicts,
+    e.g. {"iscore_neon_pool": neon_pool.stats()} becomes iscore_neon_pool_in_use etc.
+    `counters` names, per prefix, the keys that only ever go up (e.g. cache hits); they're
+    exported as counters with a _total suffix, so rate() works on them, the rest as gauges.
+    """
+    lines = operation_duration.render() + operation_errors.render() + request_duration.render()
+    for metric in (circuit_state, circuit_transitions, circuit_rejections, hedged_reads):
+        lines += metric.render()
+    for prefix, values in (gauges or {}).items():
+        for key, value in values.items():
+            if isinstance(value, bool):
+                value = int(value)
+            elif not isinstance(value, (int, float)):
+                continue
+            if key in (counters or {}).get(prefix, ()):
+                name = f"{prefix}_{key}" if key.endswith("_total") else f"{prefix}_{key}_total"
+                lines.append(f"# TYPE {name} counter")
+            else:
+                name = f"{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,198 @@
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from typing import Any, Callable, Dict, Optional
+
+import psycopg2
+
+from app.core import resilience
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+def _connect(dsn: str):
+    # Connect and statement timeouts from the Neon deadline (DATASTORE_TIMEOUTS / DATASTORE_TIMEOUT_SECONDS)
+    timeout = resilience.timeout_for("neon")
+    conn = psycopg2.connect(dsn, connect_timeout=max(1, math.ceil(timeout)))
+    with conn.cursor() as cur:
+        cur.execute("SET statement_timeout = %s;", (int(timeout * 1000),))
+    conn.commit()
+    return conn
+
+
+class NeonConnectionPool:
+    """
+    Thread-safe psycopg2 connection pool for the Neon user DB.
+    Callers block (up to `timeout` seconds) when all connections are checked out,
+    and the time spent waiting is recorded in `stats()`.
+    """
+
+    STATS_COUNTERS = ("checkouts", "connections_created", "connections_discarded", "timeouts", "wait_seconds_total") # Only ever go up
+
+    def __init__(self, dsn: str, min_size: int, max_size: int, timeout: float,
+                 connection_factory: Optional[Callable[[], Any]] = None):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._connect = connection_factory or (lambda: _connect(self.dsn))
+        self._idle: LifoQueue = LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size) # One slot per connection that may exist
+        self._lock = threading.Lock()
+        self._open = False
+
+        self._checkouts = 0
+        self._in_use = 0
+        self._created = 0
+        self._discarded = 0
+        self._timeouts = 0
+        self._wait_seconds_total = 0.0
+        self._wait_seconds_max = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    def open(self):
+        with self._lock:
+            if self._open:
+                return
+            self._open = True
+        # Pre-establish min_size connections so the first requests don't pay for the handshake.
+        # If Neon is unreachable right now, keep going; connections are created on demand later.
+        try:
+            for _ in range(self.min_size):
+                self._idle.put(self._new_connection())
+        except Exception as e:
+            logger.warning(f"Could not pre-open Neon pool connections: {e}", extra={"store": "neon"})
+
+    def close(self):
+        with self._lock:
+            self._open = False
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            self._close_quietly(conn)
+
+    def _new_connection(self):
+        conn = self._connect()
+        with self._lock:
+            self._created += 1
+        return conn
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeoutError(f"Timed out after {self.timeout}s waiting for a Neon connection.")
+        waited = time.perf_counter() - started
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    conn = self._idle.get_nowait()
+                except Empty:
+                    conn = self._new_connection()
+                    break
+                if conn.closed: # Dropped by the server while idle
+                    with self._lock:
+                        self._discarded += 1
+                    conn = None
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._wait_seconds_total += waited
+            self._wait_seconds_max = max(self._wait_seconds_max, waited)
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        try:
+            if not discard and not conn.closed:
+                try:
+                    conn.rollback() # No-op when idle; clears any transaction left open by a read
+                except Exception:
+                    discard = True
+            if discard or conn.closed or not self._open:
+                self._close_quietly(conn)
+                with self._lock:
+                    self._discarded += 1
+            else:
+                self._idle.put(conn)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except psycopg2.InterfaceError:
+            discard = True # Connection is unusable, don't hand it out again
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open": self._open,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "idle": self._idle.qsize(),
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "connections_created": self._created,
+                "connections_discarded": self._discarded,
+                "timeouts": self._timeouts,
+                "wait_seconds_total": round(self._wait_seconds_total, 6),
+                "wait_seconds_max": round(self._wait_seconds_max, 6),
+                "wait_seconds_avg": round(self._wait_seconds_total / self._checkouts, 6) if self._checkouts else 0.0,
+            }
+
+
+neon_pool = NeonConnectionPool(
+    settings.NEON_DB_URI,
+    min_size=settings.NEON_POOL_MIN_SIZE,
+    max_size=settings.NEON_POOL_MAX_SIZE,
+    timeout=settings.NEON_POOL_TIMEOUT_SECONDS,
+)
+
+
+@contextmanager
+def neon_connection():
+    """
+    Borrows a connection from the pool while the app is running. Outside the app
+    (scripts, one-off imports) the pool isn't open, so fall back to a direct connection.
+    """
+    if neon_pool.is_open:
+        with neon_pool.connection() as conn:
+            yield conn
+        return
+    conn = _connect(settings.NEON_DB_URI)
+    try:
+        yield conn
+    finally:
+        conn.close()
@@ -0,0 +1,243 @@
+"""
+Per-store deadlines, circuit breakers and hedged reads for datastore calls.
+
+Every storage backend method is wrapped in `guard(store, read=...)`:
+
+  - A call fails when it raises, when the backend handles an error itself (reported
+    through app.storage.base.store_error), or when it outlives the store's deadline.
+    Only errors that say something about the store count (see is_store_failure): a
+    ValueError from the caller's input, such as a ValidationError for an id no store
+    can hold, is passed on as it is and leaves the breaker alone.
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD failures in a row open the store's breaker, and
+    while it's open calls fail at once with StoreUnavailable instead of waiting on a
+    backend that is known to be unhealthy. After CIRCUIT_BREAKER_RESET_SECONDS a single
+    trial call is let through (half-open); its outcome closes or re-opens the breaker.
+  - A failed read raises StoreUnavailable, which the API turns into a 503, rather than
+    returning None, which callers can't tell apart from "not found". A failed write
+    still returns None, as it always has.
+  - With DATASTORE_HEDGE_AFTER_MS set, a read that hasn't answered by then is sent once
+    more and the first good answer wins; a hedged read also gives up at its deadline.
+
+The deadlines (DATASTORE_TIMEOUT_SECONDS, per store DATASTORE_TIMEOUTS) are also given to
+the clients as connect/socket/statement timeouts, so a hung call is cut off at the source.
+"""
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import ContextVar, copy_context
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class StoreUnavailable(Exception):
+    """A datastore call failed, timed out or was refused by an open circuit breaker."""
+
+    def __init__(self, store: str, reason: str, retry_after: float = 1.0):
+        super().__init__(f"{store} is unavailable: {reason}")
+        self.store = store
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def timeout_for(store: str) -> float:
+    return settings.DATASTORE_TIMEOUTS.get(store, settings.DATASTORE_TIMEOUT_SECONDS)
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2} # For the state gauge
+
+    def __init__(self, store: str, failure_threshold: int, reset_seconds: float):
+        self.store = store
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.rejections = 0
+        metrics.circuit_state.set((store,), 0)
+
+    def _transition(self, state: str):
+        # Called with the lock held
+        logger.warning(f"Circuit breaker for {self.store}: {self.state} -> {state}", extra={"store": self.store, "state": state})
+        self.state = state
+        metrics.circuit_state.set((self.store,), self._STATE_VALUES[state])
+        metrics.circuit_transitions.inc((self.store, state))
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True # This call is the trial
+                return True
+            self.rejections += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                if self.state != self.OPEN:
+                    self._transition(self.OPEN)
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self.state != self.OPEN:
+                return 1.0
+            return max(1.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._consecutive_failures,
+                "rejections": self.rejections,
+                "timeout_seconds": timeout_for(self.store),
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(store: str) -> CircuitBreaker:
+    breaker = _breakers.get(store)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(store)
+            if breaker is None:
+                breaker = _breakers[store] = CircuitBreaker(store, settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD, settings.CIRCUIT_BREAKER_RESET_SECONDS)
+    return breaker
+
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {store: breaker.stats() for store, breaker in sorted(breakers.items())}
+
+
+# Failures the guarded call handled itself (store_error); None outside a guarded call
+_handled_failures: ContextVar[Optional[List[str]]] = ContextVar("handled_store_failures", default=None)
+
+
+def note_failure(operation: str):
+    failures = _handled_failures.get()
+    if failures is not None:
+        failures.append(operation)
+
+
+def _call(func: Callable, args, kwargs) -> Tuple[Any, bool]:
+    """(result, whether the backend reported a handled failure)."""
+    failures: List[str] = []
+    token = _handled_failures.set(failures)
+    try:
+        return func(*args, **kwargs), bool(failures)
+    finally:
+        _handled_failures.reset(token)
+
+
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _submit(func: Callable, args, kwargs):
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _hedge_pool_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=settings.DATASTORE_HEDGE_WORKERS, thread_name_prefix="hedged-read")
+    # In a copy of the caller's context so the timings still land in the request's Server-Timing
+    return _hedge_pool.submit(copy_context().run, _call, func, args, kwargs)
+
+
+def _hedged_call(store: str, func: Callable, args, kwargs, deadline: float) -> Tuple[Any, bool]:
+    started = time.monotonic()
+    attempts = [_submit(func, args, kwargs)]
+    done, _ = wait(attempts, timeout=min(settings.DATASTORE_HEDGE_AFTER_MS / 1000, deadline))
+    if not done:
+        metrics.hedged_reads.inc((store,))
+        attempts.append(_submit(func, args, kwargs))
+    pending, last = set(attempts), None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - (time.monotonic() - started)), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for attempt in done:
+            last = attempt
+            if attempt.exception() is None and not attempt.result()[1]:
+                return attempt.result()
+    if last is None: # The attempts keep running in the pool; their outcome is dropped
+        raise StoreUnavailable(store, f"no answer within {deadline}s")
+    return last.result()
+
+
+def is_store_failure(error: Optional[BaseException]) -> bool:
+    """
+    Whether `error` counts against the store: driver, I/O and timeout errors do. A 4xx
+    HTTPException (e.g. duplicate username) is the store answering normally, and a
+    ValueError (pydantic's ValidationError included) comes from the input, not the store.
+    """
+    if error is None or isinstance(error, ValueError):
+        return False
+    status = getattr(error, "status_code", None)
+    return not (isinstance(status, int) and status < 500)
+
+
+def guard(store: str, read: bool = False):
+    """Decorator for a backend method talking to `store`; see the module docstring."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not settings.CIRCUIT_BREAKER_ENABLED:
+                result, failed = _call(func, args, kwargs)
+                if failed and read:
+                    raise StoreUnavailable(store, f"{func.__name__} failed")
+                return result
+
+            breaker = breaker_for(store)
+            if not breaker.allow():
+                metrics.circuit_rejections.inc((store,))
+                raise StoreUnavailable(store, "circuit breaker open", breaker.retry_after())
+            deadline = timeout_for(store)
+            started = time.monotonic()
+            try:
+                if read and settings.DATASTORE_HEDGE_AFTER_MS > 0:
+                    result, failed = _hedged_call(store, func, args, kwargs, deadline)
+                else:
+                    result, failed = _call(func, args, kwargs)
+            except Exception as e:
+                if is_store_failure(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                raise
+            # A call that answered after its deadline still counts against the store
+            if failed or time.monotonic() - started > deadline:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if failed and read:
+                raise StoreUnavailable(store, f"{func.__name__} failed", breaker.retry_after())
+            return result
+        return wrapper
+    return decorator
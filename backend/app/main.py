@@ -1,12 +1,59 @@
-from fastapi import FastAPI, HTTPException
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+import orjson
 import uuid
-from app.services import score_calculator
+from datetime import date, datetime, timedelta, timezone
+from app.services import iscore_service, payment_import, score_models, what_if
+from app.services.synthetic_population import scoring_inputs
 from app.core.config import settings
 from fastapi import FastAPI, HTTPException
 from app import crud, schemas
+from app.core import metrics
+from app.core.logs import configure_logging
+from app.core.neon_pool import neon_pool
+from app.core.resilience import StoreUnavailable, breaker_stats
+from app.services.score_cache import score_cache
+from app.services.jobs import QueueFull, jobs
+from app.services.user_summary import user_summary
+from app.services.score_flights import score_flights
+from app.services.score_history import score_history
+from app.storage import get_storage
+
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging() # JSON or text per LOG_FORMAT
+    storage = get_storage() # Per STORAGE_BACKEND
+    storage.open()
+    if settings.DATASTORE_WARMUP:
+        # Connect to every store before uvicorn starts accepting requests; failures are logged, not fatal
+        await run_in_threadpool(storage.warm_up)
+    jobs.start() # JOB_WORKERS threads; with the sqlite queue, jobs left queued by the last run start again
+    yield
+    jobs.stop()
+    storage.close()
+    if score_history is not None:
+        score_history.close()
 
 
-app = FastAPI(title="Credit Score API")
+app = FastAPI(title="Credit Score API", lifespan=lifespan)
+app.add_middleware(metrics.RequestMetricsMiddleware) # Server-Timing header, request latency histogram, slow-request log
+
+@app.exception_handler(StoreUnavailable)
+async def store_unavailable_handler(request, exc: StoreUnavailable):
+    # A store that failed, timed out or has its circuit breaker open; retry once the breaker may have closed
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Data store unavailable: {exc.store}", "store": exc.store},
+        headers={"Retry-After": str(int(exc.retry_after + 0.999))},
+    )
 
 @app.post("/users/", response_model=schemas.UserResponse, status_code=201)
 def create_new_user(user: schemas.UserCreate):
@@ -16,10 +63,19 @@ def create_new_user(user: schemas.UserCreate):
         if not db_user: # Should ideally not happen if crud.create_user raises on failure
             raise HTTPException(status_code=500, detail="Failed to create user.")
         return db_user
+    except StoreUnavailable:
+        raise # 503, from the handler above
+    except HTTPException:
+        raise # e.g. 400 for a duplicate username or email
     except Exception as e: # Catch any other unexpected errors
-        print(f"Unexpected error in create_new_user endpoint: {e}")
+        logger.error(f"Unexpected error in create_new_user endpoint: {e}")
         raise HTTPException(status_code=500, detail="An internal server error occurred.")
 
+@app.get("/users/{user_id}/exists", response_model=schemas.UserSummary)
+def check_user_exists(user_id: uuid.UUID):
+    # One keyed read (two for an id with no credit profile), unlike /iscore's five
+    return user_summary(user_id)
+
 @app.post("/users/{user_id}/generate-data/", status_code=201)
 def generate_data_for_user(user_id: uuid.UUID):
     user = crud.get_user(user_id) # This checks Neon DB
@@ -34,47 +90,193 @@ def generate_data_for_user(user_id: uuid.UUID):
         "generation_summary": generation_summary # Contains counts and derived history
     }
 
+def _submit_job(kind: str, params: dict) -> schemas.JobStatus:
+    try:
+        return jobs.submit(kind, params)
+    except QueueFull:
+        raise HTTPException(status_code=429, detail=f"Job queue is full ({settings.JOB_QUEUE_MAX_PENDING} pending); try again later.")
+
+@app.post("/jobs/generate-data", response_model=schemas.JobStatus, status_code=202)
+def submit_generate_data_job(request: schemas.GenerateDataJobRequest):
+    # Same work as POST /users/{user_id}/generate-data/, in the background; poll GET /jobs/{job_id}
+    return _submit_job("generate_data", {"user_id": request.user_id})
+
+@app.post("/jobs/rescore", response_model=schemas.JobStatus, status_code=202)
+def submit_rescore_job(request: schemas.RescoreJobRequest):
+    # Recomputes the stored scores (credit profiles) of the listed users, or of every user
+    return _submit_job("rescore", {"user_ids": request.user_ids})
+
+@app.post("/imports/payments", response_model=schemas.JobStatus, status_code=202)
+async def upload_payment_import(request: Request, format: str = Query(default="csv", pattern="^(csv|parquet)$"), check_users: bool = True):
+    # The request body is the file itself (not multipart); it's streamed to disk and imported by a background job
+    try:
+        path = await payment_import.save_upload(request.stream(), format)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return await run_in_threadpool(_submit_job, "import_payments", {"path": path, "format": format, "check_users": check_users})
+
+@app.get("/imports/payments/{job_id}/rejects")
+def get_payment_import_rejects(job_id: str):
+    # CSV of the rows the import rejected: the row as uploaded, its row_number and the error
+    job = jobs.queue.get(job_id)
+    if job is None or job.kind != "import_payments":
+        raise HTTPException(status_code=404, detail="Import job not found.")
+    rejects_path = (job.result or {}).get("rejects_path")
+    if not rejects_path:
+        raise HTTPException(status_code=404, detail="No rejected rows (or the import hasn't finished).")
+    return FileResponse(rejects_path, media_type="text/csv", filename=f"{job_id}.rejects.csv")
+
+@app.get("/jobs/{job_id}", response_model=schemas.JobStatus)
+def get_job(job_id: str):
+    job = jobs.queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@app.get("/jobs", response_model=list[schemas.JobStatus])
+def list_jobs(status: Optional[str] = None, limit: int = Query(default=50, ge=1, le=1000)):
+    # Most recent first
+    return jobs.queue.list(status, limit)
+
+@app.post("/iscore/batch")
+async def get_batch_iscores(request: schemas.BatchScoreRequest):
+    # Streams NDJSON: one schemas.BatchScoreResult per line, with `error` set for users that can't be scored
+    if len(request.user_ids) > settings.ISCORE_BATCH_MAX_USERS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.ISCORE_BATCH_MAX_USERS} user IDs per batch request.")
+    return StreamingResponse(iscore_service.stream_batch_scores(request.user_ids), media_type="application/x-ndjson")
+
+@app.get("/export/iscores")
+async def export_iscores(after: Optional[uuid.UUID] = None, page_size: Optional[int] = Query(default=None, ge=1, le=5000)):
+    # NDJSON scores for every user in user_id order; pass the last user_id received as `after` to resume
+    return StreamingResponse(iscore_service.stream_score_export(after, page_size), media_type="application/x-ndjson")
+
 @app.get("/iscore/{user_id}", response_model=schemas.ScoreCalculationResponse)
-def get_user_iscore(user_id: uuid.UUID):
-    user_info = crud.get_user(user_id) # From Neon
-    if not user_info:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    # Fetch derived payment history instead of a single payment_info record
-    derived_payment_history = crud.get_derived_payment_history(user_id) # From Supabase 1 (transactions table)
-    debt_info = crud.get_debt_data(user_id)                             # From MongoDB 1
-    history_info = crud.get_history_data(user_id)                       # From Supabase 2
-    mix_info = crud.get_mix_data(user_id)                               # From MongoDB 2
-
-    # Check if all necessary data components are present for scoring
-    # Derived payment history might be "empty" (0/0) for new users, which is valid for scoring.
-    # So, we check if the objects themselves are None where critical.
-    if not all([debt_info, history_info, mix_info, derived_payment_history is not None]):
-        missing = []
-        if derived_payment_history is None: missing.append("payment history processing")
-        if not debt_info: missing.append("debt")
-        if not history_info: missing.append("history")
-        if not mix_info: missing.append("mix")
-        raise HTTPException(status_code=404, detail=f"User found, but missing critical data components: {', '.join(missing)}. Please ensure data generation is complete.")
-
-    all_user_data = schemas.AllUserDataResponse(
-        user_info=user_info,
-        derived_payment_history=derived_payment_history, # Pass the derived history
-        debt_info=debt_info,
-        history_info=history_info,
-        mix_info=mix_info
-    )
-    
-    score_results = score_calculator.calculate_final_iscore(all_user_data)
-    
-    return schemas.ScoreCalculationResponse(
-        user_id=user_id,
-        components=score_results["components"],
-        final_unscaled_score=score_results["final_unscaled_score"],
-        iscore=score_results["iscore"],
-        raw_data_fetched=all_user_data # This now contains derived_payment_history
+async def get_user_iscore(
+    user_id: uuid.UUID,
+    view: str = Query(default="full", pattern="^(full|compact)$"),
+    fields: Optional[str] = Query(default=None, description="Compact view only: comma-separated subset of user_id, iscore, final_unscaled_score, components, model_version, data_as_of, staleness_seconds"),
+):
+    # Served from the user's credit profile (CREDIT_PROFILE_MODE=serve), otherwise read from Neon, Supabase 1/2
+    # and MongoDB 1/2, concurrently or sequentially per SCORE_FETCH_MODE. data_as_of/staleness_seconds say how old the inputs are.
+    compact_fields = iscore_service.parse_compact_fields(fields) if view == "compact" else None
+    score = iscore_service.with_staleness(await iscore_service.score_user(user_id))
+    if compact_fields:
+        # Skips raw_data_fetched and response_model re-validation; serialized straight with orjson
+        payload = iscore_service.compact_payload(score, compact_fields)
+        return Response(content=orjson.dumps(payload), media_type="application/json")
+    return score
+
+@app.post("/iscore/{user_id}/what-if", response_model=schemas.WhatIfResponse)
+async def simulate_user_iscore(user_id: uuid.UUID, request: schemas.WhatIfRequest = schemas.WhatIfRequest()):
+    # The user's iScore over every combination of the grid's hypothetical changes, plus the cheapest improvements
+    user_data = await iscore_service.current_user_data(user_id)
+    try:
+        return what_if.simulate(user_data, request)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def require_score_history():
+    if score_history is None:
+        raise HTTPException(status_code=404, detail="Score history is disabled (SCORE_HISTORY_ENABLED).")
+    return score_history
+
+@app.get("/iscore/{user_id}/history", response_model=schemas.ScoreHistoryResponse)
+def get_user_iscore_history(user_id: uuid.UUID, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    # Every score computed for the user with start <= timestamp < end (default: the last 30 days), from the on-disk history
+    history = require_score_history()
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=30)
+    start, end = (t if t.tzinfo else t.replace(tzinfo=timezone.utc) for t in (start, end)) # Naive times are UTC
+    if start >= end:
+        raise HTTPException(status_code=422, detail="start must be before end.")
+    if end - start > timedelta(days=settings.SCORE_HISTORY_MAX_RANGE_DAYS):
+        raise HTTPException(status_code=422, detail=f"At most {settings.SCORE_HISTORY_MAX_RANGE_DAYS} days per query.")
+    return {"user_id": user_id, "start": start, "end": end, "points": history.user_history(user_id, start, end)}
+
+@app.get("/scores/percentiles", response_model=schemas.ScorePercentilesResponse)
+def get_score_percentiles(
+    as_of: Optional[date] = Query(default=None, alias="date", description="UTC day; defaults to today"),
+    percentiles: str = Query(default="10,25,50,75,90"),
+    window_days: int = Query(default=30, ge=1),
+):
+    # Population percentiles of each user's latest recorded score on or before `date`, looking back window_days
+    history = require_score_history()
+    if window_days > settings.SCORE_HISTORY_MAX_RANGE_DAYS:
+        raise HTTPException(status_code=422, detail=f"window_days can be at most {settings.SCORE_HISTORY_MAX_RANGE_DAYS}.")
+    try:
+        qs = [float(q) for q in percentiles.split(",") if q.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="percentiles must be comma-separated numbers between 0 and 100.")
+    if not qs or any(not 0 <= q <= 100 for q in qs):
+        raise HTTPException(status_code=422, detail="percentiles must be comma-separated numbers between 0 and 100.")
+    return history.percentiles(as_of or datetime.now(timezone.utc).date(), qs, window_days)
+
+@app.get("/models", response_model=schemas.ScoringModelsResponse)
+def get_scoring_models():
+    # Loaded scoring model versions, the active one, and config files that failed to load
+    return score_models.registry.describe()
+
+@app.get("/models/compare", response_model=schemas.ScoringModelComparison)
+def compare_scoring_models(
+    baseline: str, candidate: str,
+    users: int = Query(default=100000, ge=1, le=5000000), seed: int = 7,
+):
+    # Both versions over the same seeded synthetic population (the distributions data generation uses)
+    models = {version: score_models.registry.get(version) for version in (baseline, candidate)}
+    unknown = [version for version, model in models.items() if model is None]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown scoring model version(s): {', '.join(unknown)}")
+    return score_models.compare(models[baseline], models[candidate], scoring_inputs(seed, users), seed)
+
+@app.get("/stats/neon-pool")
+def get_neon_pool_stats():
+    # Checkouts, in-use/idle counts and time spent waiting for a free connection
+    return neon_pool.stats()
+
+@app.get("/stats/score-cache")
+def get_score_cache_stats():
+    # Hits, misses, evictions, expirations and invalidations of the /iscore result cache
+    return score_cache.stats()
+
+@app.get("/stats/score-flights")
+def get_score_flight_stats():
+    # /iscore computations started (leaders), requests that joined one already in flight (followers) and the coalesced ratio
+    return score_flights.stats()
+
+@app.get("/stats/jobs")
+def get_job_stats():
+    # Jobs per status, submissions deduplicated or rejected (queue full) and jobs requeued after their worker died
+    return jobs.stats()
+
+@app.get("/stats/circuit-breakers")
+def get_circuit_breaker_stats():
+    # State (closed/half_open/open), consecutive failures, rejected calls and deadline per store
+    return breaker_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    # Prometheus text format: per store/operation latency histograms and error counts, request latency, and the pool, cache, flight and job stats
+    sources = {"iscore_neon_pool": neon_pool, "iscore_score_cache": score_cache, "iscore_score_flights": score_flights, "iscore_jobs": jobs}
+    return PlainTextResponse(
+        metrics.render_prometheus(
+            {prefix: source.stats() for prefix, source in sources.items()},
+            counters={prefix: source.STATS_COUNTERS for prefix, source in sources.items()},
+        ),
+        media_type="text/plain; version=0.0.4",
     )
 
+@app.get("/health/live")
+def get_liveness():
+    # The process is up and serving; says nothing about the datastores
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def get_readiness():
+    # Pings every store of the storage backend (all five at once for "remote"); 503 until each one answers
+    stores = await run_in_threadpool(get_storage().check_health)
+    ready = all(result["status"] == "ok" for result in stores.values())
+    return JSONResponse(status_code=200 if ready else 503, content={"status": "ready" if ready else "unavailable", "stores": stores})
+
 @app.get("/")
 def read_root():
     return {"message": "Credit Score API is running!"}
@@ -1,6 +1,7 @@
 from datetime import date, datetime
 from pydantic import BaseModel, EmailStr, UUID4
 from typing import Optional, Any
+from uuid import UUID
 
 class UserCreate(BaseModel):
     username: str
@@ -15,6 +16,14 @@ class UserResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class UserSummary(BaseModel):
+    user_id: UUID # Any UUID can be asked about, not only v4
+    exists: bool
+    username: Optional[str] = None
+    has_credit_data: Optional[bool] = None # None when credit profiles are off
+    data_version: Optional[int] = None # Credit profile version; changes whenever the user's data does
+    model_version: Optional[str] = None # Active scoring model; with data_version, identifies the user's current score
+
 
 class PaymentTransactionCreate(BaseModel):
     user_id: UUID4
@@ -73,5 +82,173 @@ class ScoreCalculationResponse(BaseModel):
     final_unscaled_score: float # sum of weighted scores (0-100)
     iscore: float # scaled score (e.g., 300-850)
     raw_data_fetched: AllUserDataResponse
+    data_as_of: Optional[datetime] = None # When the inputs were read from the stores, or last synced into the credit profile
+    staleness_seconds: Optional[float] = None # Age of data_as_of when this response was sent
+    model_version: Optional[str] = None # Scoring model (app.services.score_models) that produced the score
+    provisional: bool = False # Scored with last-known values for inputs whose store was unavailable
+    stale_inputs: Optional[list[str]] = None # Which inputs those were (e.g. ["debt_info"])
+
+
+class BatchScoreRequest(BaseModel):
+    user_ids: list[UUID4]
 
-    
\ No newline at end of file
+class BatchScoreResult(BaseModel):
+    # One NDJSON line of a batch response: either the score fields or `error` is set
+    user_id: UUID4
+    components: Optional[list[ScoreComponent]] = None
+    final_unscaled_score: Optional[float] = None
+    iscore: Optional[float] = None
+    model_version: Optional[str] = None
+    error: Optional[str] = None
+
+
+class CreditProfile(BaseModel):
+    # One row of the credit_profiles read model: every scoring input for a user plus the
+    # last score computed from them. `version` goes up on every change to the inputs;
+    # the stored score is current when score_version == version. `stale` means the row
+    # can't be trusted to match the source stores until it is repaired or rebuilt.
+    user_id: UUID4
+    username: Optional[str] = None
+    email: Optional[EmailStr] = None
+    user_created_at: Optional[datetime] = None
+    on_time_payments: int = 0
+    total_due_payments: int = 0
+    used_credit: Optional[float] = None
+    credit_limit: Optional[float] = None
+    account_age_years: Optional[int] = None
+    credit_types_used: Optional[int] = None
+    components: Optional[list[ScoreComponent]] = None
+    final_unscaled_score: Optional[float] = None
+    iscore: Optional[float] = None
+    score_version: Optional[int] = None
+    model_version: Optional[str] = None # Scoring model the stored score was computed with
+    version: int = 0
+    stale: bool = False
+    updated_at: Optional[datetime] = None
+
+
+class ScoreHistoryPoint(BaseModel):
+    timestamp: datetime
+    payment_history: float # raw component scores (0-100)
+    outstanding_debt: float
+    credit_history_age: float
+    credit_mix: float
+    iscore: float
+
+class ScoreHistoryResponse(BaseModel):
+    user_id: UUID4
+    start: datetime
+    end: datetime
+    points: list[ScoreHistoryPoint]
+
+class ScorePercentilesResponse(BaseModel):
+    as_of: date
+    window_days: int
+    users: int # users with a score in the window; each counts once, with their latest score
+    percentiles: dict[str, float] # e.g. {"p50": 612.4}
+
+
+class ScoringModelWeights(BaseModel):
+    payment_history: float
+    outstanding_debt: float
+    credit_history_age: float
+    credit_mix: float
+
+class ScoringModelConfig(BaseModel):
+    # One file in SCORE_MODELS_DIR; see app.services.score_models
+    version: str
+    description: Optional[str] = None
+    weights: ScoringModelWeights
+    max_account_age_years: int # age that scores 100 on the linear age score
+    total_credit_types: int # credit types that score 100 on the credit mix score
+    score_min: float
+    score_max: float
+    utilization_curve: Optional[list[tuple[float, float]]] = None # (utilization, score 0-100) points, replaces the linear debt score
+    age_curve: Optional[list[tuple[float, float]]] = None # (account age in years, score 0-100) points, replaces the linear age score
+
+class ScoringModelInfo(BaseModel):
+    config: ScoringModelConfig
+    source: str # "builtin" or the config file's path
+    active: bool
+
+class ScoringModelsResponse(BaseModel):
+    active_version: str
+    models: list[ScoringModelInfo]
+    errors: dict[str, str] # config file -> why it was rejected (the previously loaded version, if any, stays in use)
+
+class ScoreDistribution(BaseModel):
+    mean: float
+    percentiles: dict[str, float]
+
+class ScoringModelComparison(BaseModel):
+    baseline: str
+    candidate: str
+    users: int
+    seed: int
+    baseline_scores: ScoreDistribution
+    candidate_scores: ScoreDistribution
+    mean_change: float # candidate - baseline iScore, averaged over users
+    mean_absolute_change: float
+    max_increase: float
+    max_decrease: float
+    changed_share: float # share of users whose iScore changed
+    seconds: float # time spent scoring both models
+
+
+class WhatIfGrid(BaseModel):
+    # Hypothetical changes to try; every combination is one scenario. 0 (no change) is always included.
+    paydown: Optional[list[float]] = None # amounts paid off used credit
+    additional_on_time_payments: Optional[list[int]] = None # each one also adds a due payment
+    additional_credit_types: Optional[list[int]] = None
+    additional_years: Optional[list[int]] = None # account aging
+
+class WhatIfCosts(BaseModel):
+    # Effort of each kind of change in common units (default: roughly months), used to rank improvements
+    per_1000_paid_down: float = 1.0
+    per_on_time_payment: float = 1.0
+    per_credit_type: float = 3.0
+    per_year: float = 12.0
+
+class WhatIfRequest(BaseModel):
+    grid: WhatIfGrid = WhatIfGrid()
+    costs: WhatIfCosts = WhatIfCosts()
+    top_k: int = 5
+
+class WhatIfScenario(BaseModel):
+    paydown: float
+    additional_on_time_payments: int
+    additional_credit_types: int
+    additional_years: int
+    iscore: float
+    gain: float # iscore - current_iscore
+    cost: float
+
+class WhatIfResponse(BaseModel):
+    user_id: UUID4
+    model_version: str
+    current_iscore: float
+    axes: WhatIfGrid # the grid evaluated, defaults filled in
+    iscores: list # iscore per scenario, nested in axes order: [paydown][on_time_payments][credit_types][years]
+    scenarios: int
+    improvements: list[WhatIfScenario] # cheapest first; each one gains more than every cheaper one
+
+class GenerateDataJobRequest(BaseModel):
+    user_id: UUID4
+
+class RescoreJobRequest(BaseModel):
+    user_ids: Optional[list[UUID4]] = None # None rescores every user
+
+class JobStatus(BaseModel):
+    job_id: str
+    kind: str # "generate_data", "rescore" or "import_payments"
+    params: dict
+    status: str # "queued", "running", "succeeded" or "failed"
+    progress_done: int = 0
+    progress_total: Optional[int] = None # None until known
+    attempts: int = 0
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    deduplicated: bool = False # True when the submission matched a job already queued or running, which is returned instead
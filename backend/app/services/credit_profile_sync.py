@@ -0,0 +1,148 @@
+"""
+Rebuild or check the credit_profiles read model (app.services.credit_profiles) against the
+source stores.
+
+Run from the backend folder:
+    python -m app.services.credit_profile_sync rebuild [--user-id UUID ...]
+    python -m app.services.credit_profile_sync check [--user-id UUID ...]
+
+`rebuild` rewrites profiles from the users table and the four factor stores; run it once to
+backfill users created before the read model existed. `check` prints every user whose
+profile disagrees with the sources and exits with status 1 if any did.
+"""
+import argparse
+import asyncio
+import math
+import sys
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app import crud, schemas
+from app.services import credit_profiles, iscore_service
+from app.storage import get_storage
+
+COMPARED_FIELDS = ("username", "email", "on_time_payments", "total_due_payments", *credit_profiles.FACTOR_FIELDS)
+
+
+async def _user_pages(user_ids: Optional[List[uuid.UUID]], page_size: int) -> AsyncIterator[List[schemas.UserResponse]]:
+    if user_ids:
+        for start in range(0, len(user_ids), page_size):
+            users = crud.get_users_bulk(user_ids[start:start + page_size])
+            if users is None:
+                raise RuntimeError("Bulk user read failed.")
+            yield list(users.values())
+        return
+    after_user_id = None
+    while True:
+        users = crud.list_users_page(after_user_id, page_size)
+        if not users:
+            return
+        yield users
+        if len(users) < page_size:
+            return
+        after_user_id = users[-1].user_id
+
+
+async def _read_page(users: List[schemas.UserResponse]) -> Tuple[Dict[uuid.UUID, schemas.CreditProfile], Dict[uuid.UUID, schemas.CreditProfile]]:
+    """(stored profiles, profiles built from the source stores), both keyed by user_id."""
+    user_ids = [user.user_id for user in users]
+    reads = {name: (lambda read=read: read(user_ids)) for name, read in iscore_service.FACTOR_BULK_READS.items()}
+    reads["profiles"] = lambda: get_storage().get_credit_profiles_bulk(user_ids)
+    results = await iscore_service.run_reads(reads)
+    failed = [name for name, result in results.items() if result is None]
+    if failed:
+        raise RuntimeError(f"Bulk read failed for: {', '.join(failed)}")
+    stored = results.pop("profiles")
+    sources = {
+        user.user_id: credit_profiles.from_user_data(schemas.AllUserDataResponse(user_info=user, **{name: found.get(user.user_id) for name, found in results.items()}))
+        for user in users
+    }
+    return stored, sources
+
+
+def _differences(stored: Optional[schemas.CreditProfile], source: schemas.CreditProfile) -> List[str]:
+    if stored is None:
+        return ["no profile"]
+    problems = ["marked stale"] if stored.stale else []
+    for field in COMPARED_FIELDS:
+        ours, theirs = getattr(stored, field), getattr(source, field)
+        same = math.isclose(ours, theirs) if isinstance(ours, float) and isinstance(theirs, float) else ours == theirs
+        if not same:
+            problems.append(f"{field}: profile={ours} sources={theirs}")
+    if not problems and credit_profiles.has_current_score(stored) and credit_profiles.is_complete(source):
+        expected = credit_profiles.with_score(source).iscore
+        if stored.iscore is None or not math.isclose(stored.iscore, expected):
+            problems.append(f"iscore: profile={stored.iscore} sources={expected}")
+    return problems
+
+
+async def _check(user_ids: Optional[List[uuid.UUID]], page_size: int) -> Dict[uuid.UUID, List[str]]:
+    mismatched: Dict[uuid.UUID, List[str]] = {}
+    async for users in _user_pages(user_ids, page_size):
+        stored, sources = await _read_page(users)
+        for user_id, source in sources.items():
+            problems = _differences(stored.get(user_id), source)
+            if problems:
+                mismatched[user_id] = problems
+    return mismatched
+
+
+def check(user_ids: Optional[List[uuid.UUID]] = None, page_size: int = 500) -> int:
+    mismatched = asyncio.run(_check(user_ids, page_size))
+    if mismatched:
+        # A write landing between the two reads looks like a mismatch, so only report users that still differ
+        mismatched = asyncio.run(_check(list(mismatched), page_size))
+    for user_id, problems in mismatched.items():
+        print(f"{user_id}: {'; '.join(problems)}")
+    print(f"{len(mismatched)} user(s) whose credit profile disagrees with the source stores.")
+    return len(mismatched)
+
+
+async def _rebuild(
+    user_ids: Optional[List[uuid.UUID]], page_size: int, on_page: Optional[Callable[[List[uuid.UUID]], None]] = None
+) -> Tuple[int, int]:
+    written = skipped = 0
+    async for users in _user_pages(user_ids, page_size):
+        stored, sources = await _read_page(users)
+        profiles, expected_versions = [], []
+        for user_id, source in sources.items():
+            expected_version = stored[user_id].version if user_id in stored else None
+            profile = source.model_copy(update={"version": expected_version or 0})
+            profiles.append(credit_profiles.with_score(profile) if credit_profiles.is_complete(profile) else profile)
+            expected_versions.append(expected_version)
+        saved = get_storage().save_credit_profiles(profiles, expected_versions)
+        written += saved
+        skipped += len(profiles) - saved
+        if on_page is not None:
+            on_page([user.user_id for user in users])
+    return written, skipped
+
+
+def rebuild_profiles(
+    user_ids: Optional[List[uuid.UUID]] = None, page_size: int = 500, on_page: Optional[Callable[[List[uuid.UUID]], None]] = None
+) -> Tuple[int, int]:
+    """(written, skipped). on_page is called with each page's user ids once they're written."""
+    return asyncio.run(_rebuild(user_ids, page_size, on_page))
+
+
+def rebuild(user_ids: Optional[List[uuid.UUID]] = None, page_size: int = 500) -> int:
+    written, skipped = rebuild_profiles(user_ids, page_size)
+    # Skipped profiles were changed by a write during the rebuild, which brought them up to date itself
+    print(f"Rebuilt credit profiles; {written} written, {skipped} skipped (changed during the rebuild).")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["check", "rebuild"])
+    parser.add_argument("--user-id", dest="user_ids", type=uuid.UUID, action="append", help="Limit to these users (repeatable)")
+    parser.add_argument("--page-size", type=int, default=500, help="Users read and written per round")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        sys.exit(1 if check(args.user_ids, args.page_size) else 0)
+    rebuild(args.user_ids, args.page_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Credit profile read model: one row per user (credit_profiles) holding every scoring input
+and the last score computed from them, so /iscore can be answered with one keyed read
+instead of one read per store.
+
+crud.py's writes keep it current: once a source write succeeds, record_change() applies the
+same change to the profile and re-scores it. Every change bumps the profile's version and a
+score is only stored against the version it was computed from, so concurrent writes can't
+leave an outdated score behind. A profile that is missing, incomplete or stale (a change
+couldn't be applied) isn't served: /iscore reads the source stores instead and repairs the
+profile from that read. credit_profile_sync rebuilds and checks the whole table.
+
+CREDIT_PROFILE_MODE: "serve" (maintained, /iscore reads it first), "maintain" (maintained,
+/iscore reads the source stores) or "off".
+"""
+import logging
+import uuid
+from typing import Any, Dict, Optional
+
+from app import schemas
+from app.core.config import settings
+from app.services import score_calculator, score_models
+from app.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+FACTOR_FIELDS = ("used_credit", "credit_limit", "account_age_years", "credit_types_used")
+
+
+def is_maintained() -> bool:
+    return settings.CREDIT_PROFILE_MODE.lower() in ("maintain", "serve")
+
+
+def is_served() -> bool:
+    return settings.CREDIT_PROFILE_MODE.lower() == "serve"
+
+
+def is_complete(profile: schemas.CreditProfile) -> bool:
+    # Same rule as iscore_service.missing_components: 0/0 payment history is fine, the other factors are required
+    return profile.username is not None and all(getattr(profile, f) is not None for f in FACTOR_FIELDS)
+
+
+def is_servable(profile: Optional[schemas.CreditProfile]) -> bool:
+    return profile is not None and not profile.stale and is_complete(profile)
+
+
+def to_user_data(profile: schemas.CreditProfile) -> schemas.AllUserDataResponse:
+    user_id = profile.user_id
+    return schemas.AllUserDataResponse(
+        user_info=schemas.UserResponse(user_id=user_id, username=profile.username, email=profile.email, created_at=profile.user_created_at),
+        derived_payment_history=schemas.DerivedPaymentHistory(user_id=user_id, on_time_payments=profile.on_time_payments, total_due_payments=profile.total_due_payments),
+        debt_info=schemas.DebtData(user_id=user_id, used_credit=profile.used_credit, credit_limit=profile.credit_limit) if profile.used_credit is not None else None,
+        history_info=schemas.HistoryData(user_id=user_id, account_age_years=profile.account_age_years) if profile.account_age_years is not None else None,
+        mix_info=schemas.MixData(user_id=user_id, credit_types_used=profile.credit_types_used) if profile.credit_types_used is not None else None,
+    )
+
+
+def from_user_data(user_data: schemas.AllUserDataResponse, version: int = 0) -> schemas.CreditProfile:
+    """A profile holding what was read from the source stores (factors may be None)."""
+    user, history = user_data.user_info, user_data.derived_payment_history
+    return schemas.CreditProfile(
+        user_id=user.user_id, username=user.username, email=user.email, user_created_at=user.created_at,
+        on_time_payments=history.on_time_payments if history else 0,
+        total_due_payments=history.total_due_payments if history else 0,
+        used_credit=user_data.debt_info.used_credit if user_data.debt_info else None,
+        credit_limit=user_data.debt_info.credit_limit if user_data.debt_info else None,
+        account_age_years=user_data.history_info.account_age_years if user_data.history_info else None,
+        credit_types_used=user_data.mix_info.credit_types_used if user_data.mix_info else None,
+        version=version,
+    )
+
+
+def with_score(profile: schemas.CreditProfile, score: Optional[Dict[str, Any]] = None) -> schemas.CreditProfile:
+    """
+    The profile with `score` (computed from its inputs with the active model when not given)
+    stored against its current version.
+    """
+    if score is None:
+        score = score_calculator.calculate_final_iscore(to_user_data(profile))
+    return profile.model_copy(update={
+        "components": score["components"], "final_unscaled_score": score["final_unscaled_score"],
+        "iscore": score["iscore"], "score_version": profile.version, "model_version": score["model_version"],
+    })
+
+
+def has_current_score(profile: schemas.CreditProfile) -> bool:
+    # Computed from the profile's current inputs, with the model that's active now
+    return profile.score_version == profile.version and profile.model_version == score_models.registry.active_version()
+
+
+def score_response(profile: schemas.CreditProfile) -> schemas.ScoreCalculationResponse:
+    if not has_current_score(profile): # Inputs or the active model changed after the stored score; rescoring is pure CPU
+        profile = with_score(profile)
+    return schemas.ScoreCalculationResponse(
+        user_id=profile.user_id,
+        components=profile.components,
+        final_unscaled_score=profile.final_unscaled_score,
+        iscore=profile.iscore,
+        model_version=profile.model_version,
+        raw_data_fetched=to_user_data(profile),
+        data_as_of=profile.updated_at,
+    )
+
+
+def load(user_id: uuid.UUID) -> Optional[schemas.CreditProfile]:
+    return get_storage().get_credit_profile(user_id)
+
+
+def record_user_created(user: schemas.UserResponse):
+    # A new user has no credit data anywhere yet, so an empty profile already matches the sources
+    if not is_maintained():
+        return
+    try:
+        profile = schemas.CreditProfile(user_id=user.user_id, username=user.username, email=user.email, user_created_at=user.created_at)
+        get_storage().save_credit_profiles([profile], [None])
+    except Exception as e:
+        logger.error(f"Error creating credit profile for user {user.user_id}: {e}")
+
+
+def record_change(user_id: uuid.UUID, fields: Optional[Dict[str, Any]] = None, increments: Optional[Dict[str, int]] = None):
+    """
+    Applies a write that already succeeded on a source store to the user's profile and
+    re-scores it. Never raises: the source write stands either way.
+    """
+    if not is_maintained():
+        return
+    storage = get_storage()
+    try:
+        profile = storage.apply_credit_profile_change(user_id, fields or {}, increments or {})
+        if profile is None:
+            # The profile missed this change; flag it so it's scored from the sources until repaired
+            storage.apply_credit_profile_change(user_id, {}, {}, stale=True)
+            return
+        if profile.stale or not is_complete(profile):
+            return
+        # Only lands if no other change came in meanwhile; that change's own re-score wins instead
+        storage.save_credit_profiles([with_score(profile)], [profile.version])
+    except Exception as e:
+        logger.error(f"Error updating credit profile for user {user_id}: {e}")
+
+
+def repair(profile: Optional[schemas.CreditProfile], user_data: schemas.AllUserDataResponse, response: schemas.ScoreCalculationResponse):
+    """
+    Replaces a profile that couldn't be served with what was just read from the source
+    stores. Skipped if the profile changed since `profile` was read.
+    """
+    expected_version = profile.version if profile else None
+    fresh = from_user_data(user_data, version=expected_version or 0)
+    score = {
+        "components": response.components, "final_unscaled_score": response.final_unscaled_score,
+        "iscore": response.iscore, "model_version": response.model_version,
+    }
+    try:
+        get_storage().save_credit_profiles([with_score(fresh, score)], [expected_version])
+    except Exception as e:
+        logger.error(f"Error repairing credit profile for user {fresh.user_id}: {e}")
@@ -0,0 +1,19 @@
+"""
+Distributions used to generate synthetic credit data. Shared by the per-user generator in
+crud.generate_and_store_user_data and the vectorized population generator, so both
+produce the same kind of users. Integer ranges are inclusive.
+"""
+
+TRANSACTIONS_PER_USER = (5, 15)
+DUE_DATE_LOOKBACK_DAYS = 365 # Due dates spread out over the last year
+AMOUNT_DUE_RANGE = (50.0, 500.0)
+PAID_PROBABILITY = 3 / 4 # Higher chance of being paid
+ON_TIME_GIVEN_PAID_PROBABILITY = 4 / 5 # Higher chance of on-time
+EARLY_PAYMENT_DAYS = (0, 5) # Paid on or before due date
+LATE_PAYMENT_DAYS = (1, 30)
+
+CREDIT_LIMIT_CHOICES = [5000, 10000, 15000, 20000]
+CREDIT_UTILIZATION_RANGE = (0.1, 0.9) # Use between 10% and 90%
+
+# Account age is drawn from 1..MAX_POSSIBLE_AGE_YEARS and credit types from
+# 1..TOTAL_SYSTEM_CREDIT_TYPES, both taken from Settings.
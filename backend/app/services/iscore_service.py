@@ -0,0 +1,360 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app import crud, schemas
+from app.core import metrics
+from app.core.config import settings
+from app.core.resilience import StoreUnavailable
+from app.services import credit_profiles, score_calculator
+from app.services.score_cache import score_cache
+from app.services.score_flights import score_flights
+
+
+# Factor reads needed to score a user, each against a different remote store
+FACTOR_READS: Dict[str, Callable[[uuid.UUID], Any]] = {
+    "derived_payment_history": crud.get_derived_payment_history, # Supabase 1 (transactions table)
+    "debt_info": crud.get_debt_data,                             # MongoDB 1
+    "history_info": crud.get_history_data,                       # Supabase 2
+    "mix_info": crud.get_mix_data,                               # MongoDB 2
+}
+
+# Fields a compact /iscore response can select (?view=compact&fields=...)
+COMPACT_FIELDS = ("user_id", "iscore", "final_unscaled_score", "components", "model_version", "data_as_of", "staleness_seconds")
+DEFAULT_COMPACT_FIELDS = ("user_id", "iscore")
+
+# Bulk counterparts of FACTOR_READS, one IN (...) / $in query per store
+FACTOR_BULK_READS: Dict[str, Callable[[List[uuid.UUID]], Any]] = {
+    "derived_payment_history": crud.get_derived_payment_history_bulk,
+    "debt_info": crud.get_debt_data_bulk,
+    "history_info": crud.get_history_data_bulk,
+    "mix_info": crud.get_mix_data_bulk,
+}
+
+
+def is_concurrent_fetch() -> bool:
+    return settings.SCORE_FETCH_MODE.lower() == "concurrent"
+
+
+async def run_reads(reads: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+    """
+    Runs blocking crud reads in the threadpool, either all at once or one after another
+    depending on SCORE_FETCH_MODE. Returns the results under the same keys.
+    """
+    if is_concurrent_fetch():
+        results = await asyncio.gather(*(run_in_threadpool(read) for read in reads.values()))
+        return dict(zip(reads.keys(), results))
+    return {name: await run_in_threadpool(read) for name, read in reads.items()}
+
+
+def missing_components(data: Dict[str, Any]) -> List[str]:
+    # Derived payment history might be "empty" (0/0) for new users, which is valid for scoring.
+    # So, we check if the objects themselves are None where critical.
+    missing = []
+    if data.get("derived_payment_history") is None: missing.append("payment history processing")
+    if not data.get("debt_info"): missing.append("debt")
+    if not data.get("history_info"): missing.append("history")
+    if not data.get("mix_info"): missing.append("mix")
+    return missing
+
+
+def raise_user_not_found():
+    raise HTTPException(status_code=404, detail="User not found")
+
+
+def raise_missing_components(missing: List[str]):
+    raise HTTPException(status_code=404, detail=f"User found, but missing critical data components: {', '.join(missing)}. Please ensure data generation is complete.")
+
+
+def _or_unavailable(read: Callable[[], Any]) -> Callable[[], Any]:
+    # Hands back a store outage as the read's result, so one store being down doesn't abandon the other reads
+    def call():
+        try:
+            return read()
+        except StoreUnavailable as e:
+            return e
+    return call
+
+
+def _or_error(read: Callable[[], Any]) -> Callable[[], Any]:
+    # Hands back whatever the read raised as its result, to be raised once the user is known to exist
+    def call():
+        try:
+            return read()
+        except Exception as e:
+            return e
+    return call
+
+
+async def _read_user_data(user_id: uuid.UUID) -> Dict[str, Any]:
+    user_read = _or_unavailable(lambda: crud.get_user(user_id)) # From Neon
+    factor_reads = {name: _or_unavailable(lambda read=read: read(user_id)) for name, read in FACTOR_READS.items()}
+    if is_concurrent_fetch():
+        # The Neon user lookup runs alongside the factor reads; an unknown user still takes priority
+        # over missing components and over a factor read that raised, so the error stays the same as
+        # the sequential path (which doesn't read the factors of an unknown user at all).
+        results = await run_reads({"user_info": user_read, **{name: _or_error(read) for name, read in factor_reads.items()}})
+        if not results["user_info"]:
+            return {"user_info": results["user_info"]}
+        for result in results.values():
+            if isinstance(result, Exception) and not isinstance(result, StoreUnavailable):
+                raise result
+        return results
+    user_info = await run_in_threadpool(user_read)
+    if not user_info:
+        return {"user_info": user_info}
+    return {"user_info": user_info, **await run_reads(factor_reads)}
+
+
+async def _fetch_user_data(
+    user_id: uuid.UUID, last_known: Optional[Callable[[], Optional[schemas.CreditProfile]]] = None
+) -> Tuple[schemas.AllUserDataResponse, List[str], Optional[datetime]]:
+    """
+    (data, inputs taken from the last-known profile, when that profile was last updated).
+    Without `last_known`, or when it has nothing for an unavailable input, the outage is raised.
+    """
+    results = await _read_user_data(user_id)
+    if not results["user_info"]: # Neon answered and has no such user: 404 whichever factor stores are down
+        raise_user_not_found()
+    unavailable = {name: r for name, r in results.items() if isinstance(r, StoreUnavailable)}
+    stale_inputs, as_of = [], None
+    if unavailable:
+        profile = await run_in_threadpool(last_known) if last_known else None
+        known = credit_profiles.to_user_data(profile) if profile else None
+        for name, outage in unavailable.items():
+            value = getattr(known, name) if known else None
+            if value is None:
+                raise outage
+            results[name] = value
+            stale_inputs.append(name)
+        as_of = profile.updated_at
+
+    missing = missing_components(results)
+    if missing:
+        raise_missing_components(missing)
+    return schemas.AllUserDataResponse(**results), stale_inputs, as_of
+
+
+async def fetch_all_user_data(user_id: uuid.UUID) -> schemas.AllUserDataResponse:
+    """
+    Gathers everything needed to score a user from the five stores.
+    Raises 404 if the user is unknown or a factor is missing, same as the original endpoint,
+    and StoreUnavailable (503) if a store can't be read.
+    """
+    data, _, _ = await _fetch_user_data(user_id)
+    return data
+
+
+def parse_compact_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    if not fields:
+        return DEFAULT_COMPACT_FIELDS
+    selected = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in selected if f not in COMPACT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown field(s): {', '.join(unknown)}. Choose from: {', '.join(COMPACT_FIELDS)}.")
+    return selected
+
+
+def compact_payload(response: schemas.ScoreCalculationResponse, fields: Tuple[str, ...]) -> dict:
+    """Plain-dict subset of a score response, without raw_data_fetched, ready for orjson."""
+    payload = {}
+    if response.provisional: # Always shown, whatever fields were asked for
+        payload["provisional"] = True
+        payload["stale_inputs"] = response.stale_inputs
+    for field in fields:
+        if field == "components":
+            payload["components"] = [
+                {"name": c.name, "value": c.value, "weight": c.weight, "raw_score": c.raw_score, "weighted_score": c.weighted_score}
+                for c in response.components
+            ]
+        else:
+            payload[field] = getattr(response, field)
+    return payload
+
+
+def build_score_response(
+    user_id: uuid.UUID, all_user_data: schemas.AllUserDataResponse,
+    stale_inputs: Optional[List[str]] = None, data_as_of: Optional[datetime] = None
+) -> schemas.ScoreCalculationResponse:
+    with metrics.timed("compute", "score"):
+        if stale_inputs:
+            score_results = score_calculator.calculate_provisional_iscore(all_user_data, stale_inputs)
+        else:
+            score_results = score_calculator.calculate_final_iscore(all_user_data)
+    return schemas.ScoreCalculationResponse(
+        user_id=user_id,
+        components=score_results["components"],
+        final_unscaled_score=score_results["final_unscaled_score"],
+        iscore=score_results["iscore"],
+        model_version=score_results["model_version"],
+        raw_data_fetched=all_user_data, # This now contains derived_payment_history
+        data_as_of=data_as_of or datetime.now(timezone.utc), # Just read from the stores unless some inputs are last-known
+        provisional=bool(stale_inputs),
+        stale_inputs=stale_inputs or None,
+    )
+
+
+def with_staleness(response: schemas.ScoreCalculationResponse) -> schemas.ScoreCalculationResponse:
+    # Worked out per request: cached and profile-served responses keep the data_as_of of what they were built from
+    if response.data_as_of is None:
+        return response
+    staleness = (datetime.now(timezone.utc) - response.data_as_of).total_seconds()
+    return response.model_copy(update={"staleness_seconds": round(max(staleness, 0.0), 3)})
+
+
+async def _call_cache(method, *args):
+    # The shared (Redis) backend does network I/O, keep it off the event loop
+    with metrics.timed("score_cache", method.__name__):
+        if score_cache.blocking:
+            return await run_in_threadpool(method, *args)
+        return method(*args)
+
+
+async def score_user(user_id: uuid.UUID) -> schemas.ScoreCalculationResponse:
+    cached = await _call_cache(score_cache.get, user_id)
+    if cached is not None:
+        return cached
+    # Concurrent misses for this user wait on the same computation
+    return await score_flights.run(user_id, lambda: _compute_score(user_id))
+
+
+async def _compute_score(user_id: uuid.UUID) -> schemas.ScoreCalculationResponse:
+    token = await _call_cache(score_cache.begin, user_id)
+    profile = None
+    if credit_profiles.is_served():
+        # One keyed read of the credit profile; the source stores are only read when it can't be served
+        try:
+            profile = await run_in_threadpool(credit_profiles.load, user_id)
+        except StoreUnavailable:
+            profile = None
+        if credit_profiles.is_servable(profile):
+            response = credit_profiles.score_response(profile)
+            await _call_cache(score_cache.set, user_id, response, token)
+            return response
+
+    last_known = None
+    if settings.DEGRADED_SCORING and credit_profiles.is_maintained():
+        # The profile already read above, or read only once a store turns out to be down
+        last_known = (lambda: profile) if profile else (lambda: _load_profile_or_none(user_id))
+    all_user_data, stale_inputs, as_of = await _fetch_user_data(user_id, last_known)
+    if stale_inputs:
+        # Provisional: not cached, not written back to the profile and not kept in the score history
+        return build_score_response(user_id, all_user_data, stale_inputs, as_of)
+
+    response = build_score_response(user_id, all_user_data)
+    if credit_profiles.is_served():
+        await run_in_threadpool(credit_profiles.repair, profile, all_user_data, response)
+    await _call_cache(score_cache.set, user_id, response, token)
+    return response
+
+
+def _load_profile_or_none(user_id: uuid.UUID) -> Optional[schemas.CreditProfile]:
+    try:
+        return credit_profiles.load(user_id)
+    except StoreUnavailable:
+        return None
+
+
+async def current_user_data(user_id: uuid.UUID) -> schemas.AllUserDataResponse:
+    """A user's scoring inputs: from the credit profile when it can be served, else from the five stores."""
+    if credit_profiles.is_served():
+        try:
+            profile = await run_in_threadpool(credit_profiles.load, user_id)
+        except StoreUnavailable:
+            profile = None
+        if credit_profiles.is_servable(profile):
+            return credit_profiles.to_user_data(profile)
+    return await fetch_all_user_data(user_id)
+
+
+async def fetch_bulk_user_data(
+    user_ids: List[uuid.UUID], users: Optional[Dict[uuid.UUID, schemas.UserResponse]] = None
+) -> Tuple[Dict[uuid.UUID, schemas.AllUserDataResponse], Dict[uuid.UUID, str]]:
+    """
+    Fetches a chunk of users with one bulk query per store.
+    Returns (data for scoreable users, error detail for the rest), both keyed by user_id.
+    Pass `users` when the Neon rows are already at hand to skip the user lookup.
+    """
+    reads = {name: _or_unavailable(lambda read=read: read(user_ids)) for name, read in FACTOR_BULK_READS.items()}
+    if users is None:
+        reads["user_info"] = _or_unavailable(lambda: crud.get_users_bulk(user_ids))
+    results = await run_reads(reads)
+    if users is None:
+        users = results.pop("user_info")
+        if users is None or isinstance(users, StoreUnavailable): # Not knowing who exists isn't "User not found"
+            store = users.store if users is not None else "neon"
+            return {}, {user_id: f"Data store unavailable: {store}" for user_id in user_ids}
+    # A bulk read that failed without raising comes back as None: named by its component, as its store isn't known here
+    unavailable = sorted({r.store if r is not None else name for name, r in results.items() if r is None or isinstance(r, StoreUnavailable)})
+
+    found: Dict[uuid.UUID, schemas.AllUserDataResponse] = {}
+    errors: Dict[uuid.UUID, str] = {}
+    if unavailable:
+        # A factor that couldn't be read is missing for everyone in the chunk
+        for user_id in user_ids:
+            errors[user_id] = "User not found" if user_id not in users else f"Data store unavailable: {', '.join(unavailable)}"
+        return found, errors
+    for user_id in user_ids:
+        if user_id not in users:
+            errors[user_id] = "User not found"
+            continue
+        user_results = {name: factor_map.get(user_id) for name, factor_map in results.items()}
+        missing = missing_components(user_results)
+        if missing:
+            errors[user_id] = f"User found, but missing critical data components: {', '.join(missing)}."
+            continue
+        found[user_id] = schemas.AllUserDataResponse(user_info=users[user_id], **user_results)
+    return found, errors
+
+
+def score_chunk(user_ids: List[uuid.UUID], found: Dict[uuid.UUID, schemas.AllUserDataResponse], errors: Dict[uuid.UUID, str]) -> List[schemas.BatchScoreResult]:
+    """Scores every user in `found` in one pass and returns results in `user_ids` order."""
+    scored_ids = list(found.keys())
+    with metrics.timed("compute", "score_batch"):
+        scores = dict(zip(scored_ids, score_calculator.calculate_final_iscore_batch([found[u] for u in scored_ids])))
+    results = []
+    for user_id in user_ids:
+        if user_id in scores:
+            results.append(schemas.BatchScoreResult(user_id=user_id, **scores[user_id]))
+        else:
+            results.append(schemas.BatchScoreResult(user_id=user_id, error=errors[user_id]))
+    return results
+
+
+async def stream_batch_scores(user_ids: List[uuid.UUID]) -> AsyncIterator[str]:
+    """
+    Yields one NDJSON line per user, chunk by chunk, so only ISCORE_BATCH_CHUNK_SIZE users
+    are held in memory at a time. Duplicate ids are scored once.
+    """
+    unique_ids = list(dict.fromkeys(user_ids))
+    chunk_size = settings.ISCORE_BATCH_CHUNK_SIZE
+    for start in range(0, len(unique_ids), chunk_size):
+        chunk = unique_ids[start:start + chunk_size]
+        found, errors = await fetch_bulk_user_data(chunk)
+        for result in score_chunk(chunk, found, errors):
+            yield result.model_dump_json(exclude_none=True) + "\n"
+
+
+async def stream_score_export(after_user_id: Optional[uuid.UUID] = None, page_size: Optional[int] = None) -> AsyncIterator[str]:
+    """
+    Walks the users table in user_id order (keyset pagination) and yields one NDJSON line
+    per user, a page at a time. Every line carries user_id, so the last one received is
+    the cursor to resume from.
+    """
+    page_size = page_size or settings.SCORE_EXPORT_PAGE_SIZE
+    while True:
+        users = await run_in_threadpool(crud.list_users_page, after_user_id, page_size)
+        if not users:
+            return
+        page = {user.user_id: user for user in users}
+        user_ids = list(page.keys())
+        found, errors = await fetch_bulk_user_data(user_ids, users=page)
+        for result in score_chunk(user_ids, found, errors):
+            yield result.model_dump_json(exclude_none=True) + "\n"
+        if len(users) < page_size:
+            return
+        after_user_id = user_ids[-1]
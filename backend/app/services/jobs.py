@@ -0,0 +1,500 @@
+"""
+Background jobs: work too slow for a request (generating a user's credit data, rescoring
+many users) is queued and returns a job id at once; GET /jobs/{job_id} reports its status
+and progress. At most JOB_WORKERS jobs run at a time in each process, on worker threads.
+
+A job's dedupe key names the work it does (e.g. "generate_data:<user_id>"). Submitting
+work whose key matches a job still queued or running returns that job instead of queueing
+the same work twice.
+
+The queue is pluggable (JOB_QUEUE_BACKEND): "memory" keeps jobs in this process and loses
+queued ones on restart; "sqlite" keeps them in JOB_QUEUE_SQLITE_PATH, so they survive a
+restart and the uvicorn workers of one host share one queue. Running jobs send a heartbeat
+every JOB_HEARTBEAT_SECONDS; one silent for JOB_STALE_SECONDS (its process died) is queued
+again, up to JOB_MAX_ATTEMPTS runs, if its kind is retryable. Generating data and importing
+payments add rows, so running them again would add a second set; a stale job of those kinds
+fails instead, and is left to be resubmitted once its partial data has been looked at.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+from app import crud, schemas
+from app.core import metrics
+from app.core.config import settings
+from app.services import credit_profile_sync, credit_profiles, payment_import
+from app.services.score_cache import score_cache
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+STATUSES = (QUEUED, RUNNING, SUCCEEDED, FAILED)
+
+Progress = Callable[[int, Optional[int]], None] # (done, total)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobError(Exception):
+    """A job failed for a reason worth showing as is (missing user, wrong mode), not a crash."""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _new_job(kind: str, params: dict) -> schemas.JobStatus:
+    return schemas.JobStatus(job_id=uuid.uuid4().hex, kind=kind, params=params, status=QUEUED, created_at=_now())
+
+
+class InMemoryJobQueue:
+    """Jobs in this process only; queued and running jobs are lost on restart."""
+
+    durable = False
+
+    def __init__(self, history_limit: int):
+        self.history_limit = history_limit
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, schemas.JobStatus] = {}
+        self._pending: "deque[str]" = deque()
+        self._active: Dict[str, str] = {} # dedupe key -> job_id, for queued and running jobs
+        self._dedupe_keys: Dict[str, str] = {} # job_id -> dedupe key
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+
+    def enqueue(self, kind: str, params: dict, dedupe_key: str, max_pending: int) -> Tuple[schemas.JobStatus, bool]:
+        """(job, created): the job already queued or running under dedupe_key if there is one. Raises QueueFull."""
+        with self._lock:
+            job_id = self._active.get(dedupe_key)
+            if job_id is not None:
+                return self._jobs[job_id].model_copy(), False
+            if len(self._pending) >= max_pending:
+                raise QueueFull()
+            job = _new_job(kind, params)
+            self._jobs[job.job_id] = job
+            self._pending.append(job.job_id)
+            self._active[dedupe_key] = job.job_id
+            self._dedupe_keys[job.job_id] = dedupe_key
+            return job.model_copy(), True
+
+    def claim(self) -> Optional[schemas.JobStatus]:
+        with self._lock:
+            if not self._pending:
+                return None
+            job = self._jobs[self._pending.popleft()]
+            job.status, job.started_at, job.attempts = RUNNING, _now(), job.attempts + 1
+            return job.model_copy()
+
+    def heartbeat(self, job_ids: List[str]):
+        pass # A worker thread can't die without taking the queue with it
+
+    def requeue_stale(self, stale_seconds: float, max_attempts: int, retryable_kinds: List[str]) -> int:
+        return 0
+
+    def set_progress(self, job_id: str, done: int, total: Optional[int]):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.progress_done, job.progress_total = done, total
+
+    def finish(self, job_id: str, result: Optional[dict] = None, error: Optional[str] = None):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.status = FAILED if error is not None else SUCCEEDED
+            job.result, job.error, job.finished_at = result, error, _now()
+            self._active.pop(self._dedupe_keys.pop(job_id), None)
+            self._finished[job_id] = None
+            while len(self._finished) > self.history_limit:
+                old_job_id, _ = self._finished.popitem(last=False)
+                del self._jobs[old_job_id]
+
+    def get(self, job_id: str) -> Optional[schemas.JobStatus]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.model_copy() if job else None
+
+    def list(self, status: Optional[str], limit: int) -> List[schemas.JobStatus]:
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if status is None or job.status == status]
+        jobs.sort(key=lambda job: job.created_at, reverse=True)
+        return [job.model_copy() for job in jobs[:limit]]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict.fromkeys(STATUSES, 0)
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def close(self):
+        pass
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress_done INTEGER NOT NULL DEFAULT 0,
+    progress_total INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    heartbeat_at REAL
+);
+-- One queued or running job per dedupe key; finished ones don't count
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_dedupe_key ON jobs (dedupe_key) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at);
+"""
+
+
+def _job(row: sqlite3.Row) -> schemas.JobStatus:
+    record = dict(row)
+    record["params"] = json.loads(record["params"])
+    record["result"] = json.loads(record["result"]) if record["result"] else None
+    for name in ("created_at", "started_at", "finished_at"):
+        record[name] = datetime.fromisoformat(record[name]) if record[name] else None
+    del record["dedupe_key"], record["heartbeat_at"]
+    return schemas.JobStatus(**record)
+
+
+class SQLiteJobQueue:
+    """
+    Jobs in a SQLite file. Claims and submissions are BEGIN IMMEDIATE transactions, so
+    processes sharing the file never both claim a job or queue the same dedupe key twice.
+    """
+
+    durable = True
+
+    def __init__(self, path: str, history_limit: int):
+        self.path = path
+        self.history_limit = history_limit
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.executescript(_SQLITE_SCHEMA)
+
+    def _transaction(self, work: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                value = work(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return value
+
+    def enqueue(self, kind: str, params: dict, dedupe_key: str, max_pending: int) -> Tuple[schemas.JobStatus, bool]:
+        def work(conn):
+            row = conn.execute("SELECT * FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running')", (dedupe_key,)).fetchone()
+            if row is not None:
+                return _job(row), False
+            if conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0] >= max_pending:
+                raise QueueFull()
+            job = _new_job(kind, params)
+            conn.execute(
+                "INSERT INTO jobs (job_id, kind, params, dedupe_key, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job.job_id, kind, json.dumps(params), dedupe_key, QUEUED, job.created_at.isoformat()),
+            )
+            return job, True
+        return self._transaction(work)
+
+    def claim(self) -> Optional[schemas.JobStatus]:
+        def work(conn):
+            row = conn.execute("SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at, rowid LIMIT 1").fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?, attempts = attempts + 1 WHERE job_id = ?",
+                (_now().isoformat(), time.time(), row["job_id"]),
+            )
+            return _job(conn.execute("SELECT * FROM jobs WHERE job_id = ?", (row["job_id"],)).fetchone())
+        return self._transaction(work)
+
+    def heartbeat(self, job_ids: List[str]):
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND job_id IN ({','.join('?' * len(job_ids))})",
+                (time.time(), *job_ids),
+            )
+
+    def requeue_stale(self, stale_seconds: float, max_attempts: int, retryable_kinds: List[str]) -> int:
+        """
+        Queues again the running jobs whose worker stopped sending heartbeats; fails those out
+        of attempts and those of a kind not in retryable_kinds.
+        """
+        def work(conn):
+            cutoff, finished_at = time.time() - stale_seconds, _now().isoformat()
+            kinds = ", ".join("?" * len(retryable_kinds)) or "NULL"
+            conn.execute(
+                f"UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE status = 'running' AND heartbeat_at < ? AND kind NOT IN ({kinds})",
+                ("Worker stopped responding; not retried, as running it again would add its data twice.", finished_at, cutoff, *retryable_kinds),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                (f"Worker stopped responding; gave up after {max_attempts} attempts.", finished_at, cutoff, max_attempts),
+            )
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, heartbeat_at = NULL WHERE status = 'running' AND heartbeat_at < ?",
+                (cutoff,),
+            ).rowcount
+        return self._transaction(work)
+
+    def set_progress(self, job_id: str, done: int, total: Optional[int]):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress_done = ?, progress_total = ?, heartbeat_at = ? WHERE job_id = ?",
+                (done, total, time.time(), job_id),
+            )
+
+    def finish(self, job_id: str, result: Optional[dict] = None, error: Optional[str] = None):
+        def work(conn):
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                (FAILED if error is not None else SUCCEEDED, json.dumps(result) if result is not None else None, error, _now().isoformat(), job_id),
+            )
+            # Oldest finished jobs beyond the history limit
+            conn.execute(
+                "DELETE FROM jobs WHERE job_id IN (SELECT job_id FROM jobs WHERE status IN ('succeeded', 'failed') "
+                "ORDER BY finished_at DESC LIMIT -1 OFFSET ?)",
+                (self.history_limit,),
+            )
+        self._transaction(work)
+
+    def get(self, job_id: str) -> Optional[schemas.JobStatus]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return _job(row) if row else None
+
+    def list(self, status: Optional[str], limit: int) -> List[schemas.JobStatus]:
+        with self._lock:
+            if status is None:
+                rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+            else:
+                rows = self._conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)).fetchall()
+        return [_job(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {**dict.fromkeys(STATUSES, 0), **{status: count for status, count in rows}}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Job kinds: kind -> (handler(params, progress) -> result, dedupe key for params, whether a run cut short may run again)
+
+def _generate_data(params: dict, progress: Progress) -> dict:
+    user_id = uuid.UUID(params["user_id"])
+    progress(0, 1)
+    if crud.get_user(user_id) is None:
+        raise JobError("User not found in User Database (Neon).")
+    summary = crud.generate_and_store_user_data(user_id)
+    progress(1, 1)
+    return {"user_id": str(user_id), "generation_summary": jsonable_encoder(summary)}
+
+
+def _rescore(params: dict, progress: Progress) -> dict:
+    # Recomputes and stores every listed user's score in their credit profile
+    if not credit_profiles.is_maintained():
+        raise JobError("Rescoring writes credit profiles; set CREDIT_PROFILE_MODE to maintain or serve.")
+    user_ids = [uuid.UUID(user_id) for user_id in params["user_ids"]] if params.get("user_ids") else None
+    total = len(user_ids) if user_ids else None
+    done = 0
+    progress(done, total)
+
+    def on_page(page_user_ids: List[uuid.UUID]):
+        nonlocal done
+        for user_id in page_user_ids:
+            score_cache.invalidate(user_id) # Cached scores may predate the rebuilt profile
+        done += len(page_user_ids)
+        progress(done, total)
+
+    written, skipped = credit_profile_sync.rebuild_profiles(user_ids, on_page=on_page)
+    progress(done, done)
+    result = {"users": done, "written": written, "skipped": skipped}
+    if user_ids:
+        result["not_found"] = len(set(user_ids)) - done
+    return result
+
+
+def _import_payments(params: dict, progress: Progress) -> dict:
+    # An uploaded file (payment_import.save_upload); removed once imported, its rejects CSV is kept
+    try:
+        stats = payment_import.import_file(
+            params["path"], params["format"], check_users=params.get("check_users", True),
+            progress=lambda stats: progress(int(stats.fraction * 100), 100),
+        )
+    except ValueError as e: # Not importable at all; running it again won't help
+        os.remove(params["path"])
+        raise JobError(str(e))
+    os.remove(params["path"])
+    return stats.as_dict()
+
+
+def _rescore_dedupe_key(params: dict) -> str:
+    user_ids = params.get("user_ids")
+    if not user_ids:
+        return "rescore:all"
+    if len(user_ids) == 1:
+        return f"rescore:{user_ids[0]}"
+    return "rescore:" + hashlib.sha256(",".join(sorted(user_ids)).encode()).hexdigest()
+
+
+JOB_KINDS: Dict[str, Tuple[Callable[[dict, Progress], dict], Callable[[dict], str], bool]] = {
+    "generate_data": (_generate_data, lambda params: f"generate_data:{params['user_id']}", False), # Appends transactions
+    "rescore": (_rescore, _rescore_dedupe_key, True), # Rebuilds profiles from the stores: same result every run
+    "import_payments": (_import_payments, lambda params: f"import_payments:{params['path']}", False), # Inserts the file's rows
+}
+
+
+class JobRunner:
+    STATS_COUNTERS = ("submitted", "deduplicated", "rejected", "requeued") # Only ever go up; the per-status job counts are gauges
+
+    def __init__(self, queue, workers: int):
+        self.queue = queue
+        self.workers = workers
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._running: Dict[str, None] = {} # job_ids this process is running
+        self._running_lock = threading.Lock()
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.requeued = 0
+
+    def submit(self, kind: str, params: dict) -> schemas.JobStatus:
+        """Queues a job (or returns the matching queued or running one). Raises QueueFull."""
+        params = jsonable_encoder(params) # UUIDs to strings, so both queues store the same thing
+        _, dedupe_key, _ = JOB_KINDS[kind]
+        try:
+            job, created = self.queue.enqueue(kind, params, dedupe_key(params), settings.JOB_QUEUE_MAX_PENDING)
+        except QueueFull:
+            self.rejected += 1
+            raise
+        if created:
+            self.submitted += 1
+            with self._wakeup:
+                self._wakeup.notify()
+        else:
+            self.deduplicated += 1
+        return job.model_copy(update={"deduplicated": not created})
+
+    def _run(self, job: schemas.JobStatus):
+        handler, _, _ = JOB_KINDS[job.kind]
+
+        def progress(done: int, total: Optional[int]):
+            self.queue.set_progress(job.job_id, done, total)
+
+        with self._running_lock:
+            self._running[job.job_id] = None
+        try:
+            with metrics.timed("jobs", job.kind):
+                result = handler(job.params, progress)
+            self.queue.finish(job.job_id, result=result)
+        except JobError as e:
+            self.queue.finish(job.job_id, error=str(e))
+        except Exception as e:
+            logger.exception(f"Job {job.job_id} ({job.kind}) failed: {e}")
+            metrics.record_error("jobs", job.kind)
+            self.queue.finish(job.job_id, error=f"{type(e).__name__}: {e}")
+        finally:
+            with self._running_lock:
+                self._running.pop(job.job_id, None)
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim()
+            except Exception as e: # e.g. the SQLite file is locked for longer than the busy timeout
+                logger.error(f"Error claiming a job: {e}")
+                job = None
+            if job is None:
+                with self._wakeup:
+                    # A durable queue also gets jobs from other processes, so poll as well as wait for submit()
+                    self._wakeup.wait(settings.JOB_HEARTBEAT_SECONDS)
+                continue
+            self._run(job)
+
+    def _heartbeat(self):
+        while not self._stop.wait(settings.JOB_HEARTBEAT_SECONDS):
+            try:
+                with self._running_lock:
+                    job_ids = list(self._running)
+                self.queue.heartbeat(job_ids)
+                retryable_kinds = [kind for kind, (_, _, retryable) in JOB_KINDS.items() if retryable]
+                requeued = self.queue.requeue_stale(settings.JOB_STALE_SECONDS, settings.JOB_MAX_ATTEMPTS, retryable_kinds)
+                if requeued:
+                    logger.warning(f"Requeued {requeued} job(s) whose worker stopped responding")
+                    self.requeued += requeued
+                    with self._wakeup:
+                        self._wakeup.notify_all()
+            except Exception as e:
+                logger.error(f"Job heartbeat failed: {e}")
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True) for i in range(self.workers)]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5):
+        """Stops taking jobs. Jobs still running after timeout are abandoned; a durable queue requeues them once stale."""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        self._threads = []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._running_lock:
+            running_here = len(self._running)
+        return {
+            "backend": settings.JOB_QUEUE_BACKEND,
+            "durable": self.queue.durable,
+            "workers": self.workers,
+            "running_here": running_here,
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "rejected": self.rejected,
+            "requeued": self.requeued,
+            **self.queue.counts(),
+        }
+
+
+def _create_queue():
+    if settings.JOB_QUEUE_BACKEND.lower() == "sqlite":
+        return SQLiteJobQueue(settings.JOB_QUEUE_SQLITE_PATH, settings.JOB_HISTORY_LIMIT)
+    return InMemoryJobQueue(settings.JOB_HISTORY_LIMIT)
+
+
+jobs = JobRunner(_create_queue(), settings.JOB_WORKERS)
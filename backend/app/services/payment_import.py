@@ -0,0 +1,408 @@
+"""
+Streaming bulk import of payment transactions from a CSV or Parquet file, for loading a
+lender's payment history without one add_payment_transaction request per row.
+
+Run from the backend folder:
+    python -m app.services.payment_import payments.csv [--rejects rejects.csv] [--no-user-check]
+    python -m app.services.payment_import payments.parquet --concurrency 8 --rebuild-rollups
+
+or upload the file to POST /imports/payments, which runs the import as a background job.
+
+Columns, by header name: user_id, due_date and amount_due are required; payment_date,
+is_on_time, loan_or_account_id and transaction_type are optional. Dates are YYYY-MM-DD
+(Parquet date and timestamp columns are fine too), user_id a version 4 UUID in its usual
+8-4-4-4-12 form, is_on_time true/false (or 1/0, yes/no, t/f, y/n, on/off) and left empty to
+derive it the way add_payment_transaction does: paid on or before the due date.
+
+The file is read IMPORT_CHUNK_ROWS rows at a time and each chunk is validated and converted
+with column-wise (Arrow) operations; rows for users that aren't in the users table are
+rejected too unless --no-user-check. Valid rows are inserted IMPORT_BATCH_ROWS at a time,
+IMPORT_CONCURRENCY batches in flight. Rejected rows, including those of a batch the store
+refused, go to the rejects CSV with their row number and the reason. Payment history
+rollups follow each insert (the stores' triggers); credit profiles and cached scores are
+updated once per user at the end rather than per batch. An import that's interrupted and
+run again inserts its rows twice.
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from app import crud
+from app.core import metrics
+from app.core.config import settings
+from app.core.events import notify_user_data_changed
+from app.services import credit_profiles
+from app.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ("user_id", "due_date", "amount_due")
+FORMATS = ("csv", "parquet")
+
+_UUID4 = r"^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[0-9a-f]{4}-[0-9a-f]{12}$"
+_DATE = r"^\d{4}-\d{2}-\d{2}$"
+_NUMBER = r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$"
+_MAX_AMOUNT = 1e10 # amount_due is numeric(12, 2) in the payments DB
+_TRUE = ["true", "1", "yes", "t", "y", "on"]
+_FALSE = ["false", "0", "no", "f", "n", "off"]
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows_read = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.users = 0
+        self.fraction = 0.0 # Of the file read so far
+        self.rejects_path: Optional[str] = None
+        self._started = time.perf_counter()
+
+    @property
+    def seconds(self) -> float:
+        return time.perf_counter() - self._started
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_read / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "rows_read": self.rows_read,
+            "inserted": self.inserted,
+            "rejected": self.rejected,
+            "users": self.users,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+            "rejects_path": self.rejects_path,
+        }
+
+
+def detect_format(path: str) -> str:
+    return "parquet" if path.lower().endswith((".parquet", ".pq")) else "csv"
+
+
+def _as_strings(batch: pa.RecordBatch) -> pa.Table:
+    # Every column as trimmed strings with "" as null, so CSV and Parquet input share one validation path
+    columns = {}
+    for name, column in zip(batch.schema.names, batch.columns):
+        if pa.types.is_timestamp(column.type):
+            column = pc.cast(column, pa.date32())
+        if not pa.types.is_string(column.type):
+            column = pc.cast(column, pa.string())
+        column = pc.utf8_trim_whitespace(column)
+        columns[name] = pc.if_else(pc.equal(column, ""), pa.scalar(None, pa.string()), column)
+    return pa.table(columns)
+
+
+def _read_chunks(path: str, file_format: str, chunk_rows: int) -> Iterator[Tuple[pa.Table, float]]:
+    """(chunk as strings, fraction of the file read) for each chunk."""
+    if file_format == "parquet":
+        parquet = pq.ParquetFile(path)
+        total, read = max(parquet.metadata.num_rows, 1), 0
+        for batch in parquet.iter_batches(batch_size=chunk_rows):
+            read += batch.num_rows
+            yield _as_strings(batch), read / total
+        return
+    with open(path, newline="") as f:
+        header = next(csv.reader(f), [])
+    size = max(os.path.getsize(path), 1)
+    with open(path, "rb") as f:
+        reader = pa_csv.open_csv(
+            f,
+            read_options=pa_csv.ReadOptions(block_size=max(chunk_rows * 128, 1 << 20)), # ~128 bytes a row
+            convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in header}),
+        )
+        for batch in reader:
+            yield _as_strings(batch), min(f.tell() / size, 1.0)
+
+
+def _column(chunk: pa.Table, name: str) -> pa.ChunkedArray:
+    if name in chunk.column_names:
+        return chunk.column(name)
+    return pa.chunked_array([pa.nulls(chunk.num_rows, pa.string())])
+
+
+def _parse_date(column: pa.ChunkedArray) -> Tuple[pa.ChunkedArray, pa.ChunkedArray]:
+    """(date32 values, mask of values present but not a date)."""
+    well_formed = pc.fill_null(pc.match_substring_regex(column, _DATE), False)
+    parsed = pc.cast(pc.strptime(pc.if_else(well_formed, column, pa.scalar(None, pa.string())), format="%Y-%m-%d", unit="s", error_is_null=True), pa.date32())
+    # strptime rolls impossible days over (2024-02-30 -> 2024-03-01); a real date formats back to itself
+    parsed = pc.if_else(pc.fill_null(pc.equal(pc.cast(parsed, pa.string()), column), False), parsed, pa.scalar(None, pa.date32()))
+    return parsed, pc.and_(pc.is_valid(column), pc.is_null(parsed))
+
+
+def _convert(chunk: pa.Table) -> Tuple[pa.Table, pa.ChunkedArray]:
+    """
+    (store-ready rows, per-row error or null) for a chunk of string columns. Applies the
+    schema's validation and add_payment_transaction's is_on_time rule column-wise.
+    """
+    user_id = pc.utf8_lower(_column(chunk, "user_id"))
+    due_date, bad_due_date = _parse_date(_column(chunk, "due_date"))
+    payment_date, bad_payment_date = _parse_date(_column(chunk, "payment_date"))
+
+    amount_text = _column(chunk, "amount_due")
+    numeric = pc.fill_null(pc.match_substring_regex(amount_text, _NUMBER), False)
+    amount_due = pc.cast(pc.if_else(numeric, amount_text, pa.scalar(None, pa.string())), pa.float64())
+    flag = pc.utf8_lower(_column(chunk, "is_on_time"))
+    is_true, is_false = pc.is_in(flag, pa.array(_TRUE)), pc.is_in(flag, pa.array(_FALSE))
+    given_on_time = pc.if_else(is_true, True, pc.if_else(is_false, False, pa.scalar(None, pa.bool_())))
+
+    checks = [
+        (pc.is_null(user_id), "user_id is required"),
+        (pc.invert(pc.match_substring_regex(user_id, _UUID4)), "user_id is not a version 4 UUID"),
+        (pc.is_null(_column(chunk, "due_date")), "due_date is required"),
+        (bad_due_date, "due_date is not a YYYY-MM-DD date"),
+        (bad_payment_date, "payment_date is not a YYYY-MM-DD date"),
+        (pc.is_null(amount_text), "amount_due is required"),
+        (pc.invert(numeric), "amount_due is not a number"),
+        (pc.greater_equal(pc.abs(amount_due), _MAX_AMOUNT), "amount_due is out of range"),
+        (pc.and_(pc.is_valid(flag), pc.is_null(given_on_time)), "is_on_time is not true or false"),
+    ]
+    error = pa.chunked_array([pa.nulls(chunk.num_rows, pa.string())])
+    for failed, message in checks:
+        error = pc.if_else(pc.and_(pc.is_null(error), pc.fill_null(failed, False)), message, error)
+
+    # Given flag wins; otherwise on time if paid on or before the due date, late if unpaid
+    is_on_time = pc.coalesce(given_on_time, pc.fill_null(pc.less_equal(payment_date, due_date), False))
+    rows = pa.table({
+        "user_id": user_id,
+        "loan_or_account_id": _column(chunk, "loan_or_account_id"),
+        "due_date": pc.cast(due_date, pa.string()),
+        "payment_date": pc.cast(payment_date, pa.string()),
+        "amount_due": amount_due,
+        "is_on_time": is_on_time,
+        "transaction_type": _column(chunk, "transaction_type"),
+    })
+    return rows, error
+
+
+class _UserCheck:
+    """Which user ids exist in the users table, remembered across chunks."""
+
+    def __init__(self):
+        self.known: set = set()
+        self.unknown: set = set()
+
+    def missing(self, user_ids: pa.ChunkedArray, candidates: pa.ChunkedArray) -> pa.ChunkedArray:
+        """Mask of rows (among candidates) whose user isn't in the users table. Raises RuntimeError if the read fails."""
+        unseen = [u for u in pc.unique(pc.filter(user_ids, candidates)).to_pylist() if u not in self.known and u not in self.unknown]
+        for start in range(0, len(unseen), 1000):
+            page = unseen[start:start + 1000]
+            found = crud.get_users_bulk([uuid.UUID(u) for u in page])
+            if found is None:
+                raise RuntimeError("Bulk user read failed; can't check that the file's users exist.")
+            found = {str(u) for u in found}
+            self.known.update(found)
+            self.unknown.update(u for u in page if u not in found)
+        return pc.fill_null(pc.and_(candidates, pc.is_in(user_ids, pa.array(list(self.unknown), pa.string()))), False)
+
+
+class _Rejects:
+    """Rejected rows, as read, plus row_number and error; the file is created on the first reject."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer: Optional[pa_csv.CSVWriter] = None
+        self._schema: Optional[pa.Schema] = None
+
+    def write(self, rows: pa.Table):
+        if rows.num_rows == 0:
+            return
+        if self._writer is None:
+            self._schema = rows.schema
+            self._writer = pa_csv.CSVWriter(self.path, self._schema)
+        self._writer.write_table(rows.select(self._schema.names).cast(self._schema))
+
+    @property
+    def written(self) -> bool:
+        return self._writer is not None
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _with_row_numbers(chunk: pa.Table, first_row: int) -> pa.Table:
+    return chunk.append_column("row_number", pa.array(range(first_row, first_row + chunk.num_rows), pa.int64()))
+
+
+def _user_counts(rows: pa.Table) -> pa.Table:
+    return rows.select(["user_id", "is_on_time"]).append_column(
+        "on_time", pc.cast(rows.column("is_on_time"), pa.int64())
+    ).group_by("user_id").aggregate([("on_time", "sum"), ("user_id", "count")])
+
+
+def _apply_user_counts(counts: Dict[str, List[int]], concurrency: int):
+    # What add_payment_transactions_bulk does per batch, once per user for the whole import
+    def apply(item):
+        user_id, (on_time, total) = uuid.UUID(item[0]), item[1]
+        credit_profiles.record_change(user_id, increments={"on_time_payments": on_time, "total_due_payments": total})
+        notify_user_data_changed(user_id)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(apply, counts.items()))
+
+
+def import_file(
+    path: str,
+    file_format: Optional[str] = None,
+    rejects_path: Optional[str] = None,
+    check_users: bool = True,
+    rebuild_rollups: bool = False,
+    chunk_rows: Optional[int] = None,
+    batch_rows: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    progress: Optional[Callable[[ImportStats], None]] = None,
+) -> ImportStats:
+    """
+    Imports every valid row of a CSV or Parquet file. Raises ValueError for a file that
+    can't be imported at all (unknown format, missing required columns).
+    """
+    file_format = file_format or detect_format(path)
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format '{file_format}'; expected one of {', '.join(FORMATS)}.")
+    chunk_rows = chunk_rows or settings.IMPORT_CHUNK_ROWS
+    batch_rows = batch_rows or settings.IMPORT_BATCH_ROWS
+    concurrency = concurrency or settings.IMPORT_CONCURRENCY
+    rejects = _Rejects(rejects_path or f"{path}.rejects.csv")
+    users = _UserCheck() if check_users else None
+    stats = ImportStats()
+    counts: Dict[str, List[int]] = {}
+    in_flight: Deque[Tuple[Future, pa.Table, pa.Table]] = deque()
+
+    def settle(future: Future, rows: pa.Table, original: pa.Table):
+        try:
+            inserted, reason = future.result(), "insert failed"
+        except Exception as e: # e.g. StoreUnavailable with the store's breaker open
+            inserted, reason = 0, f"insert failed: {e}"
+        if inserted:
+            stats.inserted += inserted
+            summary = _user_counts(rows)
+            for user_id, on_time, total in zip(*(summary.column(name).to_pylist() for name in ("user_id", "on_time_sum", "user_id_count"))):
+                user_counts = counts.setdefault(user_id, [0, 0])
+                user_counts[0] += on_time
+                user_counts[1] += total
+        else: # The store refused the whole batch (it's all or nothing)
+            stats.rejected += original.num_rows
+            rejects.write(original.append_column("error", pa.array([reason] * original.num_rows, pa.string())))
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="payment-import") as pool:
+            for chunk, fraction in _read_chunks(path, file_format, chunk_rows):
+                missing = [name for name in REQUIRED_COLUMNS if name not in chunk.column_names]
+                if missing:
+                    raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+                original = _with_row_numbers(chunk, stats.rows_read + 1)
+                stats.rows_read += chunk.num_rows
+                with metrics.timed("payment_import", "validate"):
+                    rows, error = _convert(chunk)
+                    if users is not None:
+                        unknown = users.missing(rows.column("user_id"), pc.is_null(error))
+                        error = pc.if_else(unknown, "user_id not found in User Database (Neon)", error)
+                    valid = pc.is_null(error)
+                    rejected = original.filter(pc.invert(valid))
+                    stats.rejected += rejected.num_rows
+                    rejects.write(rejected.append_column("error", pc.filter(error, pc.invert(valid))))
+                    rows, original = rows.filter(valid), original.filter(valid)
+
+                for start in range(0, rows.num_rows, batch_rows):
+                    while len(in_flight) >= 2 * concurrency: # Bounded: reading waits for the store
+                        settle(*in_flight.popleft())
+                    batch = rows.slice(start, batch_rows)
+                    in_flight.append((pool.submit(crud.insert_payment_records, batch.to_pylist()), batch, original.slice(start, batch_rows)))
+                while in_flight and in_flight[0][0].done():
+                    settle(*in_flight.popleft())
+                stats.fraction = fraction
+                if progress is not None:
+                    progress(stats)
+            while in_flight:
+                settle(*in_flight.popleft())
+    finally:
+        rejects.close()
+
+    stats.users = len(counts)
+    stats.rejects_path = rejects.path if rejects.written else None
+    with metrics.timed("payment_import", "apply_user_counts"):
+        _apply_user_counts(counts, concurrency)
+    if rebuild_rollups and counts:
+        user_ids = [uuid.UUID(u) for u in counts]
+        for start in range(0, len(user_ids), 1000):
+            crud.rebuild_payment_history_rollups(user_ids[start:start + 1000])
+    stats.fraction = 1.0
+    if progress is not None:
+        progress(stats)
+    return stats
+
+
+async def save_upload(body: AsyncIterator[bytes], file_format: str) -> str:
+    """
+    Streams an uploaded file to IMPORT_DIR and returns its path. Raises ValueError if it's
+    larger than IMPORT_MAX_UPLOAD_BYTES (nothing is kept).
+    """
+    os.makedirs(settings.IMPORT_DIR, exist_ok=True)
+    path = os.path.join(settings.IMPORT_DIR, f"{uuid.uuid4().hex}.{file_format}")
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            async for data in body:
+                size += len(data)
+                if size > settings.IMPORT_MAX_UPLOAD_BYTES:
+                    raise ValueError(f"Upload is larger than {settings.IMPORT_MAX_UPLOAD_BYTES} bytes.")
+                await asyncio.to_thread(f.write, data)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def _print_progress(stats: ImportStats):
+    print(
+        f"{stats.fraction:6.1%}  {stats.rows_read:>12,} read  {stats.inserted:>12,} inserted  "
+        f"{stats.rejected:>10,} rejected  {stats.rows_per_second:>10,.0f} rows/s",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--format", dest="file_format", choices=FORMATS, help="Default: from the file extension")
+    parser.add_argument("--rejects", dest="rejects_path", help="Rejected rows CSV (default: <path>.rejects.csv)")
+    parser.add_argument("--no-user-check", dest="check_users", action="store_false", help="Don't reject rows for users missing from the users table")
+    parser.add_argument("--rebuild-rollups", action="store_true", help="Recount the imported users' payment history rollups at the end")
+    parser.add_argument("--chunk-rows", type=int, default=settings.IMPORT_CHUNK_ROWS, help="Rows read and validated at a time")
+    parser.add_argument("--batch-rows", type=int, default=settings.IMPORT_BATCH_ROWS, help="Rows per insert")
+    parser.add_argument("--concurrency", type=int, default=settings.IMPORT_CONCURRENCY, help="Inserts in flight")
+    args = parser.parse_args()
+
+    get_storage().open()
+    try:
+        stats = import_file(
+            args.path, args.file_format, args.rejects_path, args.check_users, args.rebuild_rollups,
+            args.chunk_rows, args.batch_rows, args.concurrency, progress=_print_progress,
+        )
+    except ValueError as e:
+        print(f"Can't import {args.path}: {e}")
+        sys.exit(2)
+    print(f"Imported {stats.inserted:,} of {stats.rows_read:,} rows for {stats.users:,} users in {stats.seconds:.1f} s "
+          f"({stats.rows_per_second:,.0f} rows/s).")
+    if stats.rejects_path:
+        print(f"{stats.rejected:,} rejected rows written to {stats.rejects_path}")
+    sys.exit(1 if stats.rejected else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Verify or rebuild the per-user payment history rollups from raw payment_transactions.
+
+Run from the backend folder:
+    python -m app.services.payment_rollups verify [--user-id UUID ...]
+    python -m app.services.payment_rollups rebuild [--user-id UUID ...]
+
+`verify` prints every user whose counters have drifted and exits with status 1 if any did.
+"""
+import argparse
+import sys
+import uuid
+
+from app import crud
+
+
+def verify(user_ids=None) -> int:
+    drift = crud.get_payment_history_rollup_drift(user_ids)
+    for row in drift:
+        print(
+            f"{row['user_id']}: rollup on_time={row['rollup_on_time_payments']} total={row['rollup_total_due_payments']}"
+            f" | actual on_time={row['actual_on_time_payments']} total={row['actual_total_due_payments']}"
+        )
+    print(f"{len(drift)} user(s) with drifted payment history rollups.")
+    return len(drift)
+
+
+def rebuild(user_ids=None) -> int:
+    corrected = crud.rebuild_payment_history_rollups(user_ids)
+    print(f"Rebuilt payment history rollups; {corrected} user(s) corrected.")
+    return corrected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    parser.add_argument("--user-id", dest="user_ids", type=uuid.UUID, action="append", help="Limit to these users (repeatable)")
+    args = parser.parse_args()
+
+    if args.command == "verify":
+        sys.exit(1 if verify(args.user_ids) else 0)
+    rebuild(args.user_ids)
+
+
+if __name__ == "__main__":
+    main()
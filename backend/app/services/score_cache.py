@@ -0,0 +1,260 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.events import on_user_data_changed
+from app.schemas import ScoreCalculationResponse
+from app.services import score_models
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryScoreCacheBackend:
+    """
+    Per-process LRU with a TTL on every entry. Each uvicorn worker has its own copy, and so
+    its own write tokens: a sequence number bumped by every write this process sees.
+    """
+
+    blocking = False
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple[float, ScoreCalculationResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_seq = 0
+        self._last_write_seq: "OrderedDict[str, int]" = OrderedDict() # user key -> seq of its latest write
+        self._forgotten_write_seq = 0 # Highest seq pruned from _last_write_seq
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[ScoreCalculationResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def write_token(self, user_key: str) -> int:
+        with self._lock:
+            return self._write_seq
+
+    def record_write(self, user_key: str):
+        with self._lock:
+            self._write_seq += 1
+            self._last_write_seq[user_key] = self._write_seq
+            self._last_write_seq.move_to_end(user_key)
+            while len(self._last_write_seq) > 10000:
+                _, seq = self._last_write_seq.popitem(last=False)
+                self._forgotten_write_seq = max(self._forgotten_write_seq, seq)
+
+    def set(self, key: str, value: ScoreCalculationResponse, ttl: float, user_key: str, token: int) -> bool:
+        """Stores the entry unless the user's data was written after `token` was taken."""
+        with self._lock:
+            if self._last_write_seq.get(user_key, self._forgotten_write_seq) > token:
+                return False
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False) # Least recently used
+                self.evictions += 1
+            return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "evictions": self.evictions, "expirations": self.expirations}
+
+
+class RedisScoreCacheBackend:
+    """
+    Shared cache so every uvicorn worker sees the same hits and invalidations.
+    Expiry is handled by Redis; size is bounded by the server's maxmemory policy (use allkeys-lru).
+
+    The write tokens are shared too: each write stores a fresh random token under the user's
+    writes: key, and an entry is only stored (by a script, atomically) if that key still
+    holds the token read before the computation. A random token rather than a counter, so a
+    writes: key that expired or was evicted can't come back with the value a slow
+    computation read.
+    """
+
+    blocking = True
+    WRITE_TOKEN_TTL_SECONDS = 24 * 3600 # Longer than any computation
+
+    _SET_IF_UNCHANGED = """
+        if (redis.call('GET', KEYS[2]) or '') ~= ARGV[3] then return 0 end
+        redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+        return 1
+    """
+
+    def __init__(self, url: str, key_prefix: str = "iscore:"):
+        import redis # Only needed when SCORE_CACHE_BACKEND=redis
+        self._redis = redis.Redis.from_url(url)
+        self.key_prefix = key_prefix
+        self._set_if_unchanged = self._redis.register_script(self._SET_IF_UNCHANGED)
+
+    def _writes_key(self, user_key: str) -> str:
+        return f"{self.key_prefix}writes:{user_key}"
+
+    def get(self, key: str) -> Optional[ScoreCalculationResponse]:
+        raw = self._redis.get(self.key_prefix + key)
+        return ScoreCalculationResponse.model_validate_json(raw) if raw else None
+
+    def write_token(self, user_key: str) -> str:
+        raw = self._redis.get(self._writes_key(user_key))
+        return raw.decode() if raw else ""
+
+    def record_write(self, user_key: str):
+        self._redis.set(self._writes_key(user_key), uuid.uuid4().hex, ex=self.WRITE_TOKEN_TTL_SECONDS)
+
+    def set(self, key: str, value: ScoreCalculationResponse, ttl: float, user_key: str, token: str) -> bool:
+        keys = [self.key_prefix + key, self._writes_key(user_key)]
+        return bool(self._set_if_unchanged(keys=keys, args=[value.model_dump_json(), int(ttl * 1000), token]))
+
+    def delete(self, key: str) -> bool:
+        return bool(self._redis.delete(self.key_prefix + key))
+
+    def stats(self) -> Dict[str, Any]:
+        # Server-wide counters: they include any other keys the Redis instance holds
+        info = self._redis.info("stats")
+        return {"size": self._redis.dbsize(), "max_size": None, "evictions": info.get("evicted_keys"), "expirations": info.get("expired_keys")}
+
+
+class ScoreCache:
+    """
+    Caches ScoreCalculationResponse by user_id. Entries are dropped whenever crud writes
+    for that user (see app.core.events). A score computed while such a write was in
+    progress is not stored, so a write can't be undone by a slower read: begin() takes the
+    backend's write token for the user and set() only stores if it hasn't changed. With the
+    Redis backend that holds for writes made by any worker, with the in-memory one for the
+    writes of this process (which are the only ones that reach its entries anyway).
+
+    Entries are also keyed by the scoring model that produced them, so switching the active
+    model (app.services.score_models) makes the cached scores of the previous one unreachable.
+    """
+
+    STATS_COUNTERS = ("hits", "misses", "invalidations", "errors", "evictions", "expirations") # Only ever go up
+
+    def __init__(self, backend, ttl_seconds: float):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        # The counters are updated from threadpool threads (the Redis backend runs there) as well as the event loop
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    @property
+    def blocking(self) -> bool:
+        return bool(self.backend and self.backend.blocking)
+
+    @staticmethod
+    def _entry_key(user_id: uuid.UUID, model_version: str) -> str:
+        return f"{model_version}:{user_id}"
+
+    def get(self, user_id: uuid.UUID) -> Optional[ScoreCalculationResponse]:
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(self._entry_key(user_id, score_models.registry.active_version()))
+        except Exception as e:
+            logger.warning(f"Score cache get failed for user {user_id}: {e}", extra={"store": "score_cache", "operation": "get"})
+            metrics.record_error("score_cache", "get")
+            value = None
+            self._count("errors")
+        self._count("misses" if value is None else "hits")
+        return value
+
+    def begin(self, user_id: uuid.UUID) -> Optional[Any]:
+        """Token to pass to set(); taken before reading the data the score is computed from."""
+        if not self.enabled:
+            return None
+        try:
+            return self.backend.write_token(str(user_id))
+        except Exception as e:
+            logger.warning(f"Score cache begin failed for user {user_id}: {e}", extra={"store": "score_cache", "operation": "begin"})
+            metrics.record_error("score_cache", "begin")
+            self._count("errors")
+            return None # The result won't be cached
+
+    def set(self, user_id: uuid.UUID, value: ScoreCalculationResponse, token: Optional[Any]):
+        if not self.enabled or token is None:
+            return
+        try:
+            # Not stored if the data changed after we started reading it
+            self.backend.set(self._entry_key(user_id, value.model_version or score_models.registry.active_version()), value, self.ttl_seconds, str(user_id), token)
+        except Exception as e:
+            logger.warning(f"Score cache set failed for user {user_id}: {e}", extra={"store": "score_cache", "operation": "set"})
+            metrics.record_error("score_cache", "set")
+            self._count("errors")
+
+    def invalidate(self, user_id: uuid.UUID):
+        self._count("invalidations")
+        if not self.enabled:
+            return
+        try:
+            # The token first, so a computation that stores after the deletes below still sees the write
+            self.backend.record_write(str(user_id))
+            # Every loaded model's entry, so switching back to a model can't bring back a score from before this write
+            for model_version in score_models.registry.versions():
+                self.backend.delete(self._entry_key(user_id, model_version))
+        except Exception as e:
+            logger.warning(f"Score cache invalidation failed for user {user_id}: {e}", extra={"store": "score_cache", "operation": "invalidate"})
+            metrics.record_error("score_cache", "invalidate")
+            self._count("errors")
+
+    def stats(self) -> Dict[str, Any]:
+        backend_stats = {}
+        if self.enabled:
+            try:
+                backend_stats = self.backend.stats() # Outside the lock: with Redis it's a network call
+            except Exception as e:
+                logger.warning(f"Score cache stats failed: {e}", extra={"store": "score_cache", "operation": "stats"})
+                self._count("errors")
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": settings.SCORE_CACHE_BACKEND,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "errors": self.errors,
+                **backend_stats,
+            }
+
+
+def _create_backend():
+    backend = settings.SCORE_CACHE_BACKEND.lower()
+    if backend == "memory":
+        return InMemoryScoreCacheBackend(max_size=settings.SCORE_CACHE_MAX_SIZE)
+    if backend == "redis":
+        return RedisScoreCacheBackend(settings.SCORE_CACHE_REDIS_URL)
+    return None # "none" disables caching
+
+
+score_cache = ScoreCache(_create_backend(), ttl_seconds=settings.SCORE_CACHE_TTL_SECONDS)
+on_user_data_changed(score_cache.invalidate)
@@ -1,75 +1,97 @@
+from typing import Optional
+
 from app.schemas import AllUserDataResponse, ScoreComponent
-from app.core.config import settings
+from app.services import score_engine, score_history, score_models
+
+# The formulas live in score_engine, which scores whole columns of users at once, with the
+# weights and normalizers of a scoring model (score_models; the active one unless given).
+# These functions are the per-user API on top of it.
+
+def factor_columns(users_data: list[AllUserDataResponse]) -> dict:
+    # Missing components become zeros, which the engine scores as 0.0 just like the old None checks
+    on_time, total_due, used_credit, credit_limit, age, types_used = [], [], [], [], [], []
+    for data in users_data:
+        history = data.derived_payment_history
+        on_time.append(history.on_time_payments if history else 0)
+        total_due.append(history.total_due_payments if history else 0)
+        used_credit.append(data.debt_info.used_credit if data.debt_info else 0)
+        credit_limit.append(data.debt_info.credit_limit if data.debt_info else 0)
+        age.append(data.history_info.account_age_years if data.history_info else 0)
+        types_used.append(data.mix_info.credit_types_used if data.mix_info else 0)
+    return {
+        "on_time_payments": on_time, "total_due_payments": total_due,
+        "used_credit": used_credit, "credit_limit": credit_limit,
+        "account_age_years": age, "credit_types_used": types_used,
+    }
 
 def calculate_payment_history_score(data: AllUserDataResponse) -> float:
-    if not data.derived_payment_history or data.derived_payment_history.total_due_payments == 0:
-        return 0.0 
-    
     history = data.derived_payment_history
-    score = (history.on_time_payments / history.total_due_payments) * 100
-    return round(score, 2)
+    if not history:
+        return 0.0
+    _, raw = score_engine.payment_history_scores([history.on_time_payments], [history.total_due_payments])
+    return float(raw[0])
 
 def calculate_outstanding_debt_score(data: AllUserDataResponse) -> float:
-    if not data.debt_info or data.debt_info.credit_limit == 0:
-        return 0.0 # Or handle as an error/default
-    utilization = data.debt_info.used_credit / data.debt_info.credit_limit
-    score = (1 - utilization) * 100
-    return round(max(0, score), 2) # Ensure score isn't negative if utilization > 1
+    if not data.debt_info:
+        return 0.0
+    return float(score_models.active_model().score_columns(**factor_columns([data]))["debt_raw"][0])
 
 def calculate_credit_history_age_score(data: AllUserDataResponse) -> float:
-    if not data.history_info or settings.MAX_POSSIBLE_AGE_YEARS == 0:
+    if not data.history_info:
         return 0.0
-    score = (data.history_info.account_age_years / settings.MAX_POSSIBLE_AGE_YEARS) * 100
-    return round(min(100, score), 2) # Cap at 100% if age > max_possible_age
+    return float(score_models.active_model().score_columns(**factor_columns([data]))["history_raw"][0])
 
 def calculate_credit_mix_score(data: AllUserDataResponse) -> float:
-    if not data.mix_info or settings.TOTAL_SYSTEM_CREDIT_TYPES == 0:
+    if not data.mix_info:
         return 0.0
-    score = (data.mix_info.credit_types_used / settings.TOTAL_SYSTEM_CREDIT_TYPES) * 100
-    return round(score, 2)
+    return float(score_models.active_model().score_columns(**factor_columns([data]))["mix_raw"][0])
 
-def calculate_final_iscore(user_data: AllUserDataResponse):
-    components = []
+COMPONENTS = [
+    # (name, column prefix in score_engine output); weights come from the model, in this order
+    ("Payment History", "payment"),
+    ("Outstanding Debt", "debt"),
+    ("Credit History Age", "history"),
+    ("Credit Mix", "mix"),
+]
 
-    # 1. Payment History (35%)
-    payment_raw = calculate_payment_history_score(user_data) # This function is now updated
-    payment_weighted = payment_raw * 0.35
-    # The 'value' for ScoreComponent might be the on_time_payments / total_due_payments ratio
-    payment_metric_value = 0
-    if user_data.derived_payment_history and user_data.derived_payment_history.total_due_payments > 0:
-        payment_metric_value = user_data.derived_payment_history.on_time_payments / user_data.derived_payment_history.total_due_payments
-
-    components.append(ScoreComponent(
-        name="Payment History",
-        value=payment_metric_value, # Ratio or raw counts, depending on what you want to show
-        raw_score=payment_raw,
-        weight=0.35,
-        weighted_score=payment_weighted
-    ))
-    # 2. Outstanding Debt (30%)
-    debt_raw = calculate_outstanding_debt_score(user_data)
-    debt_weighted = debt_raw * 0.30
-    components.append(ScoreComponent(name="Outstanding Debt", value=user_data.debt_info.used_credit / user_data.debt_info.credit_limit if user_data.debt_info and user_data.debt_info.credit_limit else 0, raw_score=debt_raw, weight=0.30, weighted_score=debt_weighted))
-
-    # 3. Credit History Age (15%)
-    history_raw = calculate_credit_history_age_score(user_data)
-    history_weighted = history_raw * 0.15
-    components.append(ScoreComponent(name="Credit History Age", value=user_data.history_info.account_age_years if user_data.history_info else 0, raw_score=history_raw, weight=0.15, weighted_score=history_weighted))
-
-    # 4. Credit Mix (20%)
-    mix_raw = calculate_credit_mix_score(user_data)
-    mix_weighted = mix_raw * 0.20
-    components.append(ScoreComponent(name="Credit Mix", value=user_data.mix_info.credit_types_used if user_data.mix_info else 0, raw_score=mix_raw, weight=0.20, weighted_score=mix_weighted))
-
-    final_unscaled_score = sum(c.weighted_score for c in components)
-    
-    # Scale the score (e.g. 300-850)
-    score_range = settings.SCORE_MAX - settings.SCORE_MIN
-    scaled_score = settings.SCORE_MIN + (final_unscaled_score / 100) * score_range
-    
+def _result_at(columns: dict, i: int, model: score_engine.ScoringPlan) -> dict:
+    components = [
+        ScoreComponent(
+            name=name,
+            value=float(columns[f"{prefix}_value"][i]),
+            raw_score=float(columns[f"{prefix}_raw"][i]),
+            weight=weight,
+            weighted_score=float(columns[f"{prefix}_weighted"][i])
+        )
+        for (name, prefix), weight in zip(COMPONENTS, model.weights)
+    ]
     return {
         "components": components,
-        "final_unscaled_score": round(final_unscaled_score, 2),
-        "iscore": round(scaled_score, 2)
+        "final_unscaled_score": float(columns["final_unscaled_score"][i]),
+        "iscore": float(columns["iscore"][i]),
+        "model_version": model.version,
     }
 
+def calculate_final_iscore(user_data: AllUserDataResponse, record_history: bool = True, model: Optional[score_engine.ScoringPlan] = None):
+    model = model or score_models.active_model()
+    columns = model.score_columns(**factor_columns([user_data]))
+    if record_history:
+        score_history.record_scores([user_data], columns) # Appended to the on-disk score history (SCORE_HISTORY_ENABLED)
+    return _result_at(columns, 0, model)
+
+def calculate_provisional_iscore(user_data: AllUserDataResponse, stale_inputs: list[str]):
+    """
+    Same formulas, for data where `stale_inputs` are last-known values standing in for a
+    store that's down. The result is flagged provisional and kept out of the score history.
+    """
+    result = calculate_final_iscore(user_data, record_history=False)
+    return {**result, "provisional": True, "stale_inputs": stale_inputs}
+
+def calculate_final_iscore_batch(users_data: list[AllUserDataResponse]) -> list[dict]:
+    """Scores a batch of users in one vectorized pass; results are in the same order as the input."""
+    if not users_data:
+        return []
+    model = score_models.active_model()
+    columns = model.score_columns(**factor_columns(users_data))
+    score_history.record_scores(users_data, columns)
+    return [_result_at(columns, i, model) for i in range(len(users_data))]
@@ -0,0 +1,161 @@
+"""
+Columnar iScore engine. Every function takes NumPy arrays (one element per user)
+and reproduces score_calculator's formulas, clamping and 2-decimal rounding exactly.
+
+What varies between scoring models (weights, normalizers, scaling and optional piecewise
+curves) is held in a ScoringPlan, built once per model by app.services.score_models.
+"""
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+PAYMENT_HISTORY_WEIGHT = 0.35
+OUTSTANDING_DEBT_WEIGHT = 0.30
+CREDIT_HISTORY_AGE_WEIGHT = 0.15
+CREDIT_MIX_WEIGHT = 0.20
+
+_SPLITTER = 134217729.0 # 2**27 + 1, splits a double into two halves whose products with 100 are exact
+
+
+def round2(x) -> np.ndarray:
+    """
+    Vectorized equivalent of Python's round(x, 2).
+
+    np.round(x, 2) rounds fl(x * 100), which disagrees with Python on values like 1.005.
+    Python rounds the exact binary value half-to-even, so we recover the exact product
+    x * 100 as p + err (Dekker's TwoProduct) and decide the rounding direction from that.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    p = x * 100.0
+    c = _SPLITTER * x
+    x_hi = c - (c - x)
+    x_lo = x - x_hi
+    err = (x_hi * 100.0 - p) + x_lo * 100.0 # x * 100 == p + err exactly
+
+    floor = np.floor(p)
+    # Exact for |p| < 2**52. When it's non-zero it outweighs err, so only exact halves need err.
+    diff = (p - floor) - 0.5
+    round_up = (diff > 0) | ((diff == 0) & ((err > 0) | ((err == 0) & (np.fmod(floor, 2) != 0))))
+    rounded = (floor + round_up) / 100.0
+    rounded = np.where(rounded == 0, np.copysign(0.0, x), rounded) # round(-0.001, 2) is -0.0
+    return np.where(np.isfinite(x), rounded, x)
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    # numerator / denominator, with 0 where the denominator is 0
+    out = np.zeros(np.broadcast(numerator, denominator).shape, dtype=np.float64)
+    return np.divide(numerator, denominator, out=out, where=denominator != 0)
+
+
+def payment_history_scores(on_time_payments, total_due_payments):
+    """Returns (value, raw_score): the on-time ratio and its 0-100 score."""
+    on_time = np.asarray(on_time_payments, dtype=np.float64)
+    total_due = np.asarray(total_due_payments, dtype=np.float64)
+    value = _ratio(on_time, total_due)
+    raw = np.where(total_due != 0, round2(value * 100), 0.0)
+    return value, raw
+
+
+def outstanding_debt_scores(used_credit, credit_limit):
+    """Returns (value, raw_score): credit utilization and its 0-100 score (never negative)."""
+    used = np.asarray(used_credit, dtype=np.float64)
+    limit = np.asarray(credit_limit, dtype=np.float64)
+    utilization = _ratio(used, limit)
+    raw = np.where(limit != 0, round2(np.maximum((1 - utilization) * 100, 0.0)), 0.0)
+    return utilization, raw
+
+
+def credit_history_age_scores(account_age_years, max_possible_age_years: int):
+    """Returns (value, raw_score): account age in years and its 0-100 score (capped at 100)."""
+    age = np.asarray(account_age_years, dtype=np.float64)
+    if max_possible_age_years == 0:
+        return age, np.zeros_like(age)
+    return age, round2(np.minimum((age / max_possible_age_years) * 100, 100.0))
+
+
+def credit_mix_scores(credit_types_used, total_system_credit_types: int):
+    """Returns (value, raw_score): number of credit types used and its 0-100 score."""
+    types_used = np.asarray(credit_types_used, dtype=np.float64)
+    if total_system_credit_types == 0:
+        return types_used, np.zeros_like(types_used)
+    return types_used, round2((types_used / total_system_credit_types) * 100)
+
+
+def curve_scores(x, curve: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    """Piecewise-linear 0-100 score through the curve's (x, score) points, flat beyond the ends."""
+    xs, ys = curve
+    return round2(np.interp(np.asarray(x, dtype=np.float64), xs, ys))
+
+
+class ScoringPlan:
+    """
+    A scoring model's constants, resolved once: component weights (payment history,
+    outstanding debt, credit history age, credit mix), the age and credit-type normalizers,
+    the output scale and, optionally, (x, score) curves replacing the linear utilization and
+    account-age scores.
+    """
+
+    __slots__ = ("version", "weights", "max_age", "total_types", "score_min", "score_range", "utilization_curve", "age_curve")
+
+    def __init__(self, version: str, weights: Sequence[float], max_age: int, total_types: int, score_min: float, score_max: float,
+                 utilization_curve: Optional[Tuple[np.ndarray, np.ndarray]] = None, age_curve: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        self.version = version
+        self.weights = tuple(weights)
+        self.max_age = max_age
+        self.total_types = total_types
+        self.score_min = score_min
+        self.score_range = score_max - score_min
+        self.utilization_curve = utilization_curve
+        self.age_curve = age_curve
+
+    def score_columns(self, **columns) -> Dict[str, np.ndarray]:
+        return score_columns(**columns, plan=self)
+
+
+def default_plan(version: str = "v1") -> ScoringPlan:
+    """The original model: the weights above with the normalizers and scale from Settings."""
+    return ScoringPlan(
+        version,
+        (PAYMENT_HISTORY_WEIGHT, OUTSTANDING_DEBT_WEIGHT, CREDIT_HISTORY_AGE_WEIGHT, CREDIT_MIX_WEIGHT),
+        settings.MAX_POSSIBLE_AGE_YEARS, settings.TOTAL_SYSTEM_CREDIT_TYPES, settings.SCORE_MIN, settings.SCORE_MAX,
+    )
+
+
+def score_columns(on_time_payments, total_due_payments, used_credit, credit_limit,
+                  account_age_years, credit_types_used, plan: Optional[ScoringPlan] = None) -> Dict[str, np.ndarray]:
+    """
+    Scores every row at once with `plan` (default_plan() when not given). Returns per-component
+    `<name>_value`, `<name>_raw` and `<name>_weighted` arrays plus `final_unscaled_score` and
+    `iscore`, all rounded like calculate_final_iscore.
+    """
+    plan = plan or default_plan()
+    payment_weight, debt_weight, history_weight, mix_weight = plan.weights
+
+    payment_value, payment_raw = payment_history_scores(on_time_payments, total_due_payments)
+    debt_value, debt_raw = outstanding_debt_scores(used_credit, credit_limit)
+    if plan.utilization_curve is not None:
+        debt_raw = np.where(np.asarray(credit_limit, dtype=np.float64) != 0, curve_scores(debt_value, plan.utilization_curve), 0.0)
+    history_value, history_raw = credit_history_age_scores(account_age_years, plan.max_age)
+    if plan.age_curve is not None:
+        history_raw = curve_scores(history_value, plan.age_curve)
+    mix_value, mix_raw = credit_mix_scores(credit_types_used, plan.total_types)
+
+    payment_weighted = payment_raw * payment_weight
+    debt_weighted = debt_raw * debt_weight
+    history_weighted = history_raw * history_weight
+    mix_weighted = mix_raw * mix_weight
+
+    # Summed in the same order as the scalar path so floating point results are identical
+    final_unscaled = ((payment_weighted + debt_weighted) + history_weighted) + mix_weighted
+    scaled = plan.score_min + (final_unscaled / 100) * plan.score_range
+
+    return {
+        "payment_value": payment_value, "payment_raw": payment_raw, "payment_weighted": payment_weighted,
+        "debt_value": debt_value, "debt_raw": debt_raw, "debt_weighted": debt_weighted,
+        "history_value": history_value, "history_raw": history_raw, "history_weighted": history_weighted,
+        "mix_value": mix_value, "mix_raw": mix_raw, "mix_weighted": mix_weighted,
+        "final_unscaled_score": round2(final_unscaled),
+        "iscore": round2(scaled),
+    }
@@ -0,0 +1,49 @@
+"""
+Export every user's iScore as NDJSON, one line per user, in user_id order.
+
+Run from the backend folder:
+    python -m app.services.score_export --out scores.ndjson [--after USER_ID] [--page-size 500]
+
+Without --out the lines go to stdout. To resume an interrupted export, pass the user_id
+of the last line written as --after and append to the same file (--append).
+"""
+import argparse
+import asyncio
+import sys
+import uuid
+
+from app.services import iscore_service
+from app.storage import get_storage
+
+
+async def export(out, after_user_id=None, page_size=None) -> int:
+    written = 0
+    async for line in iscore_service.stream_score_export(after_user_id, page_size):
+        out.write(line)
+        written += 1
+    out.flush()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", help="Output file (default: stdout)")
+    parser.add_argument("--append", action="store_true", help="Append to --out instead of overwriting it")
+    parser.add_argument("--after", type=uuid.UUID, help="Resume after this user_id")
+    parser.add_argument("--page-size", type=int)
+    args = parser.parse_args()
+
+    out = open(args.out, "a" if args.append else "w") if args.out else sys.stdout
+    storage = get_storage()
+    storage.open()
+    try:
+        written = asyncio.run(export(out, args.after, args.page_size))
+    finally:
+        storage.close()
+        if out is not sys.stdout:
+            out.close()
+    print(f"Exported {written} user score line(s).", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
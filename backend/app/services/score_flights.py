@@ -0,0 +1,79 @@
+"""
+Single-flight coalescing of /iscore computations: concurrent requests for the same user
+that miss the result cache share one in-flight fetch and calculation instead of each
+doing every store read.
+
+The first request (the leader) starts the computation as its own task; requests for the
+same user arriving while it runs (followers) await that task. A write to the user's data
+detaches the flight, so requests arriving after the write start a new one rather than
+receiving a score computed from the data before it. Coalescing is per process (each
+uvicorn worker has its own flights), like the in-memory score cache.
+"""
+import asyncio
+import threading
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from app.core.config import settings
+from app.core.events import on_user_data_changed
+from app.schemas import ScoreCalculationResponse
+
+
+class ScoreFlights:
+    STATS_COUNTERS = ("leaders", "followers", "invalidations") # Only ever go up
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        # Writes notify from threadpool threads, so the table is shared with the event loop under a lock
+        self._lock = threading.Lock()
+        self._flights: Dict[uuid.UUID, Tuple[asyncio.AbstractEventLoop, "asyncio.Task[ScoreCalculationResponse]"]] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.invalidations = 0
+
+    async def run(self, user_id: uuid.UUID, compute: Callable[[], Awaitable[ScoreCalculationResponse]]) -> ScoreCalculationResponse:
+        """compute()'s result, shared with every concurrent call for the same user."""
+        if not self.enabled:
+            return await compute()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flight = self._flights.get(user_id)
+            if flight is not None and flight[0] is loop:
+                self.followers += 1
+                task = flight[1]
+            else:
+                self.leaders += 1
+                # Its own task, so one caller disconnecting doesn't cancel the others' result
+                task = loop.create_task(compute())
+                self._flights[user_id] = (loop, task)
+                task.add_done_callback(lambda done: self._finish(user_id, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, user_id: uuid.UUID, task: asyncio.Task):
+        with self._lock:
+            flight = self._flights.get(user_id)
+            if flight is not None and flight[1] is task: # Not already replaced after a write
+                del self._flights[user_id]
+        if not task.cancelled():
+            task.exception() # Marks it retrieved when every caller has gone away
+
+    def invalidate(self, user_id: uuid.UUID):
+        with self._lock:
+            if self._flights.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.leaders + self.followers
+            return {
+                "enabled": self.enabled,
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "coalesced_ratio": round(self.followers / requests, 4) if requests else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+score_flights = ScoreFlights(enabled=settings.SCORE_COALESCING_ENABLED)
+on_user_data_changed(score_flights.invalidate)
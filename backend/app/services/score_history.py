@@ -0,0 +1,196 @@
+"""
+Append-only history of every computed iScore, in fixed-width binary records that are read
+back through numpy memory maps, so queries only page in the days they touch.
+
+Layout: one file per UTC day in SCORE_HISTORY_DIR, named YYYY-MM-DD.bin, holding packed
+RECORD_DTYPE records (44 bytes, little-endian, no header):
+
+    user_hi, user_lo    uint64   the user's UUID as two big-endian halves
+    timestamp_us        int64    microseconds since the Unix epoch (UTC)
+    payment_history ... float32  the four raw component scores (0-100)
+    iscore              float32  the final, scaled score
+
+Each append is a single write() on a file opened with O_APPEND, so records from several
+workers never interleave. A reader sizes its map when it opens the file and ignores a
+trailing partial record.
+"""
+import logging
+import os
+import threading
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RECORD_DTYPE = np.dtype([
+    ("user_hi", "<u8"), ("user_lo", "<u8"),
+    ("timestamp_us", "<i8"),
+    ("payment_history", "<f4"), ("outstanding_debt", "<f4"), ("credit_history_age", "<f4"), ("credit_mix", "<f4"),
+    ("iscore", "<f4"),
+])
+COMPONENT_FIELDS = ("payment_history", "outstanding_debt", "credit_history_age", "credit_mix")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _split_uuid(user_id: uuid.UUID):
+    value = user_id.int
+    return value >> 64, value & 0xFFFFFFFFFFFFFFFF
+
+
+def _timestamp_us(moment: datetime) -> int:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - _EPOCH) // timedelta(microseconds=1)
+
+
+def _datetime(timestamp_us: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=int(timestamp_us))
+
+
+def _first_per_user(user_hi: np.ndarray, user_lo: np.ndarray) -> np.ndarray:
+    # Index of each user's first record; lexsort is stable, so ties keep their input order
+    order = np.lexsort((user_lo, user_hi))
+    hi, lo = user_hi[order], user_lo[order]
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = (hi[1:] != hi[:-1]) | (lo[1:] != lo[:-1])
+    return order[starts]
+
+
+class ScoreHistoryStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_day: Optional[date] = None
+        self.records_written = 0
+        self.errors = 0
+
+    def _path(self, day: date) -> str:
+        return os.path.join(self.directory, f"{day.isoformat()}.bin")
+
+    def _segment(self, day: date) -> np.ndarray:
+        # Read-only map of one day's records (empty when the day has none)
+        path = self._path(day)
+        try:
+            count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+        except FileNotFoundError:
+            count = 0
+        if count == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+
+    def append(self, user_ids: Sequence[uuid.UUID], columns: Dict[str, Any], computed_at: Optional[datetime] = None):
+        """
+        Records one score per user. `columns` is score_engine.score_columns output
+        (`<component>_raw` arrays and `iscore`), in the same order as `user_ids`.
+        """
+        if not user_ids:
+            return
+        computed_at = computed_at or datetime.now(timezone.utc)
+        records = np.empty(len(user_ids), dtype=RECORD_DTYPE)
+        halves = [_split_uuid(u) for u in user_ids]
+        records["user_hi"] = [hi for hi, _ in halves]
+        records["user_lo"] = [lo for _, lo in halves]
+        records["timestamp_us"] = _timestamp_us(computed_at)
+        for field, prefix in zip(COMPONENT_FIELDS, ("payment", "debt", "history", "mix")):
+            records[field] = columns[f"{prefix}_raw"]
+        records["iscore"] = columns["iscore"]
+        payload = records.tobytes()
+
+        day = computed_at.astimezone(timezone.utc).date()
+        try:
+            with metrics.timed("score_history", "append"), self._lock:
+                if self._file_day != day:
+                    if self._file is not None:
+                        self._file.close()
+                    os.makedirs(self.directory, exist_ok=True)
+                    self._file = open(self._path(day), "ab", buffering=0)
+                    self._file_day = day
+                self._file.write(payload)
+                self.records_written += len(user_ids)
+        except Exception as e: # Losing a history record must not fail the request that computed the score
+            logger.error(f"Error appending {len(user_ids)} score history record(s): {e}", extra={"store": "score_history", "operation": "append"})
+            metrics.record_error("score_history", "append")
+            self.errors += 1
+
+    def user_history(self, user_id: uuid.UUID, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """A user's recorded scores with start <= timestamp < end, oldest first."""
+        hi, lo = _split_uuid(user_id)
+        start_us, end_us = _timestamp_us(start), _timestamp_us(end)
+        points = []
+        with metrics.timed("score_history", "user_history"):
+            day, last_day = start.astimezone(timezone.utc).date(), end.astimezone(timezone.utc).date()
+            while day <= last_day:
+                segment = self._segment(day)
+                matches = segment[
+                    (segment["user_hi"] == hi) & (segment["user_lo"] == lo)
+                    & (segment["timestamp_us"] >= start_us) & (segment["timestamp_us"] < end_us)
+                ]
+                for record in matches:
+                    point = {"timestamp": _datetime(record["timestamp_us"])}
+                    point.update({field: round(float(record[field]), 2) for field in (*COMPONENT_FIELDS, "iscore")})
+                    points.append(point)
+                day += timedelta(days=1)
+        points.sort(key=lambda p: p["timestamp"]) # Already ordered unless the clock stepped back
+        return points
+
+    def percentiles(self, as_of: date, percentiles: Sequence[float], window_days: int) -> Dict[str, Any]:
+        """
+        Percentiles of every user's latest score recorded on or before `as_of` (UTC day),
+        looking back `window_days` days. Only the users' ids and one score each are held
+        in memory, not the records.
+        """
+        with metrics.timed("score_history", "percentiles"):
+            his, los, scores = [], [], []
+            for offset in range(window_days):
+                segment = self._segment(as_of - timedelta(days=offset)) # Newest day first
+                if not len(segment):
+                    continue
+                # Reversed so the first record per user is the day's last write
+                newest_first = segment[::-1]
+                first = _first_per_user(newest_first["user_hi"], newest_first["user_lo"])
+                his.append(newest_first["user_hi"][first])
+                los.append(newest_first["user_lo"][first])
+                scores.append(np.asarray(newest_first["iscore"][first], dtype=np.float64))
+            if not scores:
+                return {"as_of": as_of, "window_days": window_days, "users": 0, "percentiles": {}}
+            # Days were gathered newest first, so this keeps each user's newest day
+            latest = np.concatenate(scores)[_first_per_user(np.concatenate(his), np.concatenate(los))]
+            values = np.percentile(latest, percentiles)
+        return {
+            "as_of": as_of,
+            "window_days": window_days,
+            "users": int(len(latest)),
+            "percentiles": {f"p{q:g}": round(float(v), 2) for q, v in zip(percentiles, values)},
+        }
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file, self._file_day = None, None
+
+
+score_history = ScoreHistoryStore(settings.SCORE_HISTORY_DIR) if settings.SCORE_HISTORY_ENABLED else None
+
+
+def record_scores(users_data: Sequence[Any], columns: Dict[str, Any]):
+    """Called by score_calculator with each batch it scores; users without an id are skipped."""
+    if score_history is None:
+        return
+    user_ids, keep = [], []
+    for i, data in enumerate(users_data):
+        user = data.user_info or data.derived_payment_history
+        if user is not None:
+            user_ids.append(user.user_id)
+            keep.append(i)
+    if len(keep) < len(users_data):
+        columns = {name: np.asarray(values)[keep] for name, values in columns.items()}
+    score_history.append(user_ids, columns)
@@ -0,0 +1,224 @@
+"""
+Registry of versioned scoring models. A model is a schemas.ScoringModelConfig (weights,
+normalizers, output scale and optional piecewise curves) compiled once into a
+score_engine.ScoringPlan, which scores one user or whole arrays of users.
+
+"v1", the original formulas (score_engine's weights, normalizers and scale from Settings),
+is always available. More versions are JSON files in SCORE_MODELS_DIR, one model per
+*.json file, e.g.:
+
+    {"version": "v2", "description": "Steeper utilization penalty",
+     "weights": {"payment_history": 0.35, "outstanding_debt": 0.30, "credit_history_age": 0.15, "credit_mix": 0.20},
+     "max_account_age_years": 10, "total_credit_types": 4, "score_min": 300, "score_max": 850,
+     "utilization_curve": [[0, 100], [0.3, 80], [0.7, 30], [1, 0]]}
+
+Scores are computed with the active model: the version named in SCORE_MODELS_DIR/active
+if that file exists, else SCORE_MODEL_VERSION. The directory is checked for changes at
+most every SCORE_MODELS_RELOAD_SECONDS and reloaded without a restart; a file that fails
+to load is reported by GET /models and the version it held before (if any) keeps serving.
+"""
+import glob
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app import schemas
+from app.core.config import settings
+from app.services import score_engine
+
+logger = logging.getLogger(__name__)
+
+BUILTIN_VERSION = "v1"
+ACTIVE_FILE = "active"
+
+
+def builtin_config() -> schemas.ScoringModelConfig:
+    return schemas.ScoringModelConfig(
+        version=BUILTIN_VERSION,
+        description="Original formulas: linear component scores, weights 35/30/15/20.",
+        weights=schemas.ScoringModelWeights(
+            payment_history=score_engine.PAYMENT_HISTORY_WEIGHT, outstanding_debt=score_engine.OUTSTANDING_DEBT_WEIGHT,
+            credit_history_age=score_engine.CREDIT_HISTORY_AGE_WEIGHT, credit_mix=score_engine.CREDIT_MIX_WEIGHT,
+        ),
+        max_account_age_years=settings.MAX_POSSIBLE_AGE_YEARS,
+        total_credit_types=settings.TOTAL_SYSTEM_CREDIT_TYPES,
+        score_min=settings.SCORE_MIN,
+        score_max=settings.SCORE_MAX,
+    )
+
+
+def _compile_curve(name: str, points: Optional[List[Tuple[float, float]]]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    if points is None:
+        return None
+    xs = np.array([x for x, _ in points], dtype=np.float64)
+    ys = np.array([y for _, y in points], dtype=np.float64)
+    if len(xs) < 2 or np.any(np.diff(xs) <= 0):
+        raise ValueError(f"{name} needs at least two points with increasing x.")
+    if np.any((ys < 0) | (ys > 100)):
+        raise ValueError(f"{name} scores must be between 0 and 100.")
+    return xs, ys
+
+
+def compile_model(config: schemas.ScoringModelConfig) -> score_engine.ScoringPlan:
+    """Validates a model and resolves it into the plan the engine evaluates. Raises ValueError."""
+    weights = config.weights
+    weight_values = (weights.payment_history, weights.outstanding_debt, weights.credit_history_age, weights.credit_mix)
+    if any(w < 0 for w in weight_values) or not math.isclose(sum(weight_values), 1.0, abs_tol=1e-9):
+        raise ValueError("Weights must be non-negative and sum to 1.")
+    if config.max_account_age_years < 0 or config.total_credit_types < 0:
+        raise ValueError("max_account_age_years and total_credit_types can't be negative.")
+    if config.score_max <= config.score_min:
+        raise ValueError("score_max must be greater than score_min.")
+    return score_engine.ScoringPlan(
+        config.version, weight_values, config.max_account_age_years, config.total_credit_types, config.score_min, config.score_max,
+        utilization_curve=_compile_curve("utilization_curve", config.utilization_curve),
+        age_curve=_compile_curve("age_curve", config.age_curve),
+    )
+
+
+class ScoreModelRegistry:
+    def __init__(self, directory: str, default_version: str, reload_seconds: float):
+        self.directory = directory
+        self.default_version = default_version
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        builtin = builtin_config()
+        self._builtin = (builtin, "builtin", compile_model(builtin))
+        self._models: Dict[str, Tuple[schemas.ScoringModelConfig, str, score_engine.ScoringPlan]] = {}
+        self._errors: Dict[str, str] = {}
+        self._signature: Optional[tuple] = None
+        self._active_version = default_version
+        self._checked_at = float("-inf")
+        self.reloads = 0
+
+    def _directory_signature(self) -> tuple:
+        paths = sorted(glob.glob(os.path.join(self.directory, "*.json")) + glob.glob(os.path.join(self.directory, ACTIVE_FILE)))
+        signature = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError: # Removed while listing
+                continue
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def reload(self, force: bool = False) -> bool:
+        """Re-reads SCORE_MODELS_DIR if anything in it changed. Returns whether it was re-read."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = self._directory_signature()
+            if signature == self._signature and not force:
+                return False
+            models = {BUILTIN_VERSION: self._builtin}
+            errors: Dict[str, str] = {}
+            for path in sorted(glob.glob(os.path.join(self.directory, "*.json"))):
+                try:
+                    with open(path) as f:
+                        config = schemas.ScoringModelConfig.model_validate_json(f.read())
+                    if config.version in models: # Including the built-in v1
+                        raise ValueError(f"Version '{config.version}' is already defined by {models[config.version][1]}.")
+                    models[config.version] = (config, path, compile_model(config))
+                except Exception as e:
+                    errors[path] = str(e)
+                    # Keep serving whatever this file held before it broke
+                    for version, (old_config, old_path, plan) in self._models.items():
+                        if old_path == path and version not in models:
+                            models[version] = (old_config, old_path, plan)
+            active_version = self.default_version
+            try:
+                with open(os.path.join(self.directory, ACTIVE_FILE)) as f:
+                    active_version = f.read().strip() or self.default_version
+            except FileNotFoundError:
+                pass
+            if active_version not in models:
+                errors[ACTIVE_FILE] = f"Unknown model version '{active_version}'; keeping '{self._active_version}'."
+                active_version = self._active_version if self._active_version in models else BUILTIN_VERSION
+            for path, error in errors.items():
+                if self._errors.get(path) != error:
+                    logger.error(f"Scoring model config {path} rejected: {error}")
+            if active_version != self._active_version:
+                logger.warning(f"Active scoring model: {self._active_version} -> {active_version}")
+            self._models, self._errors, self._signature, self._active_version = models, errors, signature, active_version
+            self.reloads += 1
+            return True
+
+    def _maybe_reload(self):
+        # A stat() of the directory's files every reload_seconds, not on every score
+        if time.monotonic() - self._checked_at >= self.reload_seconds:
+            try:
+                self.reload()
+            except Exception as e: # Keep scoring with the models already loaded
+                logger.error(f"Error reloading scoring models from {self.directory}: {e}")
+
+    def active(self) -> score_engine.ScoringPlan:
+        self._maybe_reload()
+        return self._models[self._active_version][2]
+
+    def active_version(self) -> str:
+        self._maybe_reload()
+        return self._active_version
+
+    def versions(self) -> List[str]:
+        self._maybe_reload()
+        return list(self._models)
+
+    def get(self, version: str) -> Optional[score_engine.ScoringPlan]:
+        self._maybe_reload()
+        model = self._models.get(version)
+        return model[2] if model else None
+
+    def describe(self) -> schemas.ScoringModelsResponse:
+        self._maybe_reload()
+        with self._lock:
+            return schemas.ScoringModelsResponse(
+                active_version=self._active_version,
+                models=[
+                    schemas.ScoringModelInfo(config=config, source=source, active=version == self._active_version)
+                    for version, (config, source, _) in sorted(self._models.items())
+                ],
+                errors=dict(self._errors),
+            )
+
+
+registry = ScoreModelRegistry(settings.SCORE_MODELS_DIR, settings.SCORE_MODEL_VERSION, settings.SCORE_MODELS_RELOAD_SECONDS)
+
+
+def active_model() -> score_engine.ScoringPlan:
+    return registry.active()
+
+
+def _distribution(scores: np.ndarray, percentiles: List[float]) -> schemas.ScoreDistribution:
+    values = np.percentile(scores, percentiles)
+    return schemas.ScoreDistribution(
+        mean=round(float(scores.mean()), 2),
+        percentiles={f"p{q:g}": round(float(v), 2) for q, v in zip(percentiles, values)},
+    )
+
+
+def compare(baseline: score_engine.ScoringPlan, candidate: score_engine.ScoringPlan, columns: Dict[str, Any],
+            seed: int, percentiles: List[float] = (1, 10, 25, 50, 75, 90, 99)) -> schemas.ScoringModelComparison:
+    """Both models over the same input columns (score_engine.score_columns arguments), one vectorized pass each."""
+    started = time.perf_counter()
+    before = baseline.score_columns(**columns)["iscore"]
+    after = candidate.score_columns(**columns)["iscore"]
+    seconds = time.perf_counter() - started
+    change = after - before
+    return schemas.ScoringModelComparison(
+        baseline=baseline.version,
+        candidate=candidate.version,
+        users=len(before),
+        seed=seed,
+        baseline_scores=_distribution(before, list(percentiles)),
+        candidate_scores=_distribution(after, list(percentiles)),
+        mean_change=round(float(change.mean()), 2),
+        mean_absolute_change=round(float(np.abs(change).mean()), 2),
+        max_increase=round(float(max(change.max(), 0.0)), 2),
+        max_decrease=round(float(max(-change.min(), 0.0)), 2),
+        changed_share=round(float(np.count_nonzero(change) / len(change)), 4),
+        seconds=round(seconds, 4),
+    )
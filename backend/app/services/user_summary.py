@@ -0,0 +1,29 @@
+"""
+The cheap existence check behind GET /users/{user_id}/exists: whether a user exists, with
+their credit profile's version, in one keyed read instead of /iscore's five.
+
+The read goes to the user's credit profile when profiles are maintained, since it holds
+the username as well as the version. Only when there's no profile (profiles off, or a
+user loaded without one) does the users table decide, so an id nobody has created costs
+two reads then. No filter of known ids answers in front of Neon, as it couldn't see users
+created by other workers, app.services.synthetic_population or a direct SQL load without
+answering "doesn't exist" for them.
+"""
+import uuid
+
+from app import crud, schemas
+from app.services import credit_profiles, score_models
+
+
+def user_summary(user_id: uuid.UUID) -> schemas.UserSummary:
+    profile = credit_profiles.load(user_id) if credit_profiles.is_maintained() else None
+    if profile is not None and profile.username is not None:
+        return schemas.UserSummary(
+            user_id=user_id, exists=True, username=profile.username,
+            has_credit_data=credit_profiles.is_complete(profile), data_version=profile.version,
+            model_version=score_models.registry.active_version(),
+        )
+    user = crud.get_user(user_id) # No profile yet (or profiles off): the users table decides
+    if user is None:
+        return schemas.UserSummary(user_id=user_id, exists=False)
+    return schemas.UserSummary(user_id=user_id, exists=True, username=user.username)
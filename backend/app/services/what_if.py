@@ -0,0 +1,100 @@
+"""
+What-if simulation: a user's iScore over a grid of hypothetical changes to their current
+inputs (paying down used credit, more on-time payments, more credit types, older
+accounts), scored in one vectorized pass of the active scoring model.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app import schemas
+from app.core import metrics
+from app.core.config import settings
+from app.services import score_engine, score_models
+from app.services.score_calculator import factor_columns
+
+DEFAULT_ON_TIME_PAYMENTS = [0, 1, 2, 3, 6, 9, 12, 18, 24]
+DEFAULT_YEARS = [0, 1, 2, 3, 5]
+DEFAULT_PAYDOWN_STEPS = 10
+
+
+def _axis(values: Optional[list], default: list, cast) -> np.ndarray:
+    values = default if values is None else values
+    if any(v < 0 for v in values):
+        raise ValueError("What-if changes can't be negative.")
+    return np.unique(np.asarray([0, *values], dtype=cast)) # Sorted, with "no change" first
+
+
+def resolve_grid(grid: schemas.WhatIfGrid, current: Dict[str, float], model: score_engine.ScoringPlan) -> Dict[str, np.ndarray]:
+    used_credit = current["used_credit"]
+    missing_types = max(model.total_types - int(current["credit_types_used"]), 0)
+    return {
+        "paydown": _axis(grid.paydown, list(np.round(np.linspace(0, used_credit, DEFAULT_PAYDOWN_STEPS + 1), 2)), np.float64),
+        "additional_on_time_payments": _axis(grid.additional_on_time_payments, DEFAULT_ON_TIME_PAYMENTS, np.int64),
+        "additional_credit_types": _axis(grid.additional_credit_types, list(range(missing_types + 1)), np.int64),
+        "additional_years": _axis(grid.additional_years, DEFAULT_YEARS, np.int64),
+    }
+
+
+def _cheapest_improvements(cost: np.ndarray, gain: np.ndarray, top_k: int) -> np.ndarray:
+    # Indices of improvements none of which is beaten by a cheaper one: cheapest first, each gaining more than the last
+    candidates = np.flatnonzero(gain > 0)
+    order = candidates[np.lexsort((-gain[candidates], cost[candidates]))]
+    best_so_far = np.maximum.accumulate(gain[order])
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = gain[order][1:] > best_so_far[:-1]
+    return order[keep][:top_k]
+
+
+def simulate(user_data: schemas.AllUserDataResponse, request: schemas.WhatIfRequest) -> schemas.WhatIfResponse:
+    """Raises ValueError for a grid that is invalid or has more than WHAT_IF_MAX_SCENARIOS scenarios."""
+    model = score_models.active_model()
+    current = {name: values[0] for name, values in factor_columns([user_data]).items()}
+    axes = resolve_grid(request.grid, current, model)
+    shape = tuple(len(axis) for axis in axes.values())
+    scenarios = int(np.prod(shape))
+    if scenarios > settings.WHAT_IF_MAX_SCENARIOS:
+        raise ValueError(f"{scenarios} scenarios requested; at most {settings.WHAT_IF_MAX_SCENARIOS} per request.")
+
+    with metrics.timed("compute", "what_if"):
+        # One row per scenario, every combination of the four axes
+        paydown, on_time, types, years = np.meshgrid(*axes.values(), indexing="ij")
+        paydown, on_time, types, years = paydown.ravel(), on_time.ravel(), types.ravel(), years.ravel()
+        paid_down = np.minimum(paydown, current["used_credit"])
+        columns = model.score_columns(
+            on_time_payments=current["on_time_payments"] + on_time,
+            total_due_payments=current["total_due_payments"] + on_time,
+            used_credit=current["used_credit"] - paid_down,
+            credit_limit=np.full(scenarios, current["credit_limit"], dtype=np.float64),
+            account_age_years=current["account_age_years"] + years,
+            # New credit types stop counting once every type is used
+            credit_types_used=np.minimum(current["credit_types_used"] + types, max(model.total_types, current["credit_types_used"])),
+        )
+        iscores = columns["iscore"]
+        current_iscore = float(iscores[0]) # Scenario 0 is "no change" on every axis
+        gain = score_engine.round2(iscores - current_iscore)
+        costs = request.costs
+        cost = score_engine.round2(
+            paid_down / 1000 * costs.per_1000_paid_down + on_time * costs.per_on_time_payment
+            + types * costs.per_credit_type + years * costs.per_year
+        )
+        best = _cheapest_improvements(cost, gain, max(request.top_k, 0))
+
+    improvements: List[schemas.WhatIfScenario] = [
+        schemas.WhatIfScenario(
+            paydown=float(paid_down[i]), additional_on_time_payments=int(on_time[i]),
+            additional_credit_types=int(types[i]), additional_years=int(years[i]),
+            iscore=float(iscores[i]), gain=float(gain[i]), cost=float(cost[i]),
+        )
+        for i in best
+    ]
+    user = user_data.user_info or user_data.derived_payment_history
+    return schemas.WhatIfResponse(
+        user_id=user.user_id,
+        model_version=model.version,
+        current_iscore=current_iscore,
+        axes=schemas.WhatIfGrid(**{name: axis.tolist() for name, axis in axes.items()}),
+        iscores=iscores.reshape(shape).tolist(),
+        scenarios=scenarios,
+        improvements=improvements,
+    )
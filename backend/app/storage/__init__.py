@@ -0,0 +1,37 @@
+import threading
+from typing import Optional
+
+from app.core.config import settings
+from app.storage.base import StorageBackend
+
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+
+def _create_storage() -> StorageBackend:
+    backend = settings.STORAGE_BACKEND.lower()
+    if backend == "sqlite":
+        from app.storage.sqlite import SQLiteStorage
+        return SQLiteStorage(settings.SQLITE_PATH)
+    if backend == "remote":
+        from app.storage.remote import RemoteStorage
+        return RemoteStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND '{settings.STORAGE_BACKEND}'. Use 'remote' or 'sqlite'.")
+
+
+def get_storage() -> StorageBackend:
+    """The backend selected by STORAGE_BACKEND, created on first use."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = _create_storage()
+    return _storage
+
+
+def set_storage(storage: Optional[StorageBackend]) -> Optional[StorageBackend]:
+    """Swaps in another backend (e.g. SQLiteStorage(":memory:") in tests); returns the previous one."""
+    global _storage
+    with _storage_lock:
+        previous, _storage = _storage, storage
+    return previous
@@ -0,0 +1,178 @@
+import logging
+import sys
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.core import metrics, resilience
+from app.schemas import (
+    UserCreate, UserResponse,
+    PaymentTransactionCreate, PaymentTransactionResponse, DerivedPaymentHistory,
+    DebtData, HistoryData, MixData, CreditProfile
+)
+
+logger = logging.getLogger("app.storage")
+
+# Columns of a credit profile that writes may set directly (see apply_credit_profile_change)
+CREDIT_PROFILE_FIELDS = ("username", "email", "user_created_at", "used_credit", "credit_limit", "account_age_years", "credit_types_used")
+CREDIT_PROFILE_COUNTERS = ("on_time_payments", "total_due_payments")
+
+
+class StorageBackend(ABC):
+    """
+    Where users and their credit data live. crud.py calls these methods and adds what's
+    common to every backend on top (credit profile upkeep, change notifications, data generation).
+
+    Reads return None (bulk: a dict without the unknown ids) for missing rows. Every method
+    is wrapped in resilience.guard: a failed read raises resilience.StoreUnavailable, and
+    so does any call while the store's circuit breaker is open. A failed write is logged and
+    returns None (bulk insert: []), except for create_user, the rollup maintenance methods
+    and save_credit_profiles, which raise.
+    """
+
+    name: str # Label for metrics and logs
+
+    @abstractmethod
+    def create_user(self, user: UserCreate) -> Optional[UserResponse]: ...
+
+    @abstractmethod
+    def get_user(self, user_id: uuid.UUID) -> Optional[UserResponse]: ...
+
+    @abstractmethod
+    def get_users_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, UserResponse]]: ...
+
+    @abstractmethod
+    def list_users_page(self, after_user_id: Optional[uuid.UUID], limit: int) -> List[UserResponse]:
+        """Up to `limit` users ordered by user_id, starting after `after_user_id` (from the start when None)."""
+
+    @abstractmethod
+    def add_payment_transaction(self, transaction: PaymentTransactionCreate) -> Optional[PaymentTransactionResponse]: ...
+
+    @abstractmethod
+    def add_payment_transactions_bulk(self, transactions: List[PaymentTransactionCreate]) -> List[dict]:
+        """Inserts all rows or none; returns the inserted rows as plain dicts."""
+
+    @abstractmethod
+    def insert_payment_records(self, records: List[dict]) -> int:
+        """
+        Inserts rows that are already store-ready (payment_transaction_record's fields plus
+        loan_or_account_id and transaction_type) without reading them back. All or none;
+        returns how many were inserted, 0 if the insert failed.
+        """
+
+    @abstractmethod
+    def get_payment_transactions_for_user(self, user_id: uuid.UUID) -> List[PaymentTransactionResponse]: ...
+
+    @abstractmethod
+    def get_derived_payment_history(self, user_id: uuid.UUID) -> Optional[DerivedPaymentHistory]: ...
+
+    @abstractmethod
+    def get_derived_payment_history_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, DerivedPaymentHistory]]:
+        """Every requested UUID4 gets an entry, 0/0 when they have no transactions."""
+
+    @abstractmethod
+    def get_payment_history_rollup_drift(self, user_ids: Optional[List[uuid.UUID]] = None) -> List[dict]: ...
+
+    @abstractmethod
+    def rebuild_payment_history_rollups(self, user_ids: Optional[List[uuid.UUID]] = None) -> int: ...
+
+    @abstractmethod
+    def create_or_update_history_data(self, data: HistoryData) -> Optional[HistoryData]: ...
+
+    @abstractmethod
+    def get_history_data(self, user_id: uuid.UUID) -> Optional[HistoryData]: ...
+
+    @abstractmethod
+    def get_history_data_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, HistoryData]]: ...
+
+    @abstractmethod
+    def create_or_update_debt_data(self, data: DebtData) -> Optional[DebtData]: ...
+
+    @abstractmethod
+    def get_debt_data(self, user_id: uuid.UUID) -> Optional[DebtData]: ...
+
+    @abstractmethod
+    def get_debt_data_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, DebtData]]: ...
+
+    @abstractmethod
+    def create_or_update_mix_data(self, data: MixData) -> Optional[MixData]: ...
+
+    @abstractmethod
+    def get_mix_data(self, user_id: uuid.UUID) -> Optional[MixData]: ...
+
+    @abstractmethod
+    def get_mix_data_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, MixData]]: ...
+
+    @abstractmethod
+    def get_credit_profile(self, user_id: uuid.UUID) -> Optional[CreditProfile]: ...
+
+    @abstractmethod
+    def get_credit_profiles_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, CreditProfile]]: ...
+
+    @abstractmethod
+    def apply_credit_profile_change(self, user_id: uuid.UUID, fields: Dict[str, Any], increments: Dict[str, int], stale: bool = False) -> Optional[CreditProfile]:
+        """
+        Atomically sets `fields`, adds `increments` to the counters and bumps the version,
+        returning the updated row. A user without a profile gets a stale one holding just
+        these values. Returns None if the write failed.
+        """
+
+    @abstractmethod
+    def save_credit_profiles(self, profiles: List[CreditProfile], expected_versions: List[Optional[int]]) -> int:
+        """
+        Writes whole profiles as not stale, keeping their version. Each one is only written
+        if the stored version still equals its expected version (None: no profile yet), so
+        a concurrent change is never overwritten. Returns how many were written.
+        """
+
+    def open(self):
+        """Called by the app lifespan before serving."""
+
+    def warm_up(self):
+        """Connects ahead of the first request (DATASTORE_WARMUP); failures are logged, not raised."""
+
+    @abstractmethod
+    def check_health(self) -> Dict[str, Dict[str, Any]]:
+        """Per-store {"status": "ok" | "error" | "timeout", ...} for /health/ready; never raises."""
+
+    def close(self):
+        pass
+
+
+def payment_transaction_record(transaction: PaymentTransactionCreate) -> dict:
+    # Application logic to determine is_on_time before insertion
+    is_on_time_calculated = False
+    if transaction.payment_date is not None:
+        if transaction.payment_date <= transaction.due_date:
+            is_on_time_calculated = True
+    # If transaction.is_on_time is already provided, use that, otherwise use calculated.
+    final_is_on_time = transaction.is_on_time if transaction.is_on_time is not None else is_on_time_calculated
+
+    return {
+        "user_id": str(transaction.user_id),
+        "due_date": transaction.due_date.isoformat(),
+        "payment_date": transaction.payment_date.isoformat() if transaction.payment_date else None,
+        "amount_due": transaction.amount_due,
+        "is_on_time": final_is_on_time
+    }
+
+
+def uuid4_ids(user_ids: Iterable[str]) -> List[str]:
+    # The ids a store can hold: user ids are UUID4s (schemas), so any other UUID can't match a row
+    return [u for u in user_ids if uuid.UUID(u).version == 4]
+
+
+def store_error(store: str, operation: str, message: str):
+    # For failures a backend handles itself (returning None/[]); ones that propagate are counted by metrics.instrument.
+    # Called from the except block handling the failure, so that's the exception in flight
+    metrics.record_error(store, operation)
+    if resilience.is_store_failure(sys.exc_info()[1]):
+        resilience.note_failure(operation) # Counts against the store's circuit breaker; a failed read becomes StoreUnavailable
+    logger.error(message, extra={"store": store, "operation": operation})
+
+
+def credit_profile_record(profile: CreditProfile) -> dict:
+    # Column values for a whole-profile write; backends encode `components` (a list of dicts) as JSON
+    record = profile.model_dump(exclude={"version", "stale", "updated_at"})
+    record["user_id"] = str(profile.user_id)
+    return record
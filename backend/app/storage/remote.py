@@ -0,0 +1,466 @@
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+import psycopg2
+from fastapi import HTTPException
+from psycopg2.extras import Json, RealDictCursor
+from postgrest import ReturnMethod
+
+from app.core import datastores, metrics, resilience
+from app.core.neon_pool import neon_connection, neon_pool
+from app.schemas import (
+    UserCreate, UserResponse,
+    PaymentTransactionCreate, PaymentTransactionResponse, DerivedPaymentHistory,
+    DebtData, HistoryData, MixData, CreditProfile
+)
+from app.storage.base import (
+    CREDIT_PROFILE_COUNTERS, CREDIT_PROFILE_FIELDS, StorageBackend,
+    credit_profile_record, payment_transaction_record, store_error, uuid4_ids
+)
+
+logger = logging.getLogger(__name__)
+
+_IN_FILTER_CHUNK = 200 # ids per PostgREST in_() filter, keeps request URLs well under proxy limits
+
+
+def _select_all_pages(build_query, page_size: int = 1000) -> List[dict]:
+    # PostgREST caps rows per response, so page through with range() until a short page comes back
+    rows, start = [], 0
+    while True:
+        page = build_query().range(start, start + page_size - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        start += page_size
+
+
+class RemoteStorage(StorageBackend):
+    """
+    The five managed stores: users (and the credit_profiles read model) in Neon, payment
+    transactions in Supabase 1, history in Supabase 2, debt and credit mix in two MongoDB deployments.
+    """
+
+    name = "remote"
+
+    def open(self):
+        neon_pool.open() # Sized from NEON_POOL_MIN_SIZE / NEON_POOL_MAX_SIZE
+
+    def warm_up(self):
+        datastores.warm_up()
+
+    def check_health(self) -> Dict[str, Dict[str, Any]]:
+        return datastores.check_all()
+
+    def close(self):
+        datastores.close_all()
+        neon_pool.close()
+
+    @resilience.guard("neon")
+    @metrics.instrument("neon", "create_user")
+    def create_user(self, user: UserCreate) -> Optional[UserResponse]:
+        try:
+            with neon_connection() as conn:
+                try:
+                    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                        cur.execute(
+                            "INSERT INTO users (username, email) VALUES (%s, %s) RETURNING *;",
+                            (user.username, user.email)
+                        )
+                        new_user_data = cur.fetchone()
+                        conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            if new_user_data:
+                return UserResponse(**new_user_data)
+            logger.critical("User insert returned data but fetchone() was None.", extra={"store": "neon", "operation": "create_user"})
+            raise HTTPException(status_code=500, detail="Failed to retrieve user after creation.") # Use status_code for consistency here
+        except psycopg2.Error as e:
+            logger.error(f"Neon DB Error creating user: pgcode={e.pgcode}, error={e.pgerror}, diag={e.diag}", extra={"store": "neon", "operation": "create_user", "pgcode": e.pgcode})
+            if hasattr(e, 'pgcode') and e.pgcode == '23505': # Unique violation
+                error_detail = "Username or email already exists."
+                raise HTTPException(status_code=400, detail=error_detail) 
+            # For other database errors
+            raise HTTPException(status_code=500, detail=f"A database error occurred (pgcode: {e.pgcode}).") # Correct for new HTTPException instance
+        except HTTPException: # Re-raise if it's already an HTTPException
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error creating user in Neon DB: {type(e).__name__} - {e}", extra={"store": "neon", "operation": "create_user"})
+            raise HTTPException(status_code=500, detail="An unexpected error occurred while creating the user.") # Correct for new HTTPException instance
+        return None
+
+    @resilience.guard("neon", read=True)
+    @metrics.instrument("neon", "get_user")
+    def get_user(self, user_id: uuid.UUID) -> Optional[UserResponse]:
+        try:
+            with neon_connection() as conn: # Borrowed from the pool, returned on exit
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("SELECT * FROM users WHERE user_id = %s;", (str(user_id),)) # Querying Neon
+                    user_data = cur.fetchone()
+            if user_data:
+                return UserResponse(**user_data)
+            return None # Returns None if no user with that ID is found
+        except Exception as e:
+            store_error("neon", "get_user", f"Error getting user from Neon DB: {e}")
+            return None
+
+    @resilience.guard("neon", read=True)
+    @metrics.instrument("neon", "get_users_bulk")
+    def get_users_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, UserResponse]]:
+        """
+        Looks up many users in one Neon query. Returns a dict keyed by user_id
+        (unknown ids are simply absent), or None if the query failed.
+        """
+        ids = tuple(str(u) for u in user_ids)
+        if not ids:
+            return {}
+        try:
+            with neon_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("SELECT * FROM users WHERE user_id IN %s;", (ids,))
+                    rows = cur.fetchall()
+            return {uuid.UUID(str(row["user_id"])): UserResponse(**row) for row in rows}
+        except Exception as e:
+            store_error("neon", "get_users_bulk", f"Error bulk-getting users from Neon DB: {e}")
+            return None
+
+    @resilience.guard("neon", read=True)
+    @metrics.instrument("neon", "list_users_page")
+    def list_users_page(self, after_user_id: Optional[uuid.UUID], limit: int) -> List[UserResponse]:
+        """
+        Keyset pagination over users ordered by user_id: returns up to `limit` users whose
+        user_id sorts after `after_user_id` (from the start when it's None).
+        """
+        with neon_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                if after_user_id is None:
+                    cur.execute("SELECT * FROM users ORDER BY user_id LIMIT %s;", (limit,))
+                else:
+                    cur.execute("SELECT * FROM users WHERE user_id > %s ORDER BY user_id LIMIT %s;", (str(after_user_id), limit))
+                rows = cur.fetchall()
+        return [UserResponse(**row) for row in rows]
+
+    @resilience.guard("payments_db")
+    @metrics.instrument("payments_db", "add_payment_transaction")
+    def add_payment_transaction(self, transaction: PaymentTransactionCreate) -> Optional[PaymentTransactionResponse]:
+        try:
+            record = payment_transaction_record(transaction)
+            response = datastores.payments_db.client.table("payment_transactions").insert(record).execute()
+            if response.data:
+                return PaymentTransactionResponse(**response.data[0])   
+            return None
+        except Exception as e:
+            store_error("payments_db", "add_payment_transaction", f"Error adding payment transaction: {e}")
+            return None
+
+    @resilience.guard("payments_db")
+    @metrics.instrument("payments_db", "add_payment_transactions_bulk")
+    def add_payment_transactions_bulk(self, transactions: List[PaymentTransactionCreate]) -> List[dict]:
+        """
+        Inserts many transactions in a single PostgREST request. Returns the inserted rows
+        as plain dicts, or [] if the insert failed (it's all-or-nothing).
+        """
+        if not transactions:
+            return []
+        try:
+            records = [payment_transaction_record(t) for t in transactions]
+            response = datastores.payments_db.client.table("payment_transactions").insert(records).execute()
+        except Exception as e:
+            store_error("payments_db", "add_payment_transactions_bulk", f"Error bulk-adding {len(transactions)} payment transactions: {e}")
+            return []
+        return response.data or []
+
+    @resilience.guard("payments_db")
+    @metrics.instrument("payments_db", "insert_payment_records")
+    def insert_payment_records(self, records: List[dict]) -> int:
+        if not records:
+            return 0
+        try:
+            # returning=minimal: PostgREST answers 201 with no body instead of echoing every row back
+            datastores.payments_db.client.table("payment_transactions").insert(records, returning=ReturnMethod.minimal).execute()
+        except Exception as e:
+            store_error("payments_db", "insert_payment_records", f"Error inserting {len(records)} payment records: {e}")
+            return 0
+        return len(records)
+
+    @resilience.guard("payments_db", read=True)
+    @metrics.instrument("payments_db", "get_payment_transactions")
+    def get_payment_transactions_for_user(self, user_id: uuid.UUID) -> List[PaymentTransactionResponse]:
+        try:
+            response = datastores.payments_db.client.table("payment_transactions").select("*").eq("user_id", str(user_id)).order("due_date", desc=False).execute()
+            if response.data:
+                return [PaymentTransactionResponse(**item) for item in response.data]
+            return []
+        except Exception as e:
+            store_error("payments_db", "get_payment_transactions", f"Error getting payment transactions for user {user_id}: {e}")
+            return []
+
+    def _payment_history_summaries(self, user_ids: List[str]) -> Dict[uuid.UUID, DerivedPaymentHistory]:
+        # Counts come from payment_history_rollups (migrations/payments_db), which triggers keep in
+        # step with payment_transactions, so this is a primary-key lookup. No row means 0/0.
+        user_ids = uuid4_ids(user_ids) # Other ids get no entry, as no user can have them
+        summaries = {uuid.UUID(u): DerivedPaymentHistory(user_id=uuid.UUID(u), on_time_payments=0, total_due_payments=0) for u in user_ids}
+        for start in range(0, len(user_ids), _IN_FILTER_CHUNK):
+            response = datastores.payments_db.client.table("payment_history_rollups").select("user_id,on_time_payments,total_due_payments").in_("user_id", user_ids[start:start + _IN_FILTER_CHUNK]).execute()
+            for row in response.data or []:
+                summaries[uuid.UUID(row["user_id"])] = DerivedPaymentHistory(**row)
+        return summaries
+
+    @resilience.guard("payments_db", read=True)
+    @metrics.instrument("payments_db", "get_payment_history")
+    def get_derived_payment_history(self, user_id: uuid.UUID) -> Optional[DerivedPaymentHistory]:
+        """
+        Aggregated payment history for scoring. Only the two counts come back over the wire;
+        use get_payment_transactions_for_user when the individual rows are needed.
+        """
+        try:
+            return self._payment_history_summaries([str(user_id)]).get(user_id)
+        except Exception as e:
+            store_error("payments_db", "get_payment_history", f"Error getting payment history summary for user {user_id}: {e}")
+            return None
+
+    @resilience.guard("payments_db", read=True)
+    @metrics.instrument("payments_db", "get_payment_history_bulk")
+    def get_derived_payment_history_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, DerivedPaymentHistory]]:
+        """
+        Bulk version of get_derived_payment_history. Every requested UUID4 gets an entry
+        (0/0 when they have no transactions); None means the query failed.
+        """
+        try:
+            return self._payment_history_summaries([str(u) for u in user_ids])
+        except Exception as e:
+            store_error("payments_db", "get_payment_history_bulk", f"Error bulk-getting payment history summaries: {e}")
+            return None
+
+    @resilience.guard("payments_db", read=True)
+    @metrics.instrument("payments_db", "rollup_drift")
+    def get_payment_history_rollup_drift(self, user_ids: Optional[List[uuid.UUID]] = None) -> List[dict]:
+        """Users whose rollup counters disagree with their raw transactions (all users if user_ids is None)."""
+        params = {"p_user_ids": [str(u) for u in user_ids] if user_ids else None}
+        response = datastores.payments_db.client.rpc("payment_history_rollup_drift", params).execute()
+        return response.data or []
+
+    @resilience.guard("payments_db")
+    @metrics.instrument("payments_db", "rebuild_rollups")
+    def rebuild_payment_history_rollups(self, user_ids: Optional[List[uuid.UUID]] = None) -> int:
+        """Recomputes rollups from raw transactions. Returns the number of users that were corrected."""
+        params = {"p_user_ids": [str(u) for u in user_ids] if user_ids else None}
+        response = datastores.payments_db.client.rpc("rebuild_payment_history_rollups", params).execute()
+        return int(response.data or 0)
+
+    @resilience.guard("history_db")
+    @metrics.instrument("history_db", "upsert_history")
+    def create_or_update_history_data(self, data: HistoryData) -> Optional[HistoryData]:
+        try:
+            record = {
+                "user_id": str(data.user_id),
+                "account_age_years": data.account_age_years,
+                "last_updated": datetime.now(timezone.utc).isoformat()
+            }
+            response = datastores.history_db.client.table("history_data").upsert(record, on_conflict="user_id").execute() 
+
+            if response.data:
+                res_data = response.data[0]
+                return HistoryData(user_id=uuid.UUID(res_data['user_id']), account_age_years=res_data['account_age_years'])
+            return None
+        except Exception as e:
+            store_error("history_db", "upsert_history", f"Error creating/updating history data: {e}")
+            return None
+
+    @resilience.guard("history_db", read=True)
+    @metrics.instrument("history_db", "get_history")
+    def get_history_data(self, user_id: uuid.UUID) -> Optional[HistoryData]:
+        try:
+            response = datastores.history_db.client.table("history_data").select("*").eq("user_id", str(user_id)).execute() 
+
+            if response.data:
+                res_data = response.data[0]
+                return HistoryData(user_id=uuid.UUID(res_data['user_id']), account_age_years=res_data['account_age_years'])
+            return None
+        except Exception as e:
+            store_error("history_db", "get_history", f"Error getting history data: {e}")
+            return None
+
+    @resilience.guard("history_db", read=True)
+    @metrics.instrument("history_db", "get_history_bulk")
+    def get_history_data_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, HistoryData]]:
+        ids = [str(u) for u in user_ids]
+        try:
+            rows = []
+            for start in range(0, len(ids), _IN_FILTER_CHUNK):
+                chunk = ids[start:start + _IN_FILTER_CHUNK]
+                rows.extend(_select_all_pages(lambda: datastores.history_db.client.table("history_data").select("user_id,account_age_years").in_("user_id", chunk).order("user_id")))
+            return {uuid.UUID(row['user_id']): HistoryData(user_id=uuid.UUID(row['user_id']), account_age_years=row['account_age_years']) for row in rows}
+        except Exception as e:
+            store_error("history_db", "get_history_bulk", f"Error bulk-getting history data: {e}")
+            return None
+
+    @resilience.guard("debt_db")
+    @metrics.instrument("debt_db", "upsert_debt")
+    def create_or_update_debt_data(self, data: DebtData) -> Optional[DebtData]:
+        try:
+            datastores.debt_db.client.update_one(
+                {"user_id": str(data.user_id)},
+                {"$set": {
+                    "used_credit": data.used_credit,
+                    "credit_limit": data.credit_limit,
+                    "last_updated": datetime.now(timezone.utc)
+                }},
+                upsert=True
+            )
+            return data 
+        except Exception as e:
+            store_error("debt_db", "upsert_debt", f"Error creating/updating debt data: {e}")
+            return None
+
+    @resilience.guard("debt_db", read=True)
+    @metrics.instrument("debt_db", "get_debt")
+    def get_debt_data(self, user_id: uuid.UUID) -> Optional[DebtData]:
+        try:
+            doc = datastores.debt_db.client.find_one({"user_id": str(user_id)})
+            if doc:
+                return DebtData(user_id=uuid.UUID(doc["user_id"]), used_credit=doc["used_credit"], credit_limit=doc["credit_limit"])
+            return None
+        except Exception as e:
+            store_error("debt_db", "get_debt", f"Error getting debt data: {e}")
+            return None
+
+    @resilience.guard("debt_db", read=True)
+    @metrics.instrument("debt_db", "get_debt_bulk")
+    def get_debt_data_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, DebtData]]:
+        ids = [str(u) for u in user_ids]
+        try:
+            docs = datastores.debt_db.client.find({"user_id": {"$in": ids}}, {"_id": 0, "user_id": 1, "used_credit": 1, "credit_limit": 1})
+            return {uuid.UUID(doc["user_id"]): DebtData(user_id=uuid.UUID(doc["user_id"]), used_credit=doc["used_credit"], credit_limit=doc["credit_limit"]) for doc in docs}
+        except Exception as e:
+            store_error("debt_db", "get_debt_bulk", f"Error bulk-getting debt data: {e}")
+            return None
+
+    @resilience.guard("mix_db")
+    @metrics.instrument("mix_db", "upsert_mix")
+    def create_or_update_mix_data(self, data: MixData) -> Optional[MixData]:
+        try:
+            datastores.mix_db.client.update_one(
+                {"user_id": str(data.user_id)},
+                {"$set": {
+                    "credit_types_used": data.credit_types_used,
+                    "last_updated": datetime.now(timezone.utc)
+                }},
+                upsert=True
+            )
+            return data 
+        except Exception as e:
+            store_error("mix_db", "upsert_mix", f"Error creating/updating mix data: {e}")
+            return None
+
+    @resilience.guard("mix_db", read=True)
+    @metrics.instrument("mix_db", "get_mix")
+    def get_mix_data(self, user_id: uuid.UUID) -> Optional[MixData]:
+        try:
+            doc = datastores.mix_db.client.find_one({"user_id": str(user_id)})
+            if doc:
+                return MixData(user_id=uuid.UUID(doc["user_id"]), credit_types_used=doc["credit_types_used"])
+            return None
+        except Exception as e:
+            store_error("mix_db", "get_mix", f"Error getting mix data: {e}")
+            return None
+
+    @resilience.guard("mix_db", read=True)
+    @metrics.instrument("mix_db", "get_mix_bulk")
+    def get_mix_data_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, MixData]]:
+        ids = [str(u) for u in user_ids]
+        try:
+            docs = datastores.mix_db.client.find({"user_id": {"$in": ids}}, {"_id": 0, "user_id": 1, "credit_types_used": 1})
+            return {uuid.UUID(doc["user_id"]): MixData(user_id=uuid.UUID(doc["user_id"]), credit_types_used=doc["credit_types_used"]) for doc in docs}
+        except Exception as e:
+            store_error("mix_db", "get_mix_bulk", f"Error bulk-getting mix data: {e}")
+            return None
+
+    @resilience.guard("neon", read=True)
+    @metrics.instrument("neon", "get_credit_profile")
+    def get_credit_profile(self, user_id: uuid.UUID) -> Optional[CreditProfile]:
+        try:
+            with neon_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("SELECT * FROM credit_profiles WHERE user_id = %s;", (str(user_id),))
+                    row = cur.fetchone()
+            return CreditProfile(**row) if row else None
+        except Exception as e:
+            store_error("neon", "get_credit_profile", f"Error getting credit profile for user {user_id}: {e}")
+            return None
+
+    @resilience.guard("neon", read=True)
+    @metrics.instrument("neon", "get_credit_profiles_bulk")
+    def get_credit_profiles_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, CreditProfile]]:
+        ids = tuple(str(u) for u in user_ids)
+        if not ids:
+            return {}
+        try:
+            with neon_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("SELECT * FROM credit_profiles WHERE user_id IN %s;", (ids,))
+                    rows = cur.fetchall()
+            return {uuid.UUID(str(row["user_id"])): CreditProfile(**row) for row in rows}
+        except Exception as e:
+            store_error("neon", "get_credit_profiles_bulk", f"Error bulk-getting credit profiles: {e}")
+            return None
+
+    @resilience.guard("neon")
+    @metrics.instrument("neon", "apply_credit_profile_change")
+    def apply_credit_profile_change(self, user_id: uuid.UUID, fields: Dict[str, Any], increments: Dict[str, int], stale: bool = False) -> Optional[CreditProfile]:
+        record = {"user_id": str(user_id), **{f: fields[f] for f in CREDIT_PROFILE_FIELDS if f in fields}}
+        record.update({c: increments.get(c, 0) for c in CREDIT_PROFILE_COUNTERS})
+        updates = [f"{c} = EXCLUDED.{c}" for c in fields if c in CREDIT_PROFILE_FIELDS]
+        updates += [f"{c} = p.{c} + EXCLUDED.{c}" for c in CREDIT_PROFILE_COUNTERS]
+        updates += ["version = p.version + 1", "stale = p.stale OR %s", "updated_at = now()"]
+        try:
+            with neon_connection() as conn:
+                try:
+                    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                        # A user without a profile gets a stale stub: these values alone don't describe them
+                        cur.execute(
+                            f"INSERT INTO credit_profiles AS p ({', '.join(record)}, version, stale) VALUES ({', '.join(['%s'] * len(record))}, 1, true)"
+                            f" ON CONFLICT (user_id) DO UPDATE SET {', '.join(updates)} RETURNING *;",
+                            [*record.values(), stale],
+                        )
+                        row = cur.fetchone()
+                        conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            return CreditProfile(**row)
+        except Exception as e:
+            store_error("neon", "apply_credit_profile_change", f"Error updating credit profile for user {user_id}: {e}")
+            return None
+
+    @resilience.guard("neon")
+    @metrics.instrument("neon", "save_credit_profiles")
+    def save_credit_profiles(self, profiles: List[CreditProfile], expected_versions: List[Optional[int]]) -> int:
+        saved = 0
+        with neon_connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    for profile, expected_version in zip(profiles, expected_versions):
+                        record = credit_profile_record(profile)
+                        record["components"] = Json(record["components"]) if record["components"] is not None else None
+                        if expected_version is None:
+                            cur.execute(
+                                f"INSERT INTO credit_profiles ({', '.join(record)}, version, stale) VALUES ({', '.join(['%s'] * len(record))}, %s, false)"
+                                " ON CONFLICT (user_id) DO NOTHING;",
+                                [*record.values(), profile.version],
+                            )
+                        else:
+                            user_id = record.pop("user_id")
+                            cur.execute(
+                                f"UPDATE credit_profiles SET {', '.join(f'{c} = %s' for c in record)}, stale = false, updated_at = now()"
+                                " WHERE user_id = %s AND version = %s;",
+                                [*record.values(), user_id, expected_version],
+                            )
+                        saved += cur.rowcount
+                conn.commit() # All or nothing
+            except Exception:
+                conn.rollback()
+                raise
+        return saved
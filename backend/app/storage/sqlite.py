@@ -0,0 +1,470 @@
+"""
+Embedded single-file backend: every entity the five remote stores hold, in one SQLite
+database (schema in migrations/sqlite). Meant for small single-node deployments, local
+development and as a test fixture (path ":memory:" gives a throwaway database).
+
+Reads are local B-tree lookups, so scoring a user costs microseconds instead of five
+network round trips. One connection is shared by all threads behind a lock; SQLite
+serializes writers anyway and reads are far too short for the lock to matter.
+"""
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+
+from app.core import metrics, resilience
+from app.schemas import (
+    UserCreate, UserResponse,
+    PaymentTransactionCreate, PaymentTransactionResponse, DerivedPaymentHistory,
+    DebtData, HistoryData, MixData, CreditProfile
+)
+from app.storage.base import (
+    CREDIT_PROFILE_COUNTERS, CREDIT_PROFILE_FIELDS, StorageBackend,
+    credit_profile_record, payment_transaction_record, store_error, uuid4_ids
+)
+
+logger = logging.getLogger(__name__)
+
+# Applied in file name order on open; PRAGMA user_version counts the files already applied
+SCHEMA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "migrations", "sqlite")
+STORE = "sqlite" # metrics label
+
+_IN_CHUNK = 500 # ids per IN (...) list, well under SQLite's bound-parameter limit
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _user(row: sqlite3.Row) -> UserResponse:
+    return UserResponse(user_id=uuid.UUID(row["user_id"]), username=row["username"], email=row["email"], created_at=datetime.fromisoformat(row["created_at"]))
+
+
+def _transaction_row(row: sqlite3.Row) -> dict:
+    record = dict(row)
+    record["is_on_time"] = None if record["is_on_time"] is None else bool(record["is_on_time"])
+    return record
+
+
+def _profile(row: sqlite3.Row) -> CreditProfile:
+    record = dict(row)
+    record["components"] = json.loads(record["components"]) if record["components"] else None
+    record["stale"] = bool(record["stale"])
+    return CreditProfile(**record)
+
+
+def _profile_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return json.dumps(value)
+    return value
+
+
+class SQLiteStorage(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL;") # Readers in other processes don't block the writer
+            self._conn.execute("PRAGMA synchronous=NORMAL;")
+        schema_paths = sorted(glob.glob(os.path.join(SCHEMA_DIR, "*.sql")))
+        applied = self._conn.execute("PRAGMA user_version;").fetchone()[0]
+        for schema_path in schema_paths[applied:]:
+            with open(schema_path) as f:
+                self._conn.executescript(f.read())
+        if applied < len(schema_paths):
+            self._conn.execute(f"PRAGMA user_version = {len(schema_paths)};")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def check_health(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with self._lock:
+                self._conn.execute("SELECT 1;").fetchone()
+            return {STORE: {"status": "ok"}}
+        except Exception as e:
+            return {STORE: {"status": "error", "error": f"{type(e).__name__}: {e}"}}
+
+    def _query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _query_in(self, sql: str, ids: List[str]) -> List[sqlite3.Row]:
+        # `sql` has one "{}" where the IN placeholders go
+        rows = []
+        for start in range(0, len(ids), _IN_CHUNK):
+            chunk = ids[start:start + _IN_CHUNK]
+            rows.extend(self._query(sql.format(",".join("?" * len(chunk))), chunk))
+        return rows
+
+    # --- users --------------------------------------------------------------------------
+
+    @resilience.guard(STORE)
+    @metrics.instrument(STORE, "create_user")
+    def create_user(self, user: UserCreate) -> Optional[UserResponse]:
+        row = (str(uuid.uuid4()), user.username, user.email, _now())
+        try:
+            with self._lock, self._conn:
+                self._conn.execute("INSERT INTO users (user_id, username, email, created_at) VALUES (?, ?, ?, ?);", row)
+        except sqlite3.IntegrityError as e:
+            logger.error(f"SQLite error creating user: {e}", extra={"store": STORE, "operation": "create_user"})
+            raise HTTPException(status_code=400, detail="Username or email already exists.")
+        return UserResponse(user_id=uuid.UUID(row[0]), username=row[1], email=row[2], created_at=datetime.fromisoformat(row[3]))
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "get_user")
+    def get_user(self, user_id: uuid.UUID) -> Optional[UserResponse]:
+        try:
+            rows = self._query("SELECT * FROM users WHERE user_id = ?;", (str(user_id),))
+            return _user(rows[0]) if rows else None
+        except Exception as e:
+            store_error(STORE, "get_user", f"Error getting user from SQLite: {e}")
+            return None
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "get_users_bulk")
+    def get_users_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, UserResponse]]:
+        try:
+            rows = self._query_in("SELECT * FROM users WHERE user_id IN ({});", [str(u) for u in user_ids])
+            return {uuid.UUID(row["user_id"]): _user(row) for row in rows}
+        except Exception as e:
+            store_error(STORE, "get_users_bulk", f"Error bulk-getting users from SQLite: {e}")
+            return None
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "list_users_page")
+    def list_users_page(self, after_user_id: Optional[uuid.UUID], limit: int) -> List[UserResponse]:
+        # uuid text sorts like Postgres' uuid ordering (lowercase hex, fixed width)
+        if after_user_id is None:
+            rows = self._query("SELECT * FROM users ORDER BY user_id LIMIT ?;", (limit,))
+        else:
+            rows = self._query("SELECT * FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?;", (str(after_user_id), limit))
+        return [_user(row) for row in rows]
+
+    # --- payments -----------------------------------------------------------------------
+
+    def _insert_transactions(self, transactions: List[PaymentTransactionCreate]) -> List[dict]:
+        now = _now()
+        rows = []
+        for t in transactions:
+            record = payment_transaction_record(t)
+            is_on_time = record["is_on_time"]
+            rows.append((record["user_id"], t.loan_or_account_id, record["due_date"], record["payment_date"], record["amount_due"],
+                         None if is_on_time is None else int(is_on_time), t.transaction_type, now, now))
+        with self._lock, self._conn:
+            # Only this connection writes, and it holds the lock, so the new ids are contiguous
+            last_id = self._conn.execute("SELECT COALESCE(MAX(transaction_id), 0) FROM payment_transactions;").fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO payment_transactions (user_id, loan_or_account_id, due_date, payment_date, amount_due, is_on_time, transaction_type, created_at, last_updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                rows,
+            )
+            inserted = self._conn.execute("SELECT * FROM payment_transactions WHERE transaction_id > ? ORDER BY transaction_id;", (last_id,)).fetchall()
+        return [_transaction_row(row) for row in inserted]
+
+    @resilience.guard(STORE)
+    @metrics.instrument(STORE, "add_payment_transaction")
+    def add_payment_transaction(self, transaction: PaymentTransactionCreate) -> Optional[PaymentTransactionResponse]:
+        try:
+            rows = self._insert_transactions([transaction])
+            return PaymentTransactionResponse(**rows[0]) if rows else None
+        except Exception as e:
+            store_error(STORE, "add_payment_transaction", f"Error adding payment transaction: {e}")
+            return None
+
+    @resilience.guard(STORE)
+    @metrics.instrument(STORE, "add_payment_transactions_bulk")
+    def add_payment_transactions_bulk(self, transactions: List[PaymentTransactionCreate]) -> List[dict]:
+        if not transactions:
+            return []
+        try:
+            return self._insert_transactions(transactions)
+        except Exception as e:
+            store_error(STORE, "add_payment_transactions_bulk", f"Error bulk-adding {len(transactions)} payment transactions: {e}")
+            return []
+
+    @resilience.guard(STORE)
+    @metrics.instrument(STORE, "insert_payment_records")
+    def insert_payment_records(self, records: List[dict]) -> int:
+        if not records:
+            return 0
+        now = _now()
+        rows = [
+            (r["user_id"], r.get("loan_or_account_id"), r["due_date"], r.get("payment_date"), r["amount_due"],
+             None if r.get("is_on_time") is None else int(r["is_on_time"]), r.get("transaction_type"), now, now)
+            for r in records
+        ]
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT INTO payment_transactions (user_id, loan_or_account_id, due_date, payment_date, amount_due, is_on_time, transaction_type, created_at, last_updated)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                    rows,
+                )
+        except Exception as e:
+            store_error(STORE, "insert_payment_records", f"Error inserting {len(records)} payment records: {e}")
+            return 0
+        return len(rows)
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "get_payment_transactions")
+    def get_payment_transactions_for_user(self, user_id: uuid.UUID) -> List[PaymentTransactionResponse]:
+        try:
+            rows = self._query("SELECT * FROM payment_transactions WHERE user_id = ? ORDER BY due_date;", (str(user_id),))
+            return [PaymentTransactionResponse(**_transaction_row(row)) for row in rows]
+        except Exception as e:
+            store_error(STORE, "get_payment_transactions", f"Error getting payment transactions for user {user_id}: {e}")
+            return []
+
+    def _payment_history_summaries(self, user_ids: List[str]) -> Dict[uuid.UUID, DerivedPaymentHistory]:
+        user_ids = uuid4_ids(user_ids) # Other ids get no entry, as no user can have them
+        summaries = {uuid.UUID(u): DerivedPaymentHistory(user_id=uuid.UUID(u), on_time_payments=0, total_due_payments=0) for u in user_ids}
+        rows = self._query_in("SELECT user_id, on_time_payments, total_due_payments FROM payment_history_rollups WHERE user_id IN ({});", user_ids)
+        for row in rows:
+            summaries[uuid.UUID(row["user_id"])] = DerivedPaymentHistory(user_id=uuid.UUID(row["user_id"]), on_time_payments=row["on_time_payments"], total_due_payments=row["total_due_payments"])
+        return summaries
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "get_payment_history")
+    def get_derived_payment_history(self, user_id: uuid.UUID) -> Optional[DerivedPaymentHistory]:
+        try:
+            return self._payment_history_summaries([str(user_id)]).get(user_id)
+        except Exception as e:
+            store_error(STORE, "get_payment_history", f"Error getting payment history summary for user {user_id}: {e}")
+            return None
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "get_payment_history_bulk")
+    def get_derived_payment_history_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, DerivedPaymentHistory]]:
+        try:
+            return self._payment_history_summaries([str(u) for u in user_ids])
+        except Exception as e:
+            store_error(STORE, "get_payment_history_bulk", f"Error bulk-getting payment history summaries: {e}")
+            return None
+
+    def _drift(self, user_ids: Optional[List[uuid.UUID]]) -> List[sqlite3.Row]:
+        # Same result as the payment_history_rollup_drift() function on Supabase
+        ids_filter, params = "", []
+        if user_ids:
+            params = [str(u) for u in user_ids]
+            ids_filter = f"WHERE user_id IN ({','.join('?' * len(params))})"
+        return self._conn.execute(f"""
+            WITH actual AS (
+                SELECT user_id, SUM(COALESCE(is_on_time, 0)) AS on_time, COUNT(*) AS total
+                FROM payment_transactions GROUP BY user_id
+            ), ids AS (
+                SELECT user_id FROM (SELECT user_id FROM actual UNION SELECT user_id FROM payment_history_rollups) {ids_filter}
+            )
+            SELECT ids.user_id,
+                   COALESCE(r.on_time_payments, 0) AS rollup_on_time_payments, COALESCE(r.total_due_payments, 0) AS rollup_total_due_payments,
+                   COALESCE(a.on_time, 0) AS actual_on_time_payments, COALESCE(a.total, 0) AS actual_total_due_payments
+            FROM ids
+            LEFT JOIN actual a ON a.user_id = ids.user_id
+            LEFT JOIN payment_history_rollups r ON r.user_id = ids.user_id
+            WHERE COALESCE(r.on_time_payments, 0) <> COALESCE(a.on_time, 0)
+               OR COALESCE(r.total_due_payments, 0) <> COALESCE(a.total, 0);
+        """, params).fetchall()
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "rollup_drift")
+    def get_payment_history_rollup_drift(self, user_ids: Optional[List[uuid.UUID]] = None) -> List[dict]:
+        with self._lock:
+            return [dict(row) for row in self._drift(user_ids)]
+
+    @resilience.guard(STORE)
+    @metrics.instrument(STORE, "rebuild_rollups")
+    def rebuild_payment_history_rollups(self, user_ids: Optional[List[uuid.UUID]] = None) -> int:
+        with self._lock, self._conn:
+            drift = self._drift(user_ids)
+            self._conn.executemany(
+                "INSERT INTO payment_history_rollups (user_id, on_time_payments, total_due_payments, last_updated) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (user_id) DO UPDATE SET on_time_payments = excluded.on_time_payments,"
+                " total_due_payments = excluded.total_due_payments, last_updated = excluded.last_updated;",
+                [(row["user_id"], row["actual_on_time_payments"], row["actual_total_due_payments"], _now()) for row in drift],
+            )
+        return len(drift)
+
+    # --- history, debt, mix -------------------------------------------------------------
+
+    def _upsert(self, table: str, record: Dict[str, Any]):
+        columns = list(record)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != "user_id")
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                f" ON CONFLICT (user_id) DO UPDATE SET {updates};",
+                list(record.values()),
+            )
+
+    @resilience.guard(STORE)
+    @metrics.instrument(STORE, "upsert_history")
+    def create_or_update_history_data(self, data: HistoryData) -> Optional[HistoryData]:
+        try:
+            self._upsert("history_data", {"user_id": str(data.user_id), "account_age_years": data.account_age_years, "last_updated": _now()})
+            return data
+        except Exception as e:
+            store_error(STORE, "upsert_history", f"Error creating/updating history data: {e}")
+            return None
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "get_history")
+    def get_history_data(self, user_id: uuid.UUID) -> Optional[HistoryData]:
+        try:
+            rows = self._query("SELECT user_id, account_age_years FROM history_data WHERE user_id = ?;", (str(user_id),))
+            return HistoryData(user_id=uuid.UUID(rows[0]["user_id"]), account_age_years=rows[0]["account_age_years"]) if rows else None
+        except Exception as e:
+            store_error(STORE, "get_history", f"Error getting history data: {e}")
+            return None
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "get_history_bulk")
+    def get_history_data_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, HistoryData]]:
+        try:
+            rows = self._query_in("SELECT user_id, account_age_years FROM history_data WHERE user_id IN ({});", [str(u) for u in user_ids])
+            return {uuid.UUID(row["user_id"]): HistoryData(user_id=uuid.UUID(row["user_id"]), account_age_years=row["account_age_years"]) for row in rows}
+        except Exception as e:
+            store_error(STORE, "get_history_bulk", f"Error bulk-getting history data: {e}")
+            return None
+
+    @resilience.guard(STORE)
+    @metrics.instrument(STORE, "upsert_debt")
+    def create_or_update_debt_data(self, data: DebtData) -> Optional[DebtData]:
+        try:
+            self._upsert("debt_records", {"user_id": str(data.user_id), "used_credit": data.used_credit, "credit_limit": data.credit_limit, "last_updated": _now()})
+            return data
+        except Exception as e:
+            store_error(STORE, "upsert_debt", f"Error creating/updating debt data: {e}")
+            return None
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "get_debt")
+    def get_debt_data(self, user_id: uuid.UUID) -> Optional[DebtData]:
+        try:
+            rows = self._query("SELECT user_id, used_credit, credit_limit FROM debt_records WHERE user_id = ?;", (str(user_id),))
+            return DebtData(user_id=uuid.UUID(rows[0]["user_id"]), used_credit=rows[0]["used_credit"], credit_limit=rows[0]["credit_limit"]) if rows else None
+        except Exception as e:
+            store_error(STORE, "get_debt", f"Error getting debt data: {e}")
+            return None
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "get_debt_bulk")
+    def get_debt_data_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, DebtData]]:
+        try:
+            rows = self._query_in("SELECT user_id, used_credit, credit_limit FROM debt_records WHERE user_id IN ({});", [str(u) for u in user_ids])
+            return {uuid.UUID(row["user_id"]): DebtData(user_id=uuid.UUID(row["user_id"]), used_credit=row["used_credit"], credit_limit=row["credit_limit"]) for row in rows}
+        except Exception as e:
+            store_error(STORE, "get_debt_bulk", f"Error bulk-getting debt data: {e}")
+            return None
+
+    @resilience.guard(STORE)
+    @metrics.instrument(STORE, "upsert_mix")
+    def create_or_update_mix_data(self, data: MixData) -> Optional[MixData]:
+        try:
+            self._upsert("mix_records", {"user_id": str(data.user_id), "credit_types_used": data.credit_types_used, "last_updated": _now()})
+            return data
+        except Exception as e:
+            store_error(STORE, "upsert_mix", f"Error creating/updating mix data: {e}")
+            return None
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "get_mix")
+    def get_mix_data(self, user_id: uuid.UUID) -> Optional[MixData]:
+        try:
+            rows = self._query("SELECT user_id, credit_types_used FROM mix_records WHERE user_id = ?;", (str(user_id),))
+            return MixData(user_id=uuid.UUID(rows[0]["user_id"]), credit_types_used=rows[0]["credit_types_used"]) if rows else None
+        except Exception as e:
+            store_error(STORE, "get_mix", f"Error getting mix data: {e}")
+            return None
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "get_mix_bulk")
+    def get_mix_data_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, MixData]]:
+        try:
+            rows = self._query_in("SELECT user_id, credit_types_used FROM mix_records WHERE user_id IN ({});", [str(u) for u in user_ids])
+            return {uuid.UUID(row["user_id"]): MixData(user_id=uuid.UUID(row["user_id"]), credit_types_used=row["credit_types_used"]) for row in rows}
+        except Exception as e:
+            store_error(STORE, "get_mix_bulk", f"Error bulk-getting mix data: {e}")
+            return None
+
+    # --- credit profiles ----------------------------------------------------------------
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "get_credit_profile")
+    def get_credit_profile(self, user_id: uuid.UUID) -> Optional[CreditProfile]:
+        try:
+            rows = self._query("SELECT * FROM credit_profiles WHERE user_id = ?;", (str(user_id),))
+            return _profile(rows[0]) if rows else None
+        except Exception as e:
+            store_error(STORE, "get_credit_profile", f"Error getting credit profile for user {user_id}: {e}")
+            return None
+
+    @resilience.guard(STORE, read=True)
+    @metrics.instrument(STORE, "get_credit_profiles_bulk")
+    def get_credit_profiles_bulk(self, user_ids: Iterable[uuid.UUID]) -> Optional[Dict[uuid.UUID, CreditProfile]]:
+        try:
+            rows = self._query_in("SELECT * FROM credit_profiles WHERE user_id IN ({});", [str(u) for u in user_ids])
+            return {uuid.UUID(row["user_id"]): _profile(row) for row in rows}
+        except Exception as e:
+            store_error(STORE, "get_credit_profiles_bulk", f"Error bulk-getting credit profiles: {e}")
+            return None
+
+    @resilience.guard(STORE)
+    @metrics.instrument(STORE, "apply_credit_profile_change")
+    def apply_credit_profile_change(self, user_id: uuid.UUID, fields: Dict[str, Any], increments: Dict[str, int], stale: bool = False) -> Optional[CreditProfile]:
+        try:
+            record = {"user_id": str(user_id), **{f: _profile_value(fields[f]) for f in CREDIT_PROFILE_FIELDS if f in fields}}
+            record.update({c: increments.get(c, 0) for c in CREDIT_PROFILE_COUNTERS})
+            record.update({"version": 1, "stale": 1, "updated_at": _now()}) # As inserted; only a new stub row keeps these
+            updates = [f"{c} = excluded.{c}" for c in fields if c in CREDIT_PROFILE_FIELDS]
+            updates += [f"{c} = {c} + excluded.{c}" for c in CREDIT_PROFILE_COUNTERS]
+            updates += ["version = version + 1", "stale = stale OR ?", "updated_at = excluded.updated_at"]
+            columns = list(record)
+            with self._lock, self._conn:
+                self._conn.execute(
+                    f"INSERT INTO credit_profiles ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                    f" ON CONFLICT (user_id) DO UPDATE SET {', '.join(updates)};",
+                    [*record.values(), int(stale)],
+                )
+                row = self._conn.execute("SELECT * FROM credit_profiles WHERE user_id = ?;", (str(user_id),)).fetchone()
+            return _profile(row)
+        except Exception as e:
+            store_error(STORE, "apply_credit_profile_change", f"Error updating credit profile for user {user_id}: {e}")
+            return None
+
+    @resilience.guard(STORE)
+    @metrics.instrument(STORE, "save_credit_profiles")
+    def save_credit_profiles(self, profiles: List[CreditProfile], expected_versions: List[Optional[int]]) -> int:
+        saved = 0
+        now = _now()
+        with self._lock, self._conn:
+            for profile, expected_version in zip(profiles, expected_versions):
+                record = {c: _profile_value(v) for c, v in credit_profile_record(profile).items()}
+                record.update({"stale": 0, "updated_at": now})
+                if expected_version is None:
+                    columns = [*record, "version"]
+                    cursor = self._conn.execute(
+                        f"INSERT INTO credit_profiles ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) ON CONFLICT (user_id) DO NOTHING;",
+                        [*record.values(), profile.version],
+                    )
+                else:
+                    user_id = record.pop("user_id")
+                    cursor = self._conn.execute(
+                        f"UPDATE credit_profiles SET {', '.join(f'{c} = ?' for c in record)} WHERE user_id = ? AND version = ?;",
+                        [*record.values(), user_id, expected_version],
+                    )
+                saved += cursor.rowcount
+        return saved
@@ -0,0 +1,96 @@
+"""
+Checks that the circuit breakers (app.core.resilience) open on store failures and only on
+those, through the API on the remote backend over benchmarks.fakes.
+
+- --duplicates POST /users/ calls with a taken username all get 400 and leave the Neon
+  breaker closed; a 4xx is the store answering normally.
+- As many /iscore requests for ids that aren't UUID4s (which no store can hold) all get
+  404 and leave every breaker closed; an error from the input isn't the store failing.
+- With a factor store down, /iscore for an unknown user still gets 404, not 503.
+- With Neon down, CIRCUIT_BREAKER_FAILURE_THRESHOLD failed reads open its breaker, the next
+  request gets 503 without reaching the store, and once Neon is back a trial call after
+  --reset-seconds closes it again.
+
+Exits with status 1 if any of these doesn't hold.
+
+Run from the backend folder:
+    python -m benchmarks.bench_circuit_breakers --duplicates 20
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+
+import httpx
+
+from app.core import resilience
+from app.core.config import settings
+from benchmarks.fakes import FakeDatastores
+
+
+async def run(args) -> bool:
+    from app import main
+    from app.services.score_cache import score_cache
+
+    fakes = FakeDatastores().install()
+    score_cache.backend = None
+    settings.CIRCUIT_BREAKER_RESET_SECONDS = args.reset_seconds
+    ok = True
+
+    def check(label: str, passed: bool):
+        nonlocal ok
+        ok &= passed
+        print(f"{'ok  ' if passed else 'FAIL'} {label}")
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            user = {"username": "bench_breaker", "email": "bench_breaker@example.com"}
+            user_id = (await client.post("/users/", json=user)).json()["user_id"]
+
+            statuses = [(await client.post("/users/", json=user)).status_code for _ in range(args.duplicates)]
+            check(f"{args.duplicates} duplicate creates: statuses {sorted(set(statuses))} (expected [400])", set(statuses) == {400})
+            state = resilience.breaker_for("neon").stats()["state"]
+            check(f"neon breaker after the duplicates: {state} (expected closed)", state == "closed")
+            status = (await client.get(f"/users/{user_id}/exists")).status_code
+            check(f"/users/{{id}}/exists after the duplicates: {status} (expected 200)", status == 200)
+
+            statuses = [(await client.get(f"/iscore/{uuid.uuid1()}")).status_code for _ in range(args.duplicates)]
+            check(f"{args.duplicates} /iscore requests for UUID1 ids: statuses {sorted(set(statuses))} (expected [404])", set(statuses) == {404})
+            states = {store: stats["state"] for store, stats in resilience.breaker_stats().items()}
+            check(f"breakers after them: {states} (expected all closed)", set(states.values()) == {"closed"})
+
+            fakes.set_down(["debt_db"])
+            status = (await client.get(f"/iscore/{uuid.uuid4()}")).status_code
+            check(f"/iscore for an unknown user with debt_db down: {status} (expected 404)", status == 404)
+            fakes.set_down(["debt_db"], down=False)
+
+            fakes.set_down(["neon"])
+            for _ in range(settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD):
+                await client.get(f"/users/{user_id}/exists")
+            state = resilience.breaker_for("neon").stats()["state"]
+            check(f"neon breaker after {settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD} failed reads: {state} (expected open)", state == "open")
+            fakes.stats.reset()
+            status = (await client.get(f"/users/{user_id}/exists")).status_code
+            calls = fakes.stats.total("neon")
+            check(f"request while open: {status} with {calls} neon calls (expected 503 with 0)", status == 503 and calls == 0)
+
+            fakes.set_down(["neon"], down=False)
+            time.sleep(args.reset_seconds)
+            status = (await client.get(f"/users/{user_id}/exists")).status_code
+            state = resilience.breaker_for("neon").stats()["state"]
+            check(f"trial call after {args.reset_seconds}s: {status}, breaker {state} (expected 200, closed)", status == 200 and state == "closed")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duplicates", type=int, default=20, help="Duplicate POST /users/ calls")
+    parser.add_argument("--reset-seconds", type=float, default=0.5, help="CIRCUIT_BREAKER_RESET_SECONDS for the run")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
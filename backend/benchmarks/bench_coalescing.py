@@ -0,0 +1,121 @@
+"""
+Store calls made by --requests concurrent /iscore computations of the same user, with and
+without single-flight coalescing (app.services.score_flights), on the remote backend over
+benchmarks.fakes with --latency per round trip. The result cache is off and /iscore reads
+the source stores (CREDIT_PROFILE_MODE=off), so one computation is the five reads.
+
+Also checks that:
+- a write landing while a flight is running makes the requests that follow it start a new
+  computation;
+- cancelling the leader's request (its client disconnected) doesn't cancel the
+  computation, so the followers still get its result from one set of store calls;
+- requests for the same user on two event loops at once don't share a flight, as a task
+  can only be awaited on its own loop.
+
+Exits with status 1 if any of these doesn't hold.
+
+Run from the backend folder:
+    python -m benchmarks.bench_coalescing --requests 200 --latency all=40ms
+"""
+import argparse
+import asyncio
+import sys
+import threading
+import time
+
+from app import crud, schemas
+from app.core.config import settings
+from app.services import iscore_service
+from app.services.score_cache import score_cache
+from app.services.score_flights import score_flights
+from app.storage import get_storage
+from benchmarks.fakes import FakeDatastores, parse_latencies
+
+
+async def burst(user_id, requests: int) -> float:
+    started = time.perf_counter()
+    scores = await asyncio.gather(*(iscore_service.score_user(user_id) for _ in range(requests)))
+    assert len({s.iscore for s in scores}) == 1
+    return time.perf_counter() - started
+
+
+async def write_during_flight(user_id) -> int:
+    """Computations started for: one request, a write while it's in flight, then one more request."""
+    leaders = score_flights.leaders
+    first = asyncio.ensure_future(iscore_service.score_user(user_id))
+    await asyncio.sleep(0.01) # The first request's reads are under way
+    crud.create_or_update_mix_data(schemas.MixData(user_id=user_id, credit_types_used=3))
+    await asyncio.gather(first, iscore_service.score_user(user_id))
+    return score_flights.leaders - leaders
+
+
+async def cancel_leader(user_id, followers: int) -> int:
+    """How many of the followers got a score after the leader's request was cancelled."""
+    leader = asyncio.ensure_future(iscore_service.score_user(user_id))
+    await asyncio.sleep(0) # The leader starts the flight
+    others = [asyncio.ensure_future(iscore_service.score_user(user_id)) for _ in range(followers)]
+    await asyncio.sleep(0.01) # The reads are under way
+    leader.cancel()
+    scores = await asyncio.gather(*others, return_exceptions=True)
+    return sum(isinstance(score, schemas.ScoreCalculationResponse) for score in scores)
+
+
+def two_loops(user_id) -> tuple:
+    """(scores received, flights started) for one request on each of two event loops at once."""
+    leaders, scores = score_flights.leaders, []
+    threads = [threading.Thread(target=lambda: scores.append(asyncio.run(iscore_service.score_user(user_id)))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(scores), score_flights.leaders - leaders
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Concurrent requests for the same user")
+    parser.add_argument("--latency", default="all=40ms", help="Per-store round trip of the fakes")
+    args = parser.parse_args()
+    score_cache.backend = None
+    settings.CREDIT_PROFILE_MODE = "off"
+
+    fakes = FakeDatastores().install()
+    get_storage().open()
+    user = crud.create_user(schemas.UserCreate(username="bench_coalescing", email="bench_coalescing@example.com"))
+    crud.generate_and_store_user_data(user.user_id)
+    fakes.set_latencies(parse_latencies(args.latency))
+
+    fakes.stats.reset()
+    asyncio.run(iscore_service.score_user(user.user_id))
+    one_set = fakes.stats.total()
+    print(f"one computation: {one_set} store calls")
+
+    ok = True
+    for enabled in (False, True):
+        score_flights.enabled = enabled
+        fakes.stats.reset()
+        elapsed = asyncio.run(burst(user.user_id, args.requests))
+        calls = fakes.stats.total()
+        print(f"coalescing {'on ' if enabled else 'off'}  {args.requests} requests  {calls:6d} store calls  {elapsed * 1e3:8.1f} ms")
+        ok &= not enabled or calls == one_set
+    print(f"flights: {score_flights.stats()}")
+
+    # The reads made for the first request predate the write, so the second request needs its own
+    started = asyncio.run(write_during_flight(user.user_id))
+    print(f"write during a flight: {started} computations for 2 requests (expected 2)")
+    ok &= started == 2
+
+    fakes.stats.reset()
+    served = asyncio.run(cancel_leader(user.user_id, 10))
+    calls = fakes.stats.total()
+    print(f"leader cancelled: {served}/10 followers got a score, {calls} store calls (expected 10, {one_set})")
+    ok &= served == 10 and calls == one_set
+
+    served, started = two_loops(user.user_id)
+    print(f"two event loops: {served}/2 requests got a score from {started} computations (expected 2, 2)")
+    ok &= served == 2 and started == 2
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
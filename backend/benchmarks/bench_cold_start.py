@@ -0,0 +1,68 @@
+"""
+Cold-start time of a worker: a fresh interpreter importing app.main, running the
+lifespan startup and serving its first request.
+
+Each run is a separate process so nothing is already imported or connected. Reported
+per phase (median over --runs):
+  - import:        `from app import main` (settings, crud, services, datastore setup)
+  - startup:       lifespan startup (Neon pool, plus warm-up when DATASTORE_WARMUP=true)
+  - first request: GET / through the ASGI app
+  - process:       wall time from spawning the interpreter until the first response
+
+Run from the backend folder:
+    python -m benchmarks.bench_cold_start --runs 10
+    DATASTORE_WARMUP=true python -m benchmarks.bench_cold_start
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+_CHILD = r"""
+import asyncio, json, time
+started = time.perf_counter()
+from app import main
+imported = time.perf_counter()
+
+async def run():
+    import httpx
+    async with main.app.router.lifespan_context(main.app):
+        ready = time.perf_counter()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+            await client.get("/")
+        return ready, time.perf_counter()
+
+ready, served = asyncio.run(run())
+print(json.dumps({"import": imported - started, "startup": ready - imported, "first request": served - ready}))
+"""
+
+
+def run_once() -> dict:
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    spawned = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", _CHILD],
+        cwd=backend_dir, capture_output=True, text=True, check=True,
+    ).stdout
+    process = time.perf_counter() - spawned
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings["process"] = process
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    for phase in ("import", "startup", "first request", "process"):
+        values = [r[phase] * 1000 for r in runs]
+        print(f"{phase:<14} median {statistics.median(values):8.1f} ms   min {min(values):8.1f} ms   max {max(values):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
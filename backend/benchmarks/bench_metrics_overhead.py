@@ -0,0 +1,111 @@
+"""
+Overhead of the latency instrumentation (app.core.metrics) against its budget.
+
+Two measurements:
+  - per call: a no-op function bare vs. wrapped in metrics.instrument, inside a request
+    context so the Server-Timing stage list is populated too.
+  - end-to-end: GET /iscore against the in-memory store fakes with zero injected latency
+    (the worst case, nothing to hide the overhead behind), with METRICS_ENABLED on and off
+    in interleaved rounds.
+
+Run from the backend folder:
+    python -m benchmarks.bench_metrics_overhead --requests 2000 --budget 0.05
+
+Exits with status 1 if the end-to-end throughput loss is over --budget.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.core import metrics
+from app.core.config import settings
+from benchmarks.fakes import FakeDatastores
+
+
+def per_call_overhead(calls: int) -> float:
+    def noop():
+        return None
+    wrapped = metrics.instrument("bench", "noop")(noop)
+
+    token = metrics._request_stages.set([])
+    try:
+        started = time.perf_counter()
+        for _ in range(calls):
+            noop()
+        bare = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(calls):
+            wrapped()
+        instrumented = time.perf_counter() - started
+    finally:
+        metrics._request_stages.reset(token)
+    return (instrumented - bare) / calls
+
+
+async def iscore_throughput(client: httpx.AsyncClient, user_ids, requests: int, concurrency: int) -> float:
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            await client.get(f"/iscore/{user_ids[i % len(user_ids)]}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - started)
+
+
+async def end_to_end(args) -> dict:
+    from app import main
+    from app.services.score_cache import score_cache
+
+    FakeDatastores({}).install()
+    score_cache.backend = None
+    throughput = {True: [], False: []}
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            user_ids = []
+            for i in range(args.users):
+                user = (await client.post("/users/", json={"username": f"overhead_{i}", "email": f"overhead_{i}@example.com"})).json()
+                await client.post(f"/users/{user['user_id']}/generate-data/")
+                user_ids.append(user["user_id"])
+
+            await iscore_throughput(client, user_ids, args.requests // 4, args.concurrency) # Warm-up
+            for round_index in range(args.rounds):
+                # Swap the order every round so drift over the run doesn't favour either setting
+                for enabled in ((False, True) if round_index % 2 == 0 else (True, False)):
+                    settings.METRICS_ENABLED = enabled
+                    throughput[enabled].append(await iscore_throughput(client, user_ids, args.requests, args.concurrency))
+    settings.METRICS_ENABLED = True
+    # Loss per round, then the median, so one noisy round doesn't decide the result
+    losses = sorted((off - on) / off for off, on in zip(throughput[False], throughput[True]))
+    return {"off": statistics.median(throughput[False]), "on": statistics.median(throughput[True]), "loss": statistics.median(losses)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200000, help="Calls for the per-call measurement")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000, help="/iscore requests per round and setting")
+    parser.add_argument("--rounds", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--budget", type=float, default=0.05, help="Max allowed relative throughput loss")
+    args = parser.parse_args()
+
+    print(f"per call: {per_call_overhead(args.calls) * 1e6:.2f} µs added by metrics.instrument")
+
+    result = asyncio.run(end_to_end(args))
+    loss = result["loss"]
+    print(f"/iscore: {result['off']:.1f} req/s without metrics, {result['on']:.1f} req/s with metrics ({loss:+.1%} loss, budget {args.budget:.0%})")
+    if loss > args.budget:
+        print("Over budget.")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Throughput of loading payment transactions through app.services.payment_import (chunked
+column-wise validation, batched inserts, --concurrency batches in flight) against one
+add_payment_transaction call per row, on the remote backend over benchmarks.fakes with
+--latency per round trip. The file is a --rows row CSV for --users users with about 1% bad
+rows.
+
+Also checks that every row was either inserted or rejected, that the rejects CSV holds
+exactly the bad rows and that the payment history rollups match the inserted transactions.
+Exits with status 1 if not.
+
+Run from the backend folder:
+    python -m benchmarks.bench_payment_import --rows 200000 --latency payments_db=40ms,neon=20ms
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from app import crud, schemas
+from app.core.config import settings
+from app.services import payment_import
+from app.services.score_cache import score_cache
+from app.storage import get_storage
+from benchmarks.fakes import FakeDatastores, parse_latencies
+
+
+def write_file(path: str, user_ids: list, rows: int, seed: int) -> int:
+    """Writes the CSV; returns how many of its rows are invalid."""
+    rng = random.Random(seed)
+    bad = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["user_id", "loan_or_account_id", "due_date", "payment_date", "amount_due", "is_on_time", "transaction_type"])
+        for i in range(rows):
+            due = date(2023, 1, 1) + timedelta(days=rng.randrange(700))
+            paid = "" if rng.random() < 0.1 else (due + timedelta(days=rng.randint(-10, 20))).isoformat()
+            amount = f"{rng.uniform(20, 3000):.2f}"
+            if rng.random() < 0.01:
+                bad += 1
+                amount = "n/a"
+            writer.writerow([rng.choice(user_ids), f"loan-{i % 97}", due.isoformat(), paid, amount, "", "Installment"])
+    return bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--latency", default="payments_db=40ms,neon=20ms", help="Per-store round trip of the fakes")
+    parser.add_argument("--concurrency", type=int, default=settings.IMPORT_CONCURRENCY)
+    parser.add_argument("--per-row-sample", type=int, default=100, help="Rows timed through add_payment_transaction")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    score_cache.backend = None
+    settings.CREDIT_PROFILE_MODE = "off"
+
+    fakes = FakeDatastores().install()
+    get_storage().open()
+    user_ids = [crud.create_user(schemas.UserCreate(username=f"bench_import_{i}")).user_id for i in range(args.users)]
+    fakes.set_latencies(parse_latencies(args.latency))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "payments.csv")
+        bad = write_file(path, user_ids, args.rows, args.seed)
+        print(f"file: {args.rows:,} rows, {os.path.getsize(path) / 1e6:.1f} MB, {bad} invalid")
+
+        started = time.perf_counter()
+        for i in range(args.per_row_sample):
+            crud.add_payment_transaction(schemas.PaymentTransactionCreate(user_id=user_ids[i % len(user_ids)], due_date=date(2024, 1, 1), amount_due=10.0))
+        per_row = args.per_row_sample / (time.perf_counter() - started)
+        print(f"add_payment_transaction  {per_row:12,.0f} rows/s  (~{args.rows / per_row / 60:,.1f} min for the file)")
+
+        fakes.stats.reset()
+        stats = payment_import.import_file(path, concurrency=args.concurrency)
+        print(f"payment_import           {stats.rows_per_second:12,.0f} rows/s  ({stats.seconds:.2f} s, "
+              f"{fakes.stats.total('payments_db')} payments_db calls, {fakes.stats.total('neon')} neon calls)")
+
+        with open(stats.rejects_path or os.devnull) as f:
+            rejects = sum(1 for _ in csv.DictReader(f))
+    drift = crud.get_payment_history_rollup_drift()
+    print(f"inserted {stats.inserted:,}, rejected {stats.rejected:,} ({rejects} in the rejects file), rollup drift {len(drift)} users")
+    ok = stats.inserted + stats.rejected == args.rows and stats.rejected == bad == rejects and not drift
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Serialization cost and payload size of GET /iscore/{user_id} in each response mode.
+
+Two measurements per mode:
+  - serialize: just turning the score into response bytes. The full view mimics what
+    FastAPI does for response_model (dump, re-validate, dump to JSON, json.dumps).
+  - end-to-end: requests through TestClient with data fetching stubbed out, so it adds
+    routing and ASGI overhead on top.
+
+Run from the backend folder:
+    python -m benchmarks.bench_response_modes --requests 5000
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+import orjson
+from fastapi.testclient import TestClient
+
+from app import main, schemas
+from app.services import iscore_service, score_calculator
+
+MODES = {
+    "full": {},
+    "compact (iscore)": {"view": "compact"},
+    "compact (iscore,components)": {"view": "compact", "fields": "user_id,iscore,components"},
+}
+
+
+def sample_response(user_id: uuid.UUID) -> schemas.ScoreCalculationResponse:
+    data = schemas.AllUserDataResponse(
+        user_info=schemas.UserResponse(user_id=user_id, username="bench_user", email="bench@example.com", created_at=datetime.now(timezone.utc)),
+        derived_payment_history=schemas.DerivedPaymentHistory(user_id=user_id, on_time_payments=9, total_due_payments=12),
+        debt_info=schemas.DebtData(user_id=user_id, used_credit=4200, credit_limit=10000),
+        history_info=schemas.HistoryData(user_id=user_id, account_age_years=6),
+        mix_info=schemas.MixData(user_id=user_id, credit_types_used=3),
+    )
+    return iscore_service.build_score_response(user_id, data)
+
+
+def serialize_full(response: schemas.ScoreCalculationResponse) -> bytes:
+    content = schemas.ScoreCalculationResponse.model_validate(response.model_dump())
+    return json.dumps(content.model_dump(mode="json"), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def serialize_compact(fields):
+    def serialize(response: schemas.ScoreCalculationResponse) -> bytes:
+        return orjson.dumps(iscore_service.compact_payload(response, fields))
+    return serialize
+
+
+SERIALIZERS = {
+    "full": serialize_full,
+    "compact (iscore)": serialize_compact(iscore_service.DEFAULT_COMPACT_FIELDS),
+    "compact (iscore,components)": serialize_compact(("user_id", "iscore", "components")),
+}
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    user_id = uuid.uuid4()
+    response = sample_response(user_id)
+
+    async def prebuilt(_user_id):
+        return response
+    iscore_service.score_user = prebuilt
+
+    print("serialize:")
+    baseline = None
+    for mode, serialize in SERIALIZERS.items():
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            body = serialize(response)
+        per_request_us = (time.perf_counter() - started) / args.requests * 1e6
+        baseline = baseline or per_request_us
+        print(f"  {mode:<30} {per_request_us:>8.1f} us/request ({baseline / per_request_us:5.1f}x)  {len(body):>5} bytes")
+
+    print("end-to-end:")
+    client = TestClient(main.app)
+    baseline = None
+    for mode, params in MODES.items():
+        client.get(f"/iscore/{user_id}", params=params) # Warm up
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            r = client.get(f"/iscore/{user_id}", params=params)
+        elapsed = time.perf_counter() - started
+        per_request_us = elapsed / args.requests * 1e6
+        baseline = baseline or per_request_us
+        print(f"  {mode:<30} {per_request_us:>8.1f} us/request ({baseline / per_request_us:5.1f}x)  {len(r.content):>5} bytes")
+
+
+if __name__ == "__main__":
+    main_()
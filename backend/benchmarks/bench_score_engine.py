@@ -0,0 +1,95 @@
+"""
+Rows/sec of the vectorized score_engine versus the per-user calculate_final_iscore path,
+plus a parity check of both against the original pure-Python formulas.
+
+Run from the backend folder:
+    python -m benchmarks.bench_score_engine --rows 1000000 --scalar-rows 20000
+"""
+import argparse
+import time
+import uuid
+
+import numpy as np
+
+from app.core.config import settings
+from app.schemas import AllUserDataResponse, DebtData, DerivedPaymentHistory, HistoryData, MixData
+from app.services import score_calculator, score_engine
+
+
+def reference_iscore(on_time, total_due, used, limit, age, types_used):
+    # The original scalar formulas from score_calculator, kept here only to check parity
+    payment = 0.0 if total_due == 0 else round((on_time / total_due) * 100, 2)
+    debt = 0.0 if limit == 0 else round(max(0, (1 - used / limit) * 100), 2)
+    history = 0.0 if settings.MAX_POSSIBLE_AGE_YEARS == 0 else round(min(100, (age / settings.MAX_POSSIBLE_AGE_YEARS) * 100), 2)
+    mix = 0.0 if settings.TOTAL_SYSTEM_CREDIT_TYPES == 0 else round((types_used / settings.TOTAL_SYSTEM_CREDIT_TYPES) * 100, 2)
+    final = sum([payment * 0.35, debt * 0.30, history * 0.15, mix * 0.20])
+    scaled = settings.SCORE_MIN + (final / 100) * (settings.SCORE_MAX - settings.SCORE_MIN)
+    return round(final, 2), round(scaled, 2)
+
+
+def random_columns(rows: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    total_due = rng.integers(0, 40, rows)
+    credit_limit = rng.choice([0, 5000, 10000, 15000, 20000], rows)
+    return {
+        "on_time_payments": rng.integers(0, total_due + 1),
+        "total_due_payments": total_due,
+        "used_credit": rng.integers(0, credit_limit * 1.2 + 1).astype(float),
+        "credit_limit": credit_limit.astype(float),
+        "account_age_years": rng.integers(0, 15, rows),
+        "credit_types_used": rng.integers(0, 5, rows),
+    }
+
+
+def as_user_data(columns: dict, rows: int) -> list:
+    users = []
+    for i in range(rows):
+        user_id = uuid.uuid4()
+        users.append(AllUserDataResponse(
+            derived_payment_history=DerivedPaymentHistory(user_id=user_id, on_time_payments=int(columns["on_time_payments"][i]), total_due_payments=int(columns["total_due_payments"][i])),
+            debt_info=DebtData(user_id=user_id, used_credit=float(columns["used_credit"][i]), credit_limit=float(columns["credit_limit"][i])),
+            history_info=HistoryData(user_id=user_id, account_age_years=int(columns["account_age_years"][i])),
+            mix_info=MixData(user_id=user_id, credit_types_used=int(columns["credit_types_used"][i])),
+        ))
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows for the vectorized engine")
+    parser.add_argument("--scalar-rows", type=int, default=20_000, help="Rows for the per-user path")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    columns = random_columns(args.rows, args.seed)
+    started = time.perf_counter()
+    scores = score_engine.score_columns(**columns)
+    elapsed = time.perf_counter() - started
+    print(f"vectorized engine : {args.rows / elapsed:>14,.0f} rows/s ({args.rows:,} rows in {elapsed:.3f}s)")
+
+    scalar_rows = min(args.scalar_rows, args.rows)
+    users = as_user_data(columns, scalar_rows)
+    started = time.perf_counter()
+    scalar_results = [score_calculator.calculate_final_iscore(user) for user in users]
+    elapsed = time.perf_counter() - started
+    print(f"scalar API        : {scalar_rows / elapsed:>14,.0f} rows/s ({scalar_rows:,} rows in {elapsed:.3f}s)")
+
+    started = time.perf_counter()
+    batch_results = score_calculator.calculate_final_iscore_batch(users)
+    elapsed = time.perf_counter() - started
+    print(f"batch API         : {scalar_rows / elapsed:>14,.0f} rows/s ({scalar_rows:,} rows in {elapsed:.3f}s)")
+
+    mismatches = 0
+    for i in range(scalar_rows):
+        expected = reference_iscore(*(columns[name][i].item() for name in columns))
+        got = [
+            (float(scores["final_unscaled_score"][i]), float(scores["iscore"][i])),
+            (scalar_results[i]["final_unscaled_score"], scalar_results[i]["iscore"]),
+            (batch_results[i]["final_unscaled_score"], batch_results[i]["iscore"]),
+        ]
+        mismatches += sum(1 for g in got if g != expected)
+    print(f"parity with original formulas: {mismatches} mismatches over {scalar_rows:,} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Cost of the on-disk score history: appending one score (what every /iscore miss pays),
+then one user's history and population percentiles over a synthetic history of
+--users users scored --per-day times a day for --days days, in a temporary directory.
+
+Run from the backend folder:
+    python -m benchmarks.bench_score_history --users 100000 --days 30
+"""
+import argparse
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from app.services.score_history import ScoreHistoryStore
+
+
+def columns(count: int, rng) -> dict:
+    return {
+        "payment_raw": rng.uniform(0, 100, count), "debt_raw": rng.uniform(0, 100, count),
+        "history_raw": rng.uniform(0, 100, count), "mix_raw": rng.uniform(0, 100, count),
+        "iscore": rng.uniform(300, 850, count),
+    }
+
+
+def timed(fn, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--per-day", type=int, default=1, help="Scores per user per day")
+    args = parser.parse_args()
+    rng = np.random.default_rng(7)
+    store = ScoreHistoryStore(tempfile.mkdtemp())
+
+    user_ids = [uuid.UUID(int=int(v)) for v in rng.integers(1, 2**63, args.users)]
+    one = columns(1, rng)
+    append_s = timed(lambda: store.append(user_ids[:1], one), 2000)
+    print(f"append 1 record       {append_s * 1e6:10.1f} µs")
+
+    end = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    for day in range(args.days, 0, -1):
+        for _ in range(args.per_day):
+            store.append(user_ids, columns(args.users, rng), computed_at=end - timedelta(days=day))
+    records = args.users * args.days * args.per_day
+    print(f"wrote {records:,} records ({records * 44 / 1e6:.0f} MB) in {time.perf_counter() - started:.1f}s")
+
+    start = end - timedelta(days=args.days + 1)
+    history_s = timed(lambda: store.user_history(user_ids[123], start, end), 5)
+    print(f"user_history {args.days}d     {history_s * 1e3:10.1f} ms")
+    percentiles_s = timed(lambda: store.percentiles(end.date(), [10, 50, 90], args.days + 1), 3)
+    print(f"percentiles {args.days}d      {percentiles_s * 1e3:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
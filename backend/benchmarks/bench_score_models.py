@@ -0,0 +1,70 @@
+"""
+Cost of scoring through compiled models (app.services.score_models): compiling a config,
+scoring one user, scoring --rows users in one array pass, and comparing two versions over a
+synthetic population. Also checks that the built-in v1 plan reproduces the original
+formulas exactly.
+
+The candidate model is a utilization/age-curve variant of v1 built here, in memory.
+
+Run from the backend folder:
+    python -m benchmarks.bench_score_models --rows 1000000
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from app import schemas
+from app.services import score_engine, score_models
+from app.services.synthetic_population import scoring_inputs
+
+
+def timed(fn, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return statistics.median(runs)
+
+
+def candidate_config() -> schemas.ScoringModelConfig:
+    return score_models.builtin_config().model_copy(update={
+        "version": "bench-curves",
+        "utilization_curve": [(0, 100), (0.3, 85), (0.7, 35), (1, 0)],
+        "age_curve": [(0, 0), (2, 40), (5, 75), (10, 100)],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    config = candidate_config()
+    compile_s = timed(lambda: score_models.compile_model(config), 200)
+    print(f"compile model          {compile_s * 1e6:10.1f} µs")
+    baseline, candidate = score_models.compile_model(score_models.builtin_config()), score_models.compile_model(config)
+
+    one = {name: values[:1] for name, values in scoring_inputs(args.seed, 1).items()}
+    single_s = timed(lambda: candidate.score_columns(**one), 2000)
+    print(f"score 1 user           {single_s * 1e6:10.1f} µs")
+
+    columns = scoring_inputs(args.seed, args.rows)
+    batch_s = timed(lambda: candidate.score_columns(**columns), 3)
+    print(f"score {args.rows:,} users  {batch_s * 1e3:10.1f} ms ({args.rows / batch_s:,.0f} rows/s)")
+
+    comparison = score_models.compare(baseline, candidate, columns, args.seed)
+    print(f"compare v1 vs curves   {comparison.seconds * 1e3:10.1f} ms over {comparison.users:,} users "
+          f"(mean change {comparison.mean_change:+.2f}, {comparison.changed_share:.1%} changed)")
+
+    legacy = score_engine.score_columns(**columns, plan=score_engine.default_plan())
+    plan = baseline.score_columns(**columns)
+    mismatches = sum(int(np.count_nonzero(legacy[name] != plan[name])) for name in legacy)
+    print(f"v1 plan parity with the original engine: {mismatches} mismatches")
+
+
+if __name__ == "__main__":
+    main()
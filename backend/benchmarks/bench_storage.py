@@ -0,0 +1,72 @@
+"""
+Time to score one user (all reads plus the calculation) on each storage backend.
+
+  - sqlite: the embedded backend in a temporary file
+  - remote: the remote backend against benchmarks.fakes with --latency per store round
+    trip, standing in for the five managed databases
+
+Users are created and given data through crud first, then scored one at a time with
+the result cache off, so every score does the full set of reads.
+
+Run from the backend folder:
+    python -m benchmarks.bench_storage --users 500 --latency all=40ms
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from app import crud, schemas
+from app.services import iscore_service
+from app.services.score_cache import score_cache
+from app.storage import get_storage, set_storage
+from app.storage.sqlite import SQLiteStorage
+from benchmarks.fakes import FakeDatastores, parse_latencies
+
+
+def populate(users: int) -> list:
+    user_ids = []
+    for i in range(users):
+        user = crud.create_user(schemas.UserCreate(username=f"bench_storage_{i}", email=f"bench_storage_{i}@example.com"))
+        crud.generate_and_store_user_data(user.user_id)
+        user_ids.append(user.user_id)
+    return user_ids
+
+
+async def score_latencies(user_ids: list, samples: int) -> list:
+    latencies = []
+    for user_id in random.sample(user_ids * (samples // len(user_ids) + 1), samples):
+        started = time.perf_counter()
+        await iscore_service.score_user(user_id)
+        latencies.append(time.perf_counter() - started)
+    return sorted(latencies)
+
+
+def report(name: str, latencies: list):
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<8} median {statistics.median(latencies) * 1e6:10.1f} µs   p95 {p95 * 1e6:10.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--samples", type=int, default=1000, help="Users scored per backend")
+    parser.add_argument("--latency", default="all=40ms", help="Per-store round trip for the remote backend's fakes")
+    args = parser.parse_args()
+    score_cache.backend = None
+
+    set_storage(SQLiteStorage(os.path.join(tempfile.mkdtemp(), "bench_storage.sqlite3")))
+    report("sqlite", asyncio.run(score_latencies(populate(args.users), args.samples)))
+
+    fakes = FakeDatastores().install() # No latency while populating
+    get_storage().open()
+    user_ids = populate(args.users)
+    fakes.set_latencies(parse_latencies(args.latency))
+    report("remote", asyncio.run(score_latencies(user_ids, max(20, args.samples // 50))))
+
+
+if __name__ == "__main__":
+    main()
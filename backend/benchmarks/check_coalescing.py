@@ -0,0 +1,95 @@
+"""
+Asserts single-flight coalescing of /iscore computations (app.services.score_flights)
+against the counting fakes of benchmarks.fakes, on the remote backend with the result
+cache off and /iscore reading the source stores (CREDIT_PROFILE_MODE=off):
+
+- --requests concurrent score_user calls for one user read each store exactly once (the
+  same calls, store by store, as a single computation) and all get the same score;
+- a change notified (notify_user_data_changed) while a computation is in flight makes the
+  calls after it start a second one, so each store is read exactly twice, while the calls
+  before it still share the first;
+- with coalescing off, every call does its own reads.
+
+Exits with status 1 (an AssertionError) if any of these doesn't hold.
+
+Run from the backend folder:
+    python -m benchmarks.check_coalescing --requests 50
+"""
+import argparse
+import asyncio
+from collections import Counter
+
+from app import crud, schemas
+from app.core.config import settings
+from app.core.events import notify_user_data_changed
+from app.services import iscore_service
+from app.services.score_cache import score_cache
+from app.services.score_flights import score_flights
+from app.storage import get_storage
+from benchmarks.fakes import FakeDatastores, parse_latencies
+
+
+def calls(fakes) -> Counter:
+    return Counter(dict(fakes.stats.calls))
+
+
+async def concurrent(user_id, requests: int) -> list:
+    return await asyncio.gather(*(iscore_service.score_user(user_id) for _ in range(requests)))
+
+
+async def change_during_flight(user_id, requests: int) -> tuple:
+    """(scores of the calls made before the change, scores of those made after it)."""
+    before = [asyncio.ensure_future(iscore_service.score_user(user_id)) for _ in range(requests)]
+    await asyncio.sleep(0.01) # The first computation's reads are under way
+    notify_user_data_changed(user_id)
+    after = [asyncio.ensure_future(iscore_service.score_user(user_id)) for _ in range(requests)]
+    return await asyncio.gather(*before), await asyncio.gather(*after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50, help="Concurrent calls for the same user")
+    parser.add_argument("--latency", default="all=40ms", help="Per-store round trip of the fakes; long enough for the calls to overlap")
+    args = parser.parse_args()
+    score_cache.backend = None
+    settings.CREDIT_PROFILE_MODE = "off"
+    score_flights.enabled = True
+
+    fakes = FakeDatastores().install()
+    get_storage().open()
+    user = crud.create_user(schemas.UserCreate(username="check_coalescing", email="check_coalescing@example.com"))
+    crud.generate_and_store_user_data(user.user_id)
+    fakes.set_latencies(parse_latencies(args.latency))
+
+    fakes.stats.reset()
+    asyncio.run(iscore_service.score_user(user.user_id))
+    one_set = calls(fakes)
+    assert one_set and set(one_set.values()) == {1}, f"one computation should read each store once: {dict(one_set)}"
+
+    fakes.stats.reset()
+    leaders = score_flights.leaders
+    scores = asyncio.run(concurrent(user.user_id, args.requests))
+    assert calls(fakes) == one_set, f"{args.requests} concurrent calls: {dict(calls(fakes))}, expected {dict(one_set)}"
+    assert score_flights.leaders - leaders == 1, f"{score_flights.leaders - leaders} computations, expected 1"
+    assert len({s.model_dump_json(exclude={'data_as_of', 'staleness_seconds'}) for s in scores}) == 1, "calls got different scores"
+    print(f"ok  {args.requests} concurrent calls: {dict(calls(fakes))}")
+
+    fakes.stats.reset()
+    leaders = score_flights.leaders
+    before, after = asyncio.run(change_during_flight(user.user_id, args.requests))
+    expected = Counter({key: 2 * n for key, n in one_set.items()})
+    assert calls(fakes) == expected, f"change during a flight: {dict(calls(fakes))}, expected {dict(expected)}"
+    assert score_flights.leaders - leaders == 2, f"{score_flights.leaders - leaders} computations, expected 2"
+    assert len(before) == len(after) == args.requests
+    print(f"ok  change during a flight: {args.requests} calls before and after it made {dict(calls(fakes))}")
+
+    fakes.stats.reset()
+    score_flights.enabled = False
+    asyncio.run(concurrent(user.user_id, args.requests))
+    expected = Counter({key: args.requests * n for key, n in one_set.items()})
+    assert calls(fakes) == expected, f"coalescing off: {dict(calls(fakes))}, expected {dict(expected)}"
+    print(f"ok  coalescing off: {dict(calls(fakes))}")
+
+
+if __name__ == "__main__":
+    main()
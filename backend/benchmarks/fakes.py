@@ -0,0 +1,447 @@
+"""
+In-memory stand-ins for the five datastores, covering exactly the calls app.storage.remote makes:
+psycopg2 connections/cursors (Neon), Supabase table queries and RPCs (Supabase 1 and 2)
+and pymongo Collections (MongoDB 1 and 2). Each store sleeps for a configurable latency
+per round trip so benchmarks can model remote stores without any network.
+"""
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from types import SimpleNamespace
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+STORES = ("neon", "payments_db", "history_db", "debt_db", "mix_db")
+
+
+class StoreStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = defaultdict(int) # (store, operation) -> count
+
+    def record(self, store: str, operation: str):
+        with self._lock:
+            self.calls[(store, operation)] += 1
+
+    def total(self, store: Optional[str] = None) -> int:
+        with self._lock:
+            return sum(n for (s, _), n in self.calls.items() if store is None or s == store)
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+
+class _Latency:
+    def __init__(self, store: str, seconds: float, stats: StoreStats):
+        self.store = store
+        self.seconds = seconds
+        self.stats = stats
+        self.down = False
+
+    def round_trip(self, operation: str):
+        self.stats.record(self.store, operation)
+        if self.seconds:
+            time.sleep(self.seconds)
+        if self.down:
+            raise ConnectionError(f"{self.store} is down")
+
+
+# --- Neon (psycopg2) -------------------------------------------------------------------
+
+class FakeNeonDatabase:
+    def __init__(self, latency: _Latency):
+        self.latency = latency
+        self.users: Dict[str, dict] = {}
+        self.credit_profiles: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def connect(self):
+        return FakeNeonConnection(self)
+
+
+class FakeNeonConnection:
+    def __init__(self, db: FakeNeonDatabase):
+        self.db = db
+        self.closed = 0
+
+    def cursor(self, cursor_factory=None):
+        return FakeNeonCursor(self.db)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeNeonCursor:
+    def __init__(self, db: FakeNeonDatabase):
+        self.db = db
+        self._rows: List[dict] = []
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql: str, params=()):
+        self.db.latency.round_trip(sql.split()[0].lower())
+        sql = " ".join(sql.split())
+        with self.db.lock:
+            users = self.db.users
+            if sql.startswith("INSERT INTO users"):
+                username, email = params
+                if any(u["username"] == username or (email and u["email"] == email) for u in users.values()):
+                    raise _unique_violation()
+                row = {"user_id": uuid.uuid4(), "username": username, "email": email, "created_at": datetime.now(timezone.utc)}
+                users[str(row["user_id"])] = row
+                self._rows = [dict(row)]
+            elif sql.startswith("SELECT * FROM users WHERE user_id = %s"):
+                row = users.get(params[0])
+                self._rows = [dict(row)] if row else []
+            elif sql.startswith("SELECT * FROM users WHERE user_id IN %s"):
+                self._rows = [dict(users[u]) for u in params[0] if u in users]
+            elif sql.startswith("SELECT * FROM users WHERE user_id > %s ORDER BY user_id LIMIT %s"):
+                after, limit = params
+                keys = sorted(k for k in users if uuid.UUID(k) > uuid.UUID(after))[:limit]
+                self._rows = [dict(users[k]) for k in keys]
+            elif sql == "SELECT 1;": # Health check
+                self._rows = [{"?column?": 1}]
+            elif sql.startswith("SELECT * FROM users ORDER BY user_id LIMIT %s"):
+                keys = sorted(users, key=uuid.UUID)[:params[0]]
+                self._rows = [dict(users[k]) for k in keys]
+            elif "credit_profiles" in sql:
+                self._credit_profiles(sql, list(params))
+            else:
+                raise NotImplementedError(f"FakeNeonCursor doesn't support: {sql}")
+
+    def _credit_profiles(self, sql: str, params: list):
+        # The statements app.storage.remote builds for the credit_profiles read model
+        profiles = self.db.credit_profiles
+        params = [getattr(p, "adapted", p) for p in params] # psycopg2.extras.Json
+        if sql.startswith("SELECT * FROM credit_profiles WHERE user_id = %s"):
+            row = profiles.get(params[0])
+            self._rows = [dict(row)] if row else []
+        elif sql.startswith("SELECT * FROM credit_profiles WHERE user_id IN %s"):
+            self._rows = [dict(profiles[u]) for u in params[0] if u in profiles]
+        elif sql.startswith("INSERT INTO credit_profiles"):
+            columns = [c.strip() for c in re.search(r"\(([^)]*)\) VALUES", sql).group(1).split(",")]
+            record = dict(zip(columns, params))
+            existing = profiles.get(record["user_id"])
+            self.rowcount = 0
+            if "DO NOTHING" in sql: # save_credit_profiles, new profile
+                if existing is None:
+                    profiles[record["user_id"]] = {**record, "stale": False, "updated_at": datetime.now(timezone.utc)}
+                    self.rowcount = 1
+                return
+            # apply_credit_profile_change: the last parameter is the `stale` flag for an existing row
+            record.update({"version": 1, "stale": True, "updated_at": datetime.now(timezone.utc)})
+            if existing is None:
+                profiles[record["user_id"]] = existing = record
+            else:
+                for column, value in record.items():
+                    if column in ("on_time_payments", "total_due_payments"):
+                        existing[column] = existing.get(column, 0) + value
+                    elif column not in ("version", "stale"):
+                        existing[column] = value
+                existing["version"] += 1
+                existing["stale"] = existing["stale"] or params[-1]
+            self.rowcount = 1
+            self._rows = [dict(existing)]
+        elif sql.startswith("UPDATE credit_profiles SET"):
+            columns = re.findall(r"(\w+) = %s", sql.split(" WHERE ")[0])
+            *values, user_id, expected_version = params
+            existing = profiles.get(user_id)
+            self.rowcount = 0
+            if existing is not None and existing["version"] == expected_version:
+                existing.update(zip(columns, values))
+                existing.update({"stale": False, "updated_at": datetime.now(timezone.utc)})
+                self.rowcount = 1
+        else:
+            raise NotImplementedError(f"FakeNeonCursor doesn't support: {sql}")
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+def _unique_violation():
+    import psycopg2
+    error = psycopg2.IntegrityError("duplicate key value violates unique constraint")
+    # crud.create_user reads pgcode/pgerror/diag; IntegrityError exposes them read-only, so wrap it
+    class UniqueViolation(psycopg2.IntegrityError):
+        pgcode = "23505"
+        pgerror = str(error)
+        diag = None
+    return UniqueViolation(str(error))
+
+
+# --- Supabase (PostgREST) --------------------------------------------------------------
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeSupabaseClient:
+    """Tables are lists of row dicts. Inserts into payment_transactions maintain
+    payment_history_rollups the way the database triggers do."""
+
+    def __init__(self, latency: _Latency):
+        self.latency = latency
+        self.tables: Dict[str, List[dict]] = defaultdict(list)
+        self.lock = threading.Lock()
+        self._next_id = 1
+        self._rollups: Dict[str, dict] = {} # user_id -> its payment_history_rollups row
+
+    def table(self, name: str) -> "FakeQuery":
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict) -> "FakeQuery":
+        return FakeQuery(self, None, rpc=(name, params))
+
+    def _insert(self, table: str, records: List[dict]) -> List[dict]:
+        now = datetime.now(timezone.utc).isoformat()
+        inserted = []
+        for record in records:
+            row = dict(record)
+            if table == "payment_transactions":
+                row.update(transaction_id=self._next_id, created_at=now, last_updated=now)
+                self._next_id += 1
+                self._bump_rollup(row["user_id"], bool(row.get("is_on_time")))
+            self.tables[table].append(row)
+            inserted.append(dict(row))
+        return inserted
+
+    def _bump_rollup(self, user_id: str, on_time: bool):
+        rollup = self._rollups.get(user_id)
+        if rollup is None:
+            rollup = self._rollups[user_id] = {"user_id": user_id, "on_time_payments": 0, "total_due_payments": 0}
+            self.tables["payment_history_rollups"].append(rollup)
+        rollup["total_due_payments"] += 1
+        rollup["on_time_payments"] += int(on_time)
+
+    def _upsert(self, table: str, record: dict, on_conflict: str) -> List[dict]:
+        rows = self.tables[table]
+        for row in rows:
+            if row[on_conflict] == record[on_conflict]:
+                row.update(record)
+                return [dict(row)]
+        rows.append(dict(record))
+        if table == "payment_history_rollups":
+            self._rollups[record[on_conflict]] = rows[-1]
+        return [dict(record)]
+
+    def _call_rpc(self, name: str, params: dict) -> list:
+        user_ids = params.get("p_user_ids")
+        counts = defaultdict(lambda: [0, 0])
+        for row in self.tables["payment_transactions"]:
+            if user_ids is None or row["user_id"] in user_ids:
+                counts[row["user_id"]][1] += 1
+                counts[row["user_id"]][0] += int(bool(row.get("is_on_time")))
+        if name in ("payment_history_rollup_drift", "rebuild_payment_history_rollups"):
+            rollups = {r["user_id"]: r for r in self.tables["payment_history_rollups"] if user_ids is None or r["user_id"] in user_ids}
+            drift = []
+            for u in set(counts) | set(rollups):
+                actual = counts.get(u, [0, 0])
+                rollup = rollups.get(u, {"on_time_payments": 0, "total_due_payments": 0})
+                if [rollup["on_time_payments"], rollup["total_due_payments"]] != actual:
+                    drift.append({"user_id": u, "rollup_on_time_payments": rollup["on_time_payments"], "rollup_total_due_payments": rollup["total_due_payments"],
+                                  "actual_on_time_payments": actual[0], "actual_total_due_payments": actual[1]})
+            if name == "payment_history_rollup_drift":
+                return drift
+            for d in drift:
+                self._upsert("payment_history_rollups", {"user_id": d["user_id"], "on_time_payments": d["actual_on_time_payments"], "total_due_payments": d["actual_total_due_payments"]}, "user_id")
+            return len(drift)
+        raise NotImplementedError(f"FakeSupabaseClient doesn't support rpc {name}")
+
+
+class FakeQuery:
+    def __init__(self, client: FakeSupabaseClient, table: Optional[str], rpc=None):
+        self.client = client
+        self.table_name = table
+        self.rpc_call = rpc
+        self.columns = None
+        self.filters = []
+        self.order_by = None
+        self.row_range = None
+        self.write = None
+
+    def select(self, columns: str = "*", **kwargs):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def range(self, start, end):
+        self.row_range = (start, end)
+        return self
+
+    def limit(self, count):
+        self.row_range = (0, count - 1)
+        return self
+
+    def insert(self, records, returning=None):
+        self.write = ("insert", records if isinstance(records, list) else [records], returning)
+        return self
+
+    def upsert(self, record, on_conflict=None):
+        self.write = ("upsert", record, on_conflict)
+        return self
+
+    def execute(self) -> FakeResponse:
+        operation = self.rpc_call[0] if self.rpc_call else (self.write[0] if self.write else "select")
+        self.client.latency.round_trip(operation)
+        with self.client.lock:
+            if self.rpc_call:
+                return FakeResponse(self.client._call_rpc(*self.rpc_call))
+            if self.write and self.write[0] == "insert":
+                inserted = self.client._insert(self.table_name, self.write[1])
+                return FakeResponse([] if self.write[2] == "minimal" else inserted)
+            if self.write:
+                return FakeResponse(self.client._upsert(self.table_name, self.write[1], self.write[2]))
+            rows = [r for r in self.client.tables[self.table_name] if all(f(r) for f in self.filters)]
+        if self.order_by:
+            column, desc = self.order_by
+            rows.sort(key=lambda r: r[column], reverse=desc)
+        if self.row_range:
+            rows = rows[self.row_range[0]:self.row_range[1] + 1]
+        if self.columns:
+            rows = [{c: r.get(c) for c in self.columns} for r in rows]
+        return FakeResponse([dict(r) for r in rows])
+
+
+# --- MongoDB (pymongo) -----------------------------------------------------------------
+
+class FakeCollection:
+    def __init__(self, latency: _Latency):
+        self.latency = latency
+        self.docs: Dict[str, dict] = {} # keyed by user_id; the only key crud looks documents up by
+        self.lock = threading.Lock()
+        # Just enough of collection.database.client for the datastores health check and shutdown
+        admin = SimpleNamespace(command=lambda name: self.latency.round_trip(name) or {"ok": 1.0})
+        self.database = SimpleNamespace(client=SimpleNamespace(admin=admin, close=lambda: None))
+
+    def _matches(self, doc: dict, query: dict) -> bool:
+        for field, condition in query.items():
+            if isinstance(condition, dict) and "$in" in condition:
+                if doc.get(field) not in condition["$in"]:
+                    return False
+            elif doc.get(field) != condition:
+                return False
+        return True
+
+    @staticmethod
+    def _project(doc: dict, projection: Optional[dict]) -> dict:
+        if not projection:
+            return dict(doc)
+        return {k: v for k, v in doc.items() if projection.get(k)}
+
+    def find_one(self, query: dict, projection: Optional[dict] = None):
+        self.latency.round_trip("find_one")
+        with self.lock:
+            if set(query) == {"user_id"} and not isinstance(query["user_id"], dict):
+                doc = self.docs.get(query["user_id"])
+                return self._project(doc, projection) if doc else None
+            return next((self._project(d, projection) for d in self.docs.values() if self._matches(d, query)), None)
+
+    def find(self, query: dict, projection: Optional[dict] = None):
+        self.latency.round_trip("find")
+        with self.lock:
+            condition = query.get("user_id")
+            if isinstance(condition, dict) and set(query) == {"user_id"} and "$in" in condition:
+                return [self._project(self.docs[u], projection) for u in condition["$in"] if u in self.docs]
+            return [self._project(d, projection) for d in self.docs.values() if self._matches(d, query)]
+
+    def update_one(self, query: dict, update: dict, upsert: bool = False):
+        self.latency.round_trip("update_one")
+        with self.lock:
+            user_id = query["user_id"]
+            doc = self.docs.get(user_id)
+            if doc is None:
+                if not upsert:
+                    return
+                doc = self.docs[user_id] = {"_id": uuid.uuid4().hex, "user_id": user_id}
+            doc.update(update.get("$set", {}))
+
+    def insert_many(self, docs, ordered=True):
+        self.latency.round_trip("insert_many")
+        with self.lock:
+            for doc in docs:
+                self.docs[doc["user_id"]] = dict(doc)
+
+
+# --- Wiring ----------------------------------------------------------------------------
+
+class FakeDatastores:
+    """All five stores plus a shared call counter. `latencies` maps store name to seconds."""
+
+    def __init__(self, latencies: Optional[Dict[str, float]] = None):
+        latencies = latencies or {}
+        self.stats = StoreStats()
+        self.latency = latency = {store: _Latency(store, latencies.get(store, 0.0), self.stats) for store in STORES}
+        self.neon = FakeNeonDatabase(latency["neon"])
+        self.payments_db = FakeSupabaseClient(latency["payments_db"])
+        self.history_db = FakeSupabaseClient(latency["history_db"])
+        self.debt_collection = FakeCollection(latency["debt_db"])
+        self.mix_collection = FakeCollection(latency["mix_db"])
+
+    def install(self):
+        """Selects the remote storage backend and points its clients (and the Neon pool) at these fakes."""
+        from app.core import datastores
+        from app.core.neon_pool import neon_pool
+        from app.storage import set_storage
+        from app.storage.remote import RemoteStorage
+
+        set_storage(RemoteStorage())
+
+        datastores.payments_db.override(self.payments_db)
+        datastores.history_db.override(self.history_db)
+        datastores.debt_db.override(self.debt_collection)
+        datastores.mix_db.override(self.mix_collection)
+        neon_pool.close()
+        neon_pool._connect = self.neon.connect
+        return self
+
+    def set_latencies(self, latencies: Dict[str, float]):
+        for store, seconds in latencies.items():
+            self.latency[store].seconds = seconds
+
+    def set_down(self, stores: List[str], down: bool = True):
+        """Makes every call to `stores` fail (after its latency), like an outage."""
+        for store in stores:
+            self.latency[store].down = down
+
+
+def parse_latencies(spec: str) -> Dict[str, float]:
+    """'neon=20ms,payments_db=35ms' -> {'neon': 0.02, 'payments_db': 0.035}; 'all=10ms' sets every store."""
+    latencies: Dict[str, float] = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        store, value = part.split("=")
+        seconds = float(value[:-2]) / 1000 if value.endswith("ms") else float(value.rstrip("s"))
+        for name in (STORES if store == "all" else [store]):
+            if name not in STORES:
+                raise ValueError(f"Unknown store '{name}'. Choose from: {', '.join(STORES)} or all.")
+            latencies[name] = seconds
+    return latencies
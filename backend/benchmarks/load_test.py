@@ -0,0 +1,185 @@
+"""
+Offline load test of the FastAPI app against in-memory fakes of all five datastores.
+
+The app runs in-process behind httpx's ASGI transport, with the remote storage backend
+pointed at benchmarks.fakes. Each store sleeps for an injected latency per round trip, so
+the results show the API's own overhead plus how well it overlaps store latency.
+With --storage sqlite it runs against the embedded backend in a temporary file instead.
+It needs no network access or credentials: the fakes (or the SQLite backend) are in place
+before the app is imported, and no datastore client is created until first use.
+
+Run from the backend folder:
+    python -m benchmarks.load_test --users 200 --concurrency 1,8,32 --latency all=20ms
+    python -m benchmarks.load_test --latency neon=15ms,payments_db=40ms --compare benchmarks/results/<earlier>.json
+
+Each run saves a JSON report to benchmarks/results/. With --compare, throughput or p95
+changes beyond --regression-threshold are flagged and the exit status is 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from app.core.config import settings
+from benchmarks.fakes import FakeDatastores, parse_latencies
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+async def drive(client: httpx.AsyncClient, make_request, total: int, concurrency: int, on_response=None) -> dict:
+    """Sends `total` requests with `concurrency` in flight; make_request(i) returns (method, url, json)."""
+    latencies, errors = [], 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, body = make_request(i)
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+            elif on_response:
+                on_response(response)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(total / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+async def run(args) -> dict:
+    # The storage backend is chosen before the app is imported, so nothing reaches for a real store
+    if args.storage == "sqlite":
+        from app.storage import set_storage
+        from app.storage.sqlite import SQLiteStorage
+        set_storage(SQLiteStorage(os.path.join(tempfile.mkdtemp(), "load_test.sqlite3")))
+    else:
+        FakeDatastores(parse_latencies(args.latency)).install()
+    from app import main
+    from app.services.score_cache import score_cache
+
+    if not args.score_cache:
+        score_cache.backend = None # Measure the fetch path, not cache hits
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    results = []
+
+    def record(scenario: str, stats: dict):
+        stats["scenario"] = scenario
+        results.append(stats)
+        print(f"{scenario:<16} c={stats['concurrency']:<4} {stats['throughput_rps']:>9.1f} req/s  "
+              f"p50={stats['p50_ms']:>8.2f}ms  p95={stats['p95_ms']:>8.2f}ms  p99={stats['p99_ms']:>8.2f}ms  errors={stats['errors']}")
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            run_id = int(time.time())
+            user_ids = []
+            for level in levels:
+                offset = len(user_ids)
+                created = []
+
+                def create_user(i):
+                    return "POST", "/users/", {"username": f"bench_{run_id}_{offset + i}", "email": f"bench_{run_id}_{offset + i}@example.com"}
+
+                record("create_user", await drive(client, create_user, args.users, level, on_response=lambda r: created.append(r.json()["user_id"])))
+                user_ids.extend(created)
+
+                record("generate_data", await drive(client, lambda i: ("POST", f"/users/{created[i % len(created)]}/generate-data/", None), len(created), level))
+                record("iscore", await drive(client, lambda i: ("GET", f"/iscore/{user_ids[i % len(user_ids)]}", None), args.requests, level))
+                record("iscore_compact", await drive(client, lambda i: ("GET", f"/iscore/{user_ids[i % len(user_ids)]}?view=compact", None), args.requests, level))
+
+                batch_requests = max(1, args.requests // args.batch_size)
+                def batch(i):
+                    start = (i * args.batch_size) % len(user_ids)
+                    return "POST", "/iscore/batch", {"user_ids": (user_ids[start:] + user_ids[:start])[:args.batch_size]}
+                record("iscore_batch", await drive(client, batch, batch_requests, level))
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "users_per_level": args.users,
+            "requests_per_level": args.requests,
+            "batch_size": args.batch_size,
+            "storage": args.storage,
+            "latency": parse_latencies(args.latency) if args.storage == "fakes" else {},
+            "score_cache": args.score_cache,
+            "score_fetch_mode": settings.SCORE_FETCH_MODE,
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline_path: str, threshold: float) -> bool:
+    """Prints changes against an earlier report; returns True if anything regressed."""
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    regressed = False
+    print(f"\nCompared with {baseline_path}:")
+    for r in report["results"]:
+        old = baseline.get((r["scenario"], r["concurrency"]))
+        if not old:
+            continue
+        rps_change = (r["throughput_rps"] - old["throughput_rps"]) / old["throughput_rps"] if old["throughput_rps"] else 0.0
+        p95_change = (r["p95_ms"] - old["p95_ms"]) / old["p95_ms"] if old["p95_ms"] else 0.0
+        flag = rps_change < -threshold or p95_change > threshold
+        regressed |= flag
+        print(f"{'REGRESSION ' if flag else '           '}{r['scenario']:<16} c={r['concurrency']:<4} throughput {rps_change:+7.1%}  p95 {p95_change:+7.1%}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100, help="Users created (and given data) per concurrency level")
+    parser.add_argument("--requests", type=int, default=500, help="/iscore requests per scenario and concurrency level")
+    parser.add_argument("--batch-size", type=int, default=100, help="User ids per /iscore/batch request")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--storage", choices=("fakes", "sqlite"), default="fakes", help="Remote backend on in-memory fakes, or the embedded SQLite backend")
+    parser.add_argument("--latency", default="all=10ms", help="Per-store latency for --storage fakes, e.g. neon=15ms,payments_db=40ms or all=10ms")
+    parser.add_argument("--score-cache", action="store_true", help="Keep the /iscore result cache enabled")
+    parser.add_argument("--out", help="Report path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier report to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=0.10, help="Relative change that counts as a regression")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    out = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {out}")
+
+    if args.compare and compare(report, args.compare, args.regression_threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
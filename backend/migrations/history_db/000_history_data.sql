@@ -0,0 +1,8 @@
+-- Supabase 2 (history DB).
+-- Base table as read and written by crud.create_or_update_history_data / crud.get_history_data.
+-- upsert(on_conflict="user_id") needs user_id to be unique.
+CREATE TABLE IF NOT EXISTS history_data (
+    user_id uuid PRIMARY KEY,
+    account_age_years integer NOT NULL,
+    last_updated timestamptz NOT NULL DEFAULT now()
+);
@@ -0,0 +1,8 @@
+-- Neon (user DB).
+-- Base table as read and written by crud.create_user / crud.get_user.
+CREATE TABLE IF NOT EXISTS users (
+    user_id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    username text NOT NULL UNIQUE,
+    email text UNIQUE,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
@@ -0,0 +1,25 @@
+-- Neon (user DB).
+-- Credit profile read model: one row per user with every scoring input (copied from the
+-- four factor stores) and the last score computed from them, so /iscore can be served from
+-- a single primary-key read. Maintained by crud writes through app.services.credit_profiles;
+-- `python -m app.services.credit_profile_sync rebuild` backfills it and `check` compares
+-- it against the source stores.
+CREATE TABLE IF NOT EXISTS credit_profiles (
+    user_id uuid PRIMARY KEY,
+    username text,
+    email text,
+    user_created_at timestamptz,
+    on_time_payments integer NOT NULL DEFAULT 0,
+    total_due_payments integer NOT NULL DEFAULT 0,
+    used_credit double precision,
+    credit_limit double precision,
+    account_age_years integer,
+    credit_types_used integer,
+    components jsonb,
+    final_unscaled_score double precision,
+    iscore double precision,
+    score_version bigint, -- version the stored score was computed from
+    version bigint NOT NULL DEFAULT 0, -- bumped by every change to the inputs
+    stale boolean NOT NULL DEFAULT false, -- not known to match the source stores; served live until repaired
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
@@ -0,0 +1,4 @@
+-- Neon (user DB).
+-- Scoring model (app.services.score_models) the stored score was computed with; a profile
+-- whose model isn't the active one is rescored when it's served.
+ALTER TABLE credit_profiles ADD COLUMN IF NOT EXISTS model_version text;
@@ -0,0 +1,14 @@
+-- Supabase 1 (payments DB).
+-- Base table as read and written by crud.add_payment_transaction and friends.
+CREATE TABLE IF NOT EXISTS payment_transactions (
+    transaction_id bigserial PRIMARY KEY,
+    user_id uuid NOT NULL,
+    loan_or_account_id text,
+    due_date date NOT NULL,
+    payment_date date,
+    amount_due numeric(12, 2) NOT NULL,
+    is_on_time boolean,
+    transaction_type text,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    last_updated timestamptz NOT NULL DEFAULT now()
+);
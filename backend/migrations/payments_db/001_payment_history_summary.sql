@@ -0,0 +1,16 @@
+-- Supabase 1 (payments DB).
+-- Payment history counts per user, aggregated in the database so the API gets
+-- two integers back per user instead of every payment_transactions row.
+-- Users without transactions are simply absent from the result.
+CREATE OR REPLACE FUNCTION payment_history_summary(p_user_ids uuid[])
+RETURNS TABLE (user_id uuid, on_time_payments integer, total_due_payments integer)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT t.user_id,
+           (COUNT(*) FILTER (WHERE t.is_on_time))::integer AS on_time_payments,
+           COUNT(*)::integer AS total_due_payments
+    FROM payment_transactions t
+    WHERE t.user_id = ANY (p_user_ids)
+    GROUP BY t.user_id;
+$$;
@@ -0,0 +1,123 @@
+-- Supabase 1 (payments DB).
+-- Per-user payment history counters, kept in step with payment_transactions by
+-- statement-level triggers. They run in the same transaction as the write, so a bulk
+-- insert of N rows costs one grouped upsert instead of N. Scoring then reads a single
+-- row by primary key instead of aggregating the user's transactions.
+CREATE TABLE IF NOT EXISTS payment_history_rollups (
+    user_id uuid PRIMARY KEY,
+    on_time_payments integer NOT NULL DEFAULT 0,
+    total_due_payments integer NOT NULL DEFAULT 0,
+    last_updated timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION apply_payment_history_rollup_deltas()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO payment_history_rollups AS r (user_id, on_time_payments, total_due_payments)
+        SELECT user_id, COUNT(*) FILTER (WHERE is_on_time), COUNT(*)
+        FROM new_rows GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+            SET on_time_payments = r.on_time_payments + EXCLUDED.on_time_payments,
+                total_due_payments = r.total_due_payments + EXCLUDED.total_due_payments,
+                last_updated = now();
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE payment_history_rollups r
+            SET on_time_payments = r.on_time_payments - d.on_time,
+                total_due_payments = r.total_due_payments - d.total,
+                last_updated = now()
+        FROM (SELECT user_id, COUNT(*) FILTER (WHERE is_on_time) AS on_time, COUNT(*) AS total
+              FROM old_rows GROUP BY user_id) d
+        WHERE r.user_id = d.user_id;
+    ELSE -- UPDATE: is_on_time (or user_id) may have changed
+        INSERT INTO payment_history_rollups AS r (user_id, on_time_payments, total_due_payments)
+        SELECT user_id, SUM(on_time), SUM(total)
+        FROM (SELECT user_id, (is_on_time IS TRUE)::integer AS on_time, 1 AS total FROM new_rows
+              UNION ALL
+              SELECT user_id, -(is_on_time IS TRUE)::integer, -1 FROM old_rows) d
+        GROUP BY user_id
+        HAVING SUM(on_time) <> 0 OR SUM(total) <> 0
+        ON CONFLICT (user_id) DO UPDATE
+            SET on_time_payments = r.on_time_payments + EXCLUDED.on_time_payments,
+                total_due_payments = r.total_due_payments + EXCLUDED.total_due_payments,
+                last_updated = now();
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS payment_history_rollups_insert ON payment_transactions;
+CREATE TRIGGER payment_history_rollups_insert
+    AFTER INSERT ON payment_transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_payment_history_rollup_deltas();
+
+DROP TRIGGER IF EXISTS payment_history_rollups_update ON payment_transactions;
+CREATE TRIGGER payment_history_rollups_update
+    AFTER UPDATE ON payment_transactions
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_payment_history_rollup_deltas();
+
+DROP TRIGGER IF EXISTS payment_history_rollups_delete ON payment_transactions;
+CREATE TRIGGER payment_history_rollups_delete
+    AFTER DELETE ON payment_transactions
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_payment_history_rollup_deltas();
+
+-- Users whose rollup disagrees with their raw transactions (all users when p_user_ids is NULL).
+CREATE OR REPLACE FUNCTION payment_history_rollup_drift(p_user_ids uuid[] DEFAULT NULL)
+RETURNS TABLE (user_id uuid, rollup_on_time_payments integer, rollup_total_due_payments integer,
+               actual_on_time_payments integer, actual_total_due_payments integer)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH actual AS (
+        SELECT t.user_id, COUNT(*) FILTER (WHERE t.is_on_time) AS on_time, COUNT(*) AS total
+        FROM payment_transactions t
+        WHERE p_user_ids IS NULL OR t.user_id = ANY (p_user_ids)
+        GROUP BY t.user_id
+    ), rollups AS (
+        SELECT r.user_id, r.on_time_payments, r.total_due_payments
+        FROM payment_history_rollups r
+        WHERE p_user_ids IS NULL OR r.user_id = ANY (p_user_ids)
+    )
+    SELECT COALESCE(a.user_id, r.user_id),
+           COALESCE(r.on_time_payments, 0), COALESCE(r.total_due_payments, 0),
+           COALESCE(a.on_time, 0)::integer, COALESCE(a.total, 0)::integer
+    FROM actual a
+    FULL OUTER JOIN rollups r ON r.user_id = a.user_id
+    WHERE COALESCE(r.on_time_payments, 0) <> COALESCE(a.on_time, 0)
+       OR COALESCE(r.total_due_payments, 0) <> COALESCE(a.total, 0);
+$$;
+
+-- Recomputes rollups from raw transactions and returns how many users were corrected.
+-- Writes to payment_transactions wait until it finishes so the recount can't race the triggers.
+CREATE OR REPLACE FUNCTION rebuild_payment_history_rollups(p_user_ids uuid[] DEFAULT NULL)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    corrected integer;
+BEGIN
+    LOCK TABLE payment_transactions IN SHARE MODE;
+
+    WITH drift AS (
+        SELECT * FROM payment_history_rollup_drift(p_user_ids)
+    ), fixed AS (
+        INSERT INTO payment_history_rollups AS r (user_id, on_time_payments, total_due_payments)
+        SELECT user_id, actual_on_time_payments, actual_total_due_payments FROM drift
+        ON CONFLICT (user_id) DO UPDATE
+            SET on_time_payments = EXCLUDED.on_time_payments,
+                total_due_payments = EXCLUDED.total_due_payments,
+                last_updated = now()
+        RETURNING 1
+    )
+    SELECT COUNT(*) INTO corrected FROM fixed;
+    RETURN corrected;
+END;
+$$;
+
+-- Backfill counters for transactions that existed before the triggers.
+SELECT rebuild_payment_history_rollups();
@@ -0,0 +1,8 @@
+-- no-transaction
+-- Supabase 1 (payments DB).
+-- get_payment_transactions_for_user filters on user_id and orders by due_date; this index
+-- answers both, so it's one range read instead of a scan and sort of the whole table.
+-- CONCURRENTLY keeps the table writable while it builds, which rules out a transaction
+-- (hence the first line). A failed build leaves an INVALID index that IF NOT EXISTS skips:
+-- `check` then reports the scan; DROP INDEX payment_transactions_user_due and apply again.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS payment_transactions_user_due ON payment_transactions (user_id, due_date);
@@ -0,0 +1,5 @@
+-- Supabase 1 (payments DB).
+-- Scoring reads payment_history_rollups (002) instead of aggregating payment_transactions,
+-- so nothing calls payment_history_summary (001) any more. 001 stays, as databases that
+-- already ran it have it recorded; this drops the function from them and from new ones.
+DROP FUNCTION IF EXISTS payment_history_summary(uuid[]);
@@ -0,0 +1,89 @@
+-- Embedded single-file storage (STORAGE_BACKEND=sqlite).
+-- All five stores' tables in one SQLite database, applied by app.storage.sqlite on open.
+-- Keyed tables are WITHOUT ROWID so a lookup by user_id is a single B-tree search.
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    email TEXT UNIQUE,
+    created_at TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS payment_transactions (
+    transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    loan_or_account_id TEXT,
+    due_date TEXT NOT NULL,
+    payment_date TEXT,
+    amount_due REAL NOT NULL,
+    is_on_time INTEGER,
+    transaction_type TEXT,
+    created_at TEXT NOT NULL,
+    last_updated TEXT NOT NULL
+);
+-- get_payment_transactions_for_user: WHERE user_id = ? ORDER BY due_date
+CREATE INDEX IF NOT EXISTS payment_transactions_user_due ON payment_transactions (user_id, due_date);
+
+-- Same counters as migrations/payments_db/002_payment_history_rollups.sql, kept by row triggers
+CREATE TABLE IF NOT EXISTS payment_history_rollups (
+    user_id TEXT PRIMARY KEY,
+    on_time_payments INTEGER NOT NULL DEFAULT 0,
+    total_due_payments INTEGER NOT NULL DEFAULT 0,
+    last_updated TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS payment_history_rollups_insert
+AFTER INSERT ON payment_transactions
+BEGIN
+    INSERT INTO payment_history_rollups (user_id, on_time_payments, total_due_payments)
+    VALUES (NEW.user_id, COALESCE(NEW.is_on_time, 0), 1)
+    ON CONFLICT (user_id) DO UPDATE
+        SET on_time_payments = on_time_payments + excluded.on_time_payments,
+            total_due_payments = total_due_payments + 1,
+            last_updated = strftime('%Y-%m-%dT%H:%M:%fZ', 'now');
+END;
+
+CREATE TRIGGER IF NOT EXISTS payment_history_rollups_delete
+AFTER DELETE ON payment_transactions
+BEGIN
+    UPDATE payment_history_rollups
+        SET on_time_payments = on_time_payments - COALESCE(OLD.is_on_time, 0),
+            total_due_payments = total_due_payments - 1,
+            last_updated = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+        WHERE user_id = OLD.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS payment_history_rollups_update
+AFTER UPDATE OF user_id, is_on_time ON payment_transactions
+BEGIN
+    UPDATE payment_history_rollups
+        SET on_time_payments = on_time_payments - COALESCE(OLD.is_on_time, 0),
+            total_due_payments = total_due_payments - 1,
+            last_updated = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+        WHERE user_id = OLD.user_id;
+    INSERT INTO payment_history_rollups (user_id, on_time_payments, total_due_payments)
+    VALUES (NEW.user_id, COALESCE(NEW.is_on_time, 0), 1)
+    ON CONFLICT (user_id) DO UPDATE
+        SET on_time_payments = on_time_payments + excluded.on_time_payments,
+            total_due_payments = total_due_payments + 1,
+            last_updated = strftime('%Y-%m-%dT%H:%M:%fZ', 'now');
+END;
+
+CREATE TABLE IF NOT EXISTS history_data (
+    user_id TEXT PRIMARY KEY,
+    account_age_years INTEGER NOT NULL,
+    last_updated TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS debt_records (
+    user_id TEXT PRIMARY KEY,
+    used_credit REAL NOT NULL,
+    credit_limit REAL NOT NULL,
+    last_updated TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS mix_records (
+    user_id TEXT PRIMARY KEY,
+    credit_types_used INTEGER NOT NULL,
+    last_updated TEXT NOT NULL
+) WITHOUT ROWID;
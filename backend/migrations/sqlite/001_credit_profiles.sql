@@ -0,0 +1,22 @@
+-- Same read model as migrations/neon/001_credit_profiles.sql: one row per user with every
+-- scoring input and the last computed score, maintained by crud writes (app.services.credit_profiles).
+-- A regular rowid table: rows carry the components JSON, too wide to gain from WITHOUT ROWID.
+CREATE TABLE IF NOT EXISTS credit_profiles (
+    user_id TEXT PRIMARY KEY,
+    username TEXT,
+    email TEXT,
+    user_created_at TEXT,
+    on_time_payments INTEGER NOT NULL DEFAULT 0,
+    total_due_payments INTEGER NOT NULL DEFAULT 0,
+    used_credit REAL,
+    credit_limit REAL,
+    account_age_years INTEGER,
+    credit_types_used INTEGER,
+    components TEXT, -- JSON list of score components
+    final_unscaled_score REAL,
+    iscore REAL,
+    score_version INTEGER,
+    version INTEGER NOT NULL DEFAULT 0,
+    stale INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL
+);
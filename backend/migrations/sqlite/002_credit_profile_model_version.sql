@@ -0,0 +1,3 @@
+-- Scoring model (app.services.score_models) the stored score was computed with; a profile
+-- whose model isn't the active one is rescored when served. Applied once (PRAGMA user_version).
+ALTER TABLE credit_profiles ADD COLUMN model_version TEXT;
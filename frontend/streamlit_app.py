@@ -2,6 +2,7 @@ import streamlit as st
 import requests
 import uuid
 import os
+import time
 import pandas as pd
 from dotenv import load_dotenv
 import plotly.graph_objects as go
@@ -120,13 +121,19 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-# --- Helper Function for API Calls (no changes needed from previous) ---
+# --- Helper Functions for API Calls ---
+@st.cache_resource
+def get_http_session():
+    # One keep-alive session (and connection pool) per Streamlit process instead of a new connection per call
+    return requests.Session()
+
+
 def make_api_request(method, endpoint, json_data=None, params=None):
-    # ... (same as your last working version) ...
+    session = get_http_session()
     try:
         full_url = f"{API_URL}{endpoint}"
-        if method.upper() == "GET": response = requests.get(full_url, params=params, timeout=10)
-        elif method.upper() == "POST": response = requests.post(full_url, json=json_data, timeout=10)
+        if method.upper() == "GET": response = session.get(full_url, params=params, timeout=10)
+        elif method.upper() == "POST": response = session.post(full_url, json=json_data, timeout=10)
         else: return {"success": False, "status_code": 0, "error": f"Unsupported HTTP method: {method}", "data": None}
         try: response_data = response.json()
         except requests.exceptions.JSONDecodeError: response_data = {"detail": response.text[:200] + "..."} # Truncate if not JSON
@@ -137,6 +144,58 @@ def make_api_request(method, endpoint, json_data=None, params=None):
     except Exception as e: return {"success": False, "status_code": 0, "error": f"Unexpected API call error: {e}", "data": None}
 
 
+class UncachedResult(Exception):
+    # Raised out of the cached function so errors and provisional scores aren't cached
+    def __init__(self, api_result):
+        self.api_result = api_result
+
+
+@st.cache_data(ttl=600, max_entries=1000, show_spinner=False)
+def fetch_iscore_cached(user_id, data_version, model_version):
+    # Both versions are part of the cache key: new data for the user or switching the active scoring model gives a fresh score
+    api_result = make_api_request("GET", f"/iscore/{user_id}")
+    if not api_result["success"] or api_result["data"].get("provisional"):
+        raise UncachedResult(api_result)
+    return api_result
+
+
+def fetch_iscore(user_id):
+    summary = make_api_request("GET", f"/users/{user_id}/exists")
+    data_version = summary["data"].get("data_version") if summary["success"] else None
+    model_version = summary["data"].get("model_version") if summary["success"] else None
+    if data_version is None or model_version is None: # No version to key on (credit profiles off, or the check failed)
+        return make_api_request("GET", f"/iscore/{user_id}")
+    try:
+        return fetch_iscore_cached(user_id, data_version, model_version)
+    except UncachedResult as e:
+        return e.api_result
+
+
+def run_job(endpoint, json_data, label, timeout_seconds=300):
+    # Submits a background job and polls it, with a progress bar, until it finishes
+    api_result = make_api_request("POST", endpoint, json_data=json_data)
+    if not api_result["success"]:
+        return api_result
+    job = api_result["data"]
+    progress_bar = st.progress(0.0, text=label)
+    deadline = time.monotonic() + timeout_seconds
+    while job["status"] in ("queued", "running") and time.monotonic() < deadline:
+        time.sleep(0.5)
+        api_result = make_api_request("GET", f"/jobs/{job['job_id']}")
+        if not api_result["success"]:
+            progress_bar.empty()
+            return api_result
+        job = api_result["data"]
+        if job["progress_total"]:
+            progress_bar.progress(min(job["progress_done"] / job["progress_total"], 1.0), text=f"{label} ({job['status']})")
+    progress_bar.empty()
+    if job["status"] == "succeeded":
+        return {"success": True, "status_code": 200, "data": job, "error": None}
+    if job["status"] == "failed":
+        return {"success": False, "status_code": 200, "error": job["error"], "data": job}
+    return {"success": False, "status_code": 0, "error": f"Job {job['job_id']} is still {job['status']}; check back later.", "data": job}
+
+
 # --- Initialize Session State ---
 if "user_id" not in st.session_state: st.session_state.user_id = ""
 if "username" not in st.session_state: st.session_state.username = ""
@@ -187,14 +246,15 @@ with st.sidebar:
         if user_id_input_sidebar:
             try:
                 uuid.UUID(user_id_input_sidebar)
-                check_user_result = make_api_request("GET", f"/iscore/{user_id_input_sidebar}")
-                if check_user_result["success"] or \
-                   (check_user_result["status_code"] == 404 and "Missing data for factors" in check_user_result["error"]):
+                check_user_result = make_api_request("GET", f"/users/{user_id_input_sidebar}/exists")
+                if check_user_result["success"] and check_user_result["data"]["exists"]:
                     st.session_state.user_id = user_id_input_sidebar
                     st.success(f"✅ Active User: `{user_id_input_sidebar}`")
+                    if check_user_result["data"].get("has_credit_data") is False:
+                        st.info("ℹ️ No credit data yet. Use 'Generate Credit Data'.")
                     st.session_state.last_iscore_data = None 
-                elif check_user_result["status_code"] == 404 and "User not found" in check_user_result["error"]:
-                    st.error(f"❌ User ID '{user_id_input_sidebar}' not found.")
+                elif check_user_result["success"]:
+                    st.error(f"❌ User ID '{user_id_input_sidebar}' not found (yet). If it was only just created, try again in a moment.")
                     st.session_state.user_id = ""
                 else:
                     st.error(f"⚠️ Could not verify User ID: {check_user_result['error']}")
@@ -206,15 +266,14 @@ with st.sidebar:
     if st.session_state.user_id:
         st.success(f"Active: `{st.session_state.user_id[:8]}...`") # Show truncated ID
         if st.button("🔄 Generate Credit Data", key="sidebar_generate_data_button", use_container_width=True):
-            # ... (generate data logic - same as before) ...
-            with st.spinner("🧬 Generating diverse credit data..."):
-                api_result = make_api_request("POST", f"/users/{st.session_state.user_id}/generate-data/")
+            # Runs as a background job on the API, so no request is held open while the stores are written
+            api_result = run_job("/jobs/generate-data", {"user_id": st.session_state.user_id}, "🧬 Generating diverse credit data...")
             if api_result["success"]:
                 st.success("✅ Credit data generated/updated!")
                 st.balloons()
                 st.session_state.last_iscore_data = None
             else: # Error handling (same as before)
-                if api_result["status_code"] == 404: st.error(f"❌ User ID '{st.session_state.user_id}' not found.")
+                if "User not found" in (api_result["error"] or ""): st.error(f"❌ User ID '{st.session_state.user_id}' not found.")
                 else: st.error(f"⚠️ Error generating data: {api_result['error']}")
     else:
         st.info("ℹ️ Register or set User ID to begin.")
@@ -226,7 +285,7 @@ if st.session_state.user_id:
     st.header("🧮 Calculate & View iScore")
     if st.button("✨ Calculate My iScore", type="primary", use_container_width=True, key="main_calculate_iscore_button"):
         with st.spinner("📡 Fetching data & crunching numbers..."):
-            api_result = make_api_request("GET", f"/iscore/{st.session_state.user_id}")
+            api_result = fetch_iscore(st.session_state.user_id)
         if api_result["success"]:
             st.session_state.last_iscore_data = api_result["data"]
         else: # Error handling (same as before)